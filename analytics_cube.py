@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Precomputed POS x method x form x confidence band analytics cube.
+
+The analyses in examples/advanced_analysis.py scan corpus['words'] and
+its nested per-lemma dicts on every run. This module materialises the
+token-level aggregate once, from the token arrays of a poems index:
+
+- tokens and confidence sums as dense arrays over (pos, method, form, band)
+- distinct word form and lemma counts for every group-by of the four
+  dimensions (all 16 cuboids), since distinct counts cannot be rolled up
+  by summing
+- word-level quality tiers and forms-per-word statistics
+
+Bands follow the quality tier thresholds (0.9, 0.7, 0.5); the
+method_analytics high/medium/low bands are roll-ups of them.
+
+Usage:
+    python analytics_cube.py build --poems-index poems_index_v3.json.gz --output analytics_cube.npz
+
+    python analytics_cube.py query --cube analytics_cube.npz --by pos
+    python analytics_cube.py query --cube analytics_cube.npz --by method band --measure tokens
+    python analytics_cube.py query --cube analytics_cube.npz --by form --where method=manual_override \
+        --measure word_types
+
+In Python:
+    cube = AnalyticsCube.load('analytics_cube.npz')
+    cube.rollup(['pos'])                                   # {('S',): tokens, ...}
+    cube.rollup(['form'], where={'pos': 'V'}, measure='lemma_types')
+    cube.avg_confidence(['method'])
+"""
+
+import argparse
+import sys
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+
+from corpus_arrays import load_token_arrays
+from corpus_io import pack_json, unpack_json
+from rebuild_corpus_aggregates import QUALITY_TIERS
+
+
+DIMENSIONS = ('pos', 'method', 'form', 'band')
+BANDS = ('0.9-1.0', '0.7-0.9', '0.5-0.7', '0.0-0.5')
+BAND_THRESHOLDS = [0.5, 0.7, 0.9]
+# method_analytics confidence_distribution bands as unions of cube bands
+METHOD_BANDS = {'high': ('0.9-1.0',), 'medium': ('0.7-0.9', '0.5-0.7'), 'low': ('0.0-0.5',)}
+TYPE_MEASURES = ('word_types', 'lemma_types')
+MEASURES = ('tokens', 'conf_sum') + TYPE_MEASURES
+
+HIGH_FREQUENCY = 100  # Word forms above this count are 'high frequency' in the tier summary
+
+
+def cuboid_name(dims) -> str:
+    return '_'.join(dims) or 'all'
+
+
+class AnalyticsCube:
+    """Dense token and type aggregates with slice and roll-up queries."""
+
+    def __init__(self, labels: dict, tokens: np.ndarray, conf_sum: np.ndarray,
+                 types: dict, summary: dict):
+        self.labels = labels            # dimension -> list of values
+        self.tokens = tokens            # int64 array over DIMENSIONS
+        self.conf_sum = conf_sum        # float64 array over DIMENSIONS
+        self.types = types              # (measure, dims) -> int64 array over dims
+        self.summary = summary          # word tiers, forms per word, totals
+        self._index = {dim: {v: i for i, v in enumerate(values)} for dim, values in labels.items()}
+
+    @classmethod
+    def build(cls, arrays) -> 'AnalyticsCube':
+        """Build from TokenArrays (corpus_arrays.py)."""
+        codes = arrays.codes
+        confidence = arrays.confidence.astype(np.float64)
+        # Confidences are stored as float32: compare against float32 thresholds so 0.9 stays 0.9
+        thresholds = np.asarray(BAND_THRESHOLDS, dtype=np.float32)
+        band = (len(BANDS) - 1 - np.digitize(arrays.confidence, thresholds)).astype(np.int64)
+
+        labels = {
+            'pos': arrays.vocab['pos'],
+            'method': arrays.vocab['method'],
+            'form': arrays.vocab['form'],
+            'band': list(BANDS)
+        }
+        shape = tuple(len(labels[dim]) for dim in DIMENSIONS)
+        dim_codes = [codes['pos'].astype(np.int64), codes['method'].astype(np.int64),
+                     codes['form'].astype(np.int64), band]
+        cell = np.ravel_multi_index(dim_codes, shape)
+        size = int(np.prod(shape))
+
+        tokens = np.bincount(cell, minlength=size).reshape(shape)
+        conf_sum = np.bincount(cell, weights=confidence, minlength=size).reshape(shape)
+
+        types = {}
+        for measure, field in (('word_types', 'word'), ('lemma_types', 'lemma')):
+            num_types = len(arrays.vocab[field])
+            # Distinct (cell, type) pairs once; each cuboid projects these
+            pairs = np.unique(cell * num_types + codes[field])
+            pair_cells = np.unravel_index(pairs // num_types, shape)
+            pair_types = pairs % num_types
+            for k in range(len(DIMENSIONS) + 1):
+                for dims in combinations(range(len(DIMENSIONS)), k):
+                    sub_shape = tuple(shape[d] for d in dims)
+                    sub_cell = (np.ravel_multi_index([pair_cells[d] for d in dims], sub_shape)
+                                if dims else np.zeros(pairs.size, dtype=np.int64))
+                    distinct = np.unique(sub_cell * num_types + pair_types) // num_types
+                    counts = np.bincount(distinct, minlength=int(np.prod(sub_shape)))
+                    types[(measure, tuple(DIMENSIONS[d] for d in dims))] = counts.reshape(sub_shape)
+
+        return cls(labels, tokens, conf_sum, types, word_summary(arrays, confidence))
+
+    def save(self, path: Path):
+        arrays = {
+            'labels': pack_json(self.labels),
+            'summary': pack_json(self.summary),
+            'tokens': self.tokens,
+            'conf_sum': self.conf_sum
+        }
+        for (measure, dims), counts in self.types.items():
+            arrays[f'{measure}__{cuboid_name(dims)}'] = counts
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> 'AnalyticsCube':
+        with np.load(path) as archive:
+            labels = unpack_json(archive['labels'])
+            types = {}
+            for k in range(len(DIMENSIONS) + 1):
+                for dims in combinations(DIMENSIONS, k):
+                    for measure in TYPE_MEASURES:
+                        types[(measure, dims)] = archive[f'{measure}__{cuboid_name(dims)}']
+            return cls(labels, archive['tokens'], archive['conf_sum'], types,
+                       unpack_json(archive['summary']))
+
+    @property
+    def total_tokens(self) -> int:
+        return int(self.tokens.sum())
+
+    def _selection(self, dim: str, values) -> list:
+        if isinstance(values, str):
+            values = [values]
+        unknown = [v for v in values if v not in self._index[dim]]
+        if unknown:
+            raise KeyError(f"unknown {dim} value(s): {', '.join(unknown)}")
+        return [self._index[dim][v] for v in values]
+
+    def rollup(self, by, measure: str = 'tokens', where: dict = None) -> dict:
+        """
+        Aggregate a measure grouped by dimensions, after slicing with where.
+
+        where maps dimensions to a value or a list of values. Type measures
+        (distinct word forms or lemmas) take one value per where dimension.
+        Returns {(value, ...): amount} for non-zero groups, largest first.
+        """
+        by = list(by)
+        where = where or {}
+        for dim in list(by) + list(where):
+            if dim not in DIMENSIONS:
+                raise KeyError(f"unknown dimension '{dim}' (use {', '.join(DIMENSIONS)})")
+        if measure not in MEASURES:
+            raise KeyError(f"unknown measure '{measure}' (use {', '.join(MEASURES)})")
+
+        selections = {dim: self._selection(dim, values) for dim, values in where.items()}
+        if measure in TYPE_MEASURES:
+            multiple = [dim for dim, selection in selections.items() if len(selection) != 1]
+            if multiple:
+                raise ValueError(f"{measure} cannot be summed over several {multiple[0]} values")
+            dims = tuple(d for d in DIMENSIONS if d in by or d in where)
+            data = self.types[(measure, dims)]
+        else:
+            dims = DIMENSIONS
+            data = self.tokens if measure == 'tokens' else self.conf_sum
+
+        # Slice the where dimensions, then sum out everything not grouped by
+        for axis, dim in enumerate(dims):
+            if dim in selections:
+                data = np.take(data, selections[dim], axis=axis)
+        summed = data.sum(axis=tuple(i for i, dim in enumerate(dims) if dim not in by))
+        if not by:
+            return {(): summed.item()}
+        kept = [dim for dim in dims if dim in by]
+        summed = np.transpose(summed, [kept.index(dim) for dim in by])
+
+        labels = [[self.labels[dim][i] for i in selections[dim]] if dim in selections
+                  else self.labels[dim] for dim in by]
+        result = {}
+        for position in zip(*np.nonzero(summed)):
+            result[tuple(labels[k][i] for k, i in enumerate(position))] = summed[position].item()
+        return dict(sorted(result.items(), key=lambda x: -x[1]))
+
+    def avg_confidence(self, by, where: dict = None) -> dict:
+        """Mean token confidence per group."""
+        tokens = self.rollup(by, 'tokens', where)
+        conf_sum = self.rollup(by, 'conf_sum', where)
+        return {key: conf_sum.get(key, 0.0) / count for key, count in tokens.items()}
+
+
+def word_summary(arrays, confidence: np.ndarray) -> dict:
+    """Word-level statistics: quality tiers by average confidence, forms per word."""
+    words = arrays.codes['word'].astype(np.int64)
+    num_words = len(arrays.vocab['word'])
+    counts = np.bincount(words, minlength=num_words)
+    present = counts > 0
+    avg_conf = np.bincount(words, weights=confidence, minlength=num_words)[present] / counts[present]
+    # Round away float32 noise so averages exactly on a threshold land in the higher tier
+    avg_conf = np.round(avg_conf, 6)
+    counts = counts[present]
+
+    tiers = {}
+    remaining = np.ones(avg_conf.size, dtype=bool)
+    for name, threshold in QUALITY_TIERS:
+        in_tier = remaining & (avg_conf >= threshold)
+        remaining &= ~in_tier
+        tiers[name] = {
+            'count': int(in_tier.sum()),
+            'total_freq': int(counts[in_tier].sum()),
+            'high_freq': int((counts[in_tier] > HIGH_FREQUENCY).sum())
+        }
+
+    # Distinct morphological forms per (word form, lemma), ignoring empty forms
+    num_lemmas = len(arrays.vocab['lemma'])
+    pair = words * num_lemmas + arrays.codes['lemma']
+    pairs = np.unique(pair)
+    empty_form = arrays.vocab['form'].index('') if '' in arrays.vocab['form'] else -1
+    has_form = arrays.codes['form'] != empty_form
+    num_forms = len(arrays.vocab['form'])
+    triples = np.unique(pair[has_form] * num_forms + arrays.codes['form'][has_form])
+    forms_per_pair = np.unique(triples // num_forms, return_counts=True)[1]
+
+    return {
+        'total_tokens': int(arrays.num_tokens),
+        'total_poems': int(arrays.num_poems),
+        'word_types': int(present.sum()),
+        'lemma_types': int((np.bincount(arrays.codes['lemma'], minlength=num_lemmas) > 0).sum()),
+        'word_tiers': tiers,
+        'word_lemma_pairs': int(pairs.size),
+        'avg_forms_per_word': float(triples.size / pairs.size) if pairs.size else 0.0,
+        'words_with_multiple_forms': int((forms_per_pair > 1).sum())
+    }
+
+
+def parse_where(items: list) -> dict:
+    where = {}
+    for item in items:
+        if '=' not in item:
+            raise ValueError(f"expected dim=value[|value...], got '{item}'")
+        dim, value = item.split('=', 1)
+        where[dim.strip()] = [v.strip() for v in value.split('|')]
+    return where
+
+
+def run_build(args):
+    arrays = load_token_arrays(args.poems_index)
+    print(f"Building analytics cube from {arrays.num_tokens:,} tokens...")
+    cube = AnalyticsCube.build(arrays)
+    cube.save(args.output)
+    shape = ' x '.join(f"{len(cube.labels[d])} {d}" for d in DIMENSIONS)
+    print(f"✓ Cube {shape}, {len(cube.types)} type cuboids")
+    print(f"Saved: {args.output} ({args.output.stat().st_size / 1024:,.0f} KB)")
+    return 0
+
+
+def run_query(args):
+    cube = AnalyticsCube.load(args.cube)
+    try:
+        where = parse_where(args.where)
+        if args.measure == 'avg_confidence':
+            result = cube.avg_confidence(args.by, where)
+        else:
+            result = cube.rollup(args.by, args.measure, where)
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e.args[0]}", file=sys.stderr)
+        return 1
+
+    total = sum(result.values()) if args.measure in ('tokens', 'conf_sum') else None
+    print(f"{' x '.join(args.by) or 'total'} ({args.measure}"
+          + (f", where {' '.join(args.where)}" if args.where else '') + "):")
+    for key, value in list(result.items())[:args.top]:
+        label = ' | '.join(key) if key else 'all'
+        if isinstance(value, float):
+            print(f"  {label:40s} {value:>12.3f}")
+        else:
+            share = f" ({value / total * 100:5.1f}%)" if total else ''
+            print(f"  {label:40s} {value:>12,}{share}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='POS x method x form x confidence band analytics cube')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build the cube from a poems index or token arrays')
+    build.add_argument('--poems-index', type=Path, default=Path('poems_index_v3.json.gz'),
+                       help='Poems index (v2/v3/v4) or corpus_arrays.npz')
+    build.add_argument('--output', type=Path, default=Path('analytics_cube.npz'),
+                       help='Output cube file (default: analytics_cube.npz)')
+
+    query = subparsers.add_parser('query', help='Slice and roll up the cube')
+    query.add_argument('--cube', type=Path, default=Path('analytics_cube.npz'))
+    query.add_argument('--by', nargs='*', default=[], choices=DIMENSIONS,
+                       help='Dimensions to group by')
+    query.add_argument('--where', action='append', default=[],
+                       help="Slice, e.g. method=manual_override or band='0.9-1.0|0.7-0.9' (repeatable)")
+    query.add_argument('--measure', default='tokens', choices=MEASURES + ('avg_confidence',))
+    query.add_argument('--top', type=int, default=30, help='Rows to print (default: 30)')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        return run_build(args)
+    return run_query(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Apply context-sensitive POS substitution rules to the poem index.
+
+Rules (see substitution_rules.py for the CSV format) are compiled into
+per-lemma dispatch tables and applied to every token in one streaming pass
+over the poem index: each poem is read, rewritten and written out before
+the next (.json/.json.gz or JSONL). The correction count is only known at
+the end, so in JSON output the updated metadata follows the poems. Conflicting rules are reported before anything is applied;
+equal-priority conflicts stop the run unless --allow-conflicts is given
+(the rule listed first then wins).
+
+Optionally the plain (lemma, current_pos) -> correct_pos rows of
+final_substitutions.csv run in the same pass (--substitutions), at a lower
+priority than the context rules.
+
+With --corpus-input, the per-token changes are transferred to the
+pos_tags counts of the aggregate corpus, as apply_substitutions.py does;
+run rebuild_corpus_aggregates.py afterwards to refresh method_analytics
+and morphological_patterns.
+
+Usage:
+    python apply_context_rules.py --rules context_rules.csv \
+        --poems-input poems_index_v3.json.gz --poems-output poems_index_v3_context.json.gz \
+        --report context_rule_hits.csv
+
+    python apply_context_rules.py --rules context_rules.csv --dry-run \
+        --poems-input poems_index_v3.json.gz
+"""
+
+import argparse
+import csv
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import pipeline_metrics
+from pipeline_metrics import stage
+from poem_index_io import PoemIndexReader, PoemIndexWriter, is_jsonl
+from rebuild_corpus_aggregates import load_json, save_json
+from substitution_rules import RuleError, compile_rules, load_rules, rules_from_substitutions
+
+
+def apply_to_poems(poems, ruleset, stats: dict, transfers: dict):
+    """
+    Apply compiled rules to a (poem_id, poem) stream, yielding each poem
+    after rewriting. Counts go into stats, and (word form, lemma) ->
+    Counter of (old_pos, new_pos) into transfers.
+    """
+    stats.update({'total_poems': 0, 'total_words': 0, 'words_changed': 0, 'poems_with_changes': 0})
+    for poem_id, poem in poems:
+        stats['total_poems'] += 1
+        stats['total_words'] += len(poem.get('words', []))
+        changes = ruleset.apply_poem(poem)
+        if changes:
+            stats['poems_with_changes'] += 1
+            stats['words_changed'] += len(changes)
+            for word, old_pos, rule in changes:
+                transfers[(word.get('original', ''), word.get('lemma', ''))][(old_pos, rule.correct_pos)] += 1
+        yield poem_id, poem
+
+
+def stream_poems_index(path: Path, output: Path, ruleset, rule_count: int) -> tuple:
+    """
+    Apply rules to a poems index file poem by poem (output None: count only);
+    returns (stats, pos transfers).
+    """
+    reader = PoemIndexReader(path)
+    writer = None
+    if output is not None:
+        writer = PoemIndexWriter(output)
+        # Metadata needs the final counts, so it is written after the poems
+        writer.begin({key: reader.sections[key] for key in reader.leading_sections
+                      if key != 'metadata'})
+
+    stats = {}
+    transfers = defaultdict(Counter)
+    for poem_id, poem in apply_to_poems(reader.poems(), ruleset, stats, transfers):
+        if writer is not None:
+            writer.write_poem(poem_id, poem)
+
+    if writer is not None:
+        trailing = {key: value for key, value in reader.sections.items()
+                    if key == 'metadata' or key not in reader.leading_sections}
+        trailing['metadata'] = {
+            **trailing.get('metadata', {}),
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'context_rule_corrections': stats['words_changed'],
+            'context_rules': rule_count
+        }
+        writer.end(trailing)
+    return stats, transfers
+
+
+def apply_to_corpus(corpus: dict, transfers: dict) -> dict:
+    """Move pos_tags counts in the aggregate words section."""
+    stats = {'entries_updated': 0, 'pos_counts_updated': 0}
+    words = corpus.get('words', {})
+    for (original, lemma), moves in transfers.items():
+        pos_tags = words.get(original, {}).get('pos_tags', {}).get(lemma)
+        if pos_tags is None:
+            continue
+        for (old_pos, new_pos), count in moves.items():
+            moved = min(count, pos_tags.get(old_pos, 0))
+            if not moved:
+                continue
+            pos_tags[old_pos] -= moved
+            if not pos_tags[old_pos]:
+                del pos_tags[old_pos]
+            pos_tags[new_pos] = pos_tags.get(new_pos, 0) + moved
+            stats['pos_counts_updated'] += moved
+        stats['entries_updated'] += 1
+
+    corpus['metadata']['created'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    corpus['metadata']['context_rule_corrections'] = stats['pos_counts_updated']
+    return stats
+
+
+def write_hit_report(path: Path, ruleset):
+    """Write tokens tested and hits per rule."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rule_id', 'lemma', 'current_pos', 'correct_pos', 'conditions',
+                         'priority', 'tested', 'hits'])
+        for rule in sorted(ruleset.rules, key=lambda r: -ruleset.hits[r.rule_id]):
+            writer.writerow([rule.rule_id, rule.lemma, rule.current_pos, rule.correct_pos,
+                             rule.condition_text, rule.priority,
+                             ruleset.tested[rule.rule_id], ruleset.hits[rule.rule_id]])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Apply context-sensitive POS substitution rules to the poem index'
+    )
+    parser.add_argument('--rules', type=Path, action='append', default=[],
+                        help='Context rules CSV (repeatable)')
+    parser.add_argument('--substitutions', type=Path, default=None,
+                        help='Also apply final_substitutions.csv rows (method=manual_override)')
+    parser.add_argument('--poems-input', type=Path, default=Path('poems_index_v3.json.gz'),
+                        help='Input poems index (v2/v3/v4)')
+    parser.add_argument('--poems-output', type=Path, default=Path('poems_index_v3_context.json.gz'),
+                        help='Output poems index')
+    parser.add_argument('--corpus-input', type=Path, default=None,
+                        help='Aggregate corpus whose pos_tags counts should follow the changes')
+    parser.add_argument('--corpus-output', type=Path, default=None,
+                        help='Output aggregate corpus')
+    parser.add_argument('--report', type=Path, default=Path('context_rule_hits.csv'),
+                        help='Per-rule hit counts CSV (default: context_rule_hits.csv)')
+    parser.add_argument('--allow-conflicts', action='store_true',
+                        help='Apply even if equal-priority rules conflict (first listed wins)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Count changes without writing corpus files')
+    pipeline_metrics.add_arguments(parser)
+
+    args = parser.parse_args()
+    if not args.rules and not args.substitutions:
+        parser.error('give --rules and/or --substitutions')
+    if args.corpus_input and not args.corpus_output and not args.dry_run:
+        parser.error('--corpus-input needs --corpus-output')
+    if is_jsonl(args.poems_output) and not args.dry_run:
+        parser.error('--poems-output must be .json or .json.gz (the metadata follows the poems)')
+    pipeline_metrics.from_args(args, 'apply_context_rules')
+
+    if args.dry_run:
+        print("🔍 DRY RUN MODE - No files will be written\n")
+
+    with stage('compile_rules'):
+        try:
+            rules = []
+            for path in args.rules:
+                print(f"Loading rules from {path}...")
+                rules.extend(load_rules(path))
+            if args.substitutions:
+                print(f"Loading substitutions from {args.substitutions}...")
+                rules.extend(rules_from_substitutions(args.substitutions, start=len(rules)))
+        except RuleError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        ruleset, conflicts, overlaps = compile_rules(rules)
+    print(f"Compiled {len(rules):,} rules for {len(ruleset.dispatch):,} lemmas")
+
+    if overlaps:
+        print(f"  {len(overlaps):,} overlapping rule pairs resolved by priority")
+    if conflicts:
+        print(f"⚠ {len(conflicts):,} conflicting rule pairs (same priority, different targets):")
+        for a, b in conflicts[:20]:
+            print(f"    {a.describe()}\n      vs {b.describe()}")
+        if not args.allow_conflicts:
+            print("Resolve the conflicts (or set priorities), or use --allow-conflicts", file=sys.stderr)
+            return 1
+
+    poems_output = None if args.dry_run else args.poems_output
+    print(f"\nApplying rules to {args.poems_input}"
+          + (f", writing {poems_output}..." if poems_output else " (dry run)..."))
+    with stage('apply') as s:
+        poem_stats, transfers = stream_poems_index(args.poems_input, poems_output, ruleset, len(rules))
+        s.items = poem_stats['total_words']
+
+    corpus = None
+    if args.corpus_input:
+        print(f"Loading {args.corpus_input}...")
+        with stage('load_corpus'):
+            corpus = load_json(args.corpus_input)
+        with stage('apply_corpus'):
+            corpus_stats = apply_to_corpus(corpus, transfers)
+
+    write_hit_report(args.report, ruleset)
+
+    print("\n" + "=" * 60)
+    print("CONTEXT RULE SUMMARY")
+    print("=" * 60)
+    print(f"   Total poems: {poem_stats['total_poems']:,}")
+    print(f"   Total words: {poem_stats['total_words']:,}")
+    print(f"   Poems with changes: {poem_stats['poems_with_changes']:,}")
+    print(f"   Words corrected: {poem_stats['words_changed']:,}")
+    if corpus is not None:
+        print(f"   Aggregate POS counts transferred: {corpus_stats['pos_counts_updated']:,}")
+    print(f"\n🔝 Top 10 rules by hits:")
+    for rule_id, count in ruleset.hits.most_common(10):
+        print(f"   {rule_id}: {count:,} / {ruleset.tested[rule_id]:,} tested")
+    unused = [r.rule_id for r in rules if not ruleset.hits[r.rule_id]]
+    if unused:
+        print(f"\n⚠ {len(unused):,} rules never matched")
+    print(f"\nHit counts: {args.report}")
+
+    if not args.dry_run:
+        print(f"\nSaved: {args.poems_output}")
+        if corpus is not None:
+            print(f"Writing {args.corpus_output}...")
+            with stage('write_corpus'):
+                save_json(corpus, args.corpus_output)
+            print(f"Saved: {args.corpus_output}")
+    else:
+        print("\n💡 Run without --dry-run to apply changes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
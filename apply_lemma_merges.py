@@ -0,0 +1,552 @@
+#!/usr/bin/env python3
+"""
+Apply reviewed lemma merges to the poem index and the aggregate corpus.
+
+Reviewers mark rows of lemma_similarity_pairs.csv with a decision column
+(merge/reject) and optionally a 'canonical' column naming the lemma to
+keep. This script:
+
+1. resolves approved pairs into clusters with union-find, so chains like
+   a~b, b~c become one cluster, and picks one canonical lemma per cluster
+   (a reviewer-pinned canonical, else the most frequent lemma)
+2. reports conflicts: clusters with several pinned canonicals, clusters
+   that join a pair a reviewer rejected (skipped unless --force-rejected)
+   and clusters over --max-cluster-size (skipped)
+3. rewrites token lemmas in the poem index (.json/.json.gz or JSONL) in one
+   streaming pass, one poem in memory at a time
+4. re-keys the aggregate in one pass: lemmas, lemma_counts, methods,
+   confidences, pos_tags and forms of every word form, lemma_index entries
+   and ambiguous_words (forms left with a single lemma are dropped). The
+   aggregate is merged in memory: lemma_index entries of a cluster are
+   combined and the index re-sorted, which needs the whole section.
+5. writes per-merge impact stats (tokens rewritten, poems and word forms
+   affected) to --report
+
+Usage:
+    python apply_lemma_merges.py --merges lemma_similarity_pairs_reviewed.csv \
+        --poems-index poems_index_v3.json.gz --poems-output poems_index_v3_merged.json.gz \
+        --corpus corpus_full_source_poems_v2.json.gz \
+        --corpus-output corpus_full_source_poems_v2_merged.json.gz \
+        --report merge_impact.csv --conflicts merge_conflicts.csv
+
+    # Resolve clusters and report impact without writing corpus files
+    python apply_lemma_merges.py --merges reviewed.csv --poems-index poems_index_v3.json.gz \
+        --corpus corpus_full_source_poems_v2.json.gz --dry-run
+"""
+
+import argparse
+import csv
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import pipeline_metrics
+from pipeline_metrics import stage
+from poem_index_io import PoemIndexReader, PoemIndexWriter
+from rebuild_corpus_aggregates import load_json, save_json, sort_poem_counts
+
+
+ACCEPT_VALUES = {'merge', 'approve', 'approved', 'apply', 'yes', 'y', 'true', '1'}
+REJECT_VALUES = {'reject', 'rejected', 'keep', 'no', 'n', 'false', '0'}
+
+
+class UnionFind:
+    """Disjoint sets of lemmas (union by size, path halving)."""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, item: str) -> str:
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+            return item
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a: str, b: str) -> str:
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+        if self.size[root_a] < self.size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.size[root_a] += self.size[root_b]
+        return root_a
+
+    def groups(self) -> dict:
+        """Map each root to the sorted list of its members."""
+        groups = defaultdict(list)
+        for item in self.parent:
+            groups[self.find(item)].append(item)
+        return {root: sorted(members) for root, members in groups.items()}
+
+
+def load_merge_decisions(path: Path, decision_column: str = 'decision'):
+    """
+    Read reviewed pairs from a CSV with lemma1, lemma2 and a decision column.
+
+    Returns (approved, rejected, pins): approved and rejected are lists of
+    (lemma1, lemma2) pairs; pins maps an approved pair to its 'canonical'
+    value when the reviewer filled one in.
+    """
+    approved, rejected, pins = [], [], {}
+    with open(path, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        if decision_column not in (reader.fieldnames or []):
+            raise ValueError(f"{path} has no '{decision_column}' column "
+                             f"(columns: {', '.join(reader.fieldnames or [])})")
+        for row in reader:
+            decision = (row.get(decision_column) or '').strip().lower()
+            pair = (row['lemma1'], row['lemma2'])
+            if decision in ACCEPT_VALUES:
+                approved.append(pair)
+                canonical = (row.get('canonical') or '').strip()
+                if canonical:
+                    pins[pair] = canonical
+            elif decision in REJECT_VALUES:
+                rejected.append(pair)
+    return approved, rejected, pins
+
+
+def resolve_clusters(approved: list, rejected: list, pins: dict, frequencies: dict,
+                     max_cluster_size: int = 20, force_rejected: bool = False):
+    """
+    Resolve approved pairs into canonical lemmas.
+
+    Args:
+        approved: Approved (lemma1, lemma2) pairs
+        rejected: Rejected pairs; a cluster that joins one through a chain of
+            approvals is skipped
+        pins: Approved pair -> reviewer-chosen canonical lemma
+        frequencies: Lemma -> occurrences, for choosing unpinned canonicals
+        max_cluster_size: Clusters larger than this are skipped
+        force_rejected: Merge clusters that join a rejected pair anyway
+
+    Returns:
+        (mapping, clusters, conflicts): mapping is merged lemma -> canonical;
+        clusters is a list of {'canonical', 'members'}; conflicts is a list of
+        {'type', 'cluster', 'detail'} dicts
+    """
+    uf = UnionFind()
+    for lemma1, lemma2 in approved:
+        uf.union(lemma1, lemma2)
+
+    pinned = defaultdict(set)
+    conflicts = []
+    for (lemma1, lemma2), canonical in pins.items():
+        if canonical not in (lemma1, lemma2):
+            conflicts.append({'type': 'invalid_canonical', 'cluster': f"{lemma1} {lemma2}",
+                              'detail': f"canonical '{canonical}' is not one of the pair"})
+            continue
+        pinned[uf.find(canonical)].add(canonical)
+
+    rejected_by_root = defaultdict(list)
+    for lemma1, lemma2 in rejected:
+        if lemma1 in uf.parent and lemma2 in uf.parent and uf.find(lemma1) == uf.find(lemma2):
+            rejected_by_root[uf.find(lemma1)].append(f"{lemma1}~{lemma2}")
+
+    def rank(lemma):
+        # Most frequent first, then the shorter spelling, then alphabetical
+        return (-frequencies.get(lemma, 0), len(lemma), lemma)
+
+    mapping = {}
+    clusters = []
+    for root, members in uf.groups().items():
+        label = ' '.join(members)
+        if len(members) > max_cluster_size:
+            conflicts.append({'type': 'cluster_too_large', 'cluster': label,
+                              'detail': f"{len(members)} lemmas > {max_cluster_size}; skipped"})
+            continue
+
+        if root in rejected_by_root:
+            action = 'merged (--force-rejected)' if force_rejected else 'skipped'
+            conflicts.append({'type': 'rejected_pair_joined', 'cluster': label,
+                              'detail': f"rejected: {', '.join(rejected_by_root[root])}; {action}"})
+            if not force_rejected:
+                continue
+
+        candidates = pinned.get(root)
+        if candidates and len(candidates) > 1:
+            conflicts.append({'type': 'multiple_canonicals', 'cluster': label,
+                              'detail': f"pinned: {', '.join(sorted(candidates, key=rank))}"})
+        canonical = min(candidates or members, key=rank)
+
+        for lemma in members:
+            if lemma != canonical:
+                mapping[lemma] = canonical
+        clusters.append({'canonical': canonical, 'members': members})
+
+    clusters.sort(key=lambda c: c['canonical'])
+    return mapping, clusters, conflicts
+
+
+def new_impact() -> dict:
+    return {'tokens': Counter(), 'poems': defaultdict(set), 'word_forms': defaultdict(set)}
+
+
+def merge_poems(poems, mapping: dict, impact: dict, stats: dict):
+    """
+    Rewrite token lemmas of a (poem_id, poem) stream, yielding each poem
+    after rewriting; counts of tokens and poems changed go into stats.
+    """
+    stats.update({'total_poems': 0, 'total_words': 0, 'words_changed': 0, 'poems_with_changes': 0})
+    for poem_id, poem in poems:
+        stats['total_poems'] += 1
+        changed = False
+        for word in poem.get('words', []):
+            stats['total_words'] += 1
+            canonical = mapping.get(word.get('lemma'))
+            if canonical is None:
+                continue
+            impact['tokens'][word['lemma']] += 1
+            impact['poems'][word['lemma']].add(poem_id)
+            impact['word_forms'][word['lemma']].add(word.get('original', ''))
+            word['lemma'] = canonical
+            stats['words_changed'] += 1
+            changed = True
+        if changed:
+            stats['poems_with_changes'] += 1
+        yield poem_id, poem
+
+
+def merge_counts(target: dict, source: dict):
+    """Add a {key: count} dict into another."""
+    for key, count in source.items():
+        target[key] = target.get(key, 0) + count
+
+
+def merge_confidences(a: dict, b: dict) -> dict:
+    """Merge {avg, min, max, count} confidence summaries."""
+    count = a['count'] + b['count']
+    return {
+        'avg': (a['avg'] * a['count'] + b['avg'] * b['count']) / count if count else 0.0,
+        'min': min(a['min'], b['min']),
+        'max': max(a['max'], b['max']),
+        'count': count
+    }
+
+
+def merge_word_entry(word_data: dict, mapping: dict) -> bool:
+    """Re-key one 'words' entry; returns True if any lemma was merged."""
+    if not any(lemma in mapping for lemma in word_data.get('lemmas', [])):
+        return False
+
+    lemma_counts = {}
+    methods, confidences, pos_tags, forms = {}, {}, {}, {}
+    for lemma in word_data.get('lemmas', []):
+        canonical = mapping.get(lemma, lemma)
+        lemma_counts[canonical] = lemma_counts.get(canonical, 0) + word_data['lemma_counts'].get(lemma, 0)
+        for section, merged in (('methods', methods), ('pos_tags', pos_tags), ('forms', forms)):
+            if lemma in word_data.get(section, {}):
+                merge_counts(merged.setdefault(canonical, {}), word_data[section][lemma])
+        if lemma in word_data.get('confidences', {}):
+            stats = word_data['confidences'][lemma]
+            confidences[canonical] = (merge_confidences(confidences[canonical], stats)
+                                      if canonical in confidences else dict(stats))
+
+    lemmas = sorted(lemma_counts, key=lambda l: -lemma_counts[l])
+    word_data['lemmas'] = lemmas
+    word_data['lemma_counts'] = {l: lemma_counts[l] for l in lemmas}
+    for section, merged in (('methods', methods), ('pos_tags', pos_tags), ('forms', forms)):
+        if section in word_data:
+            word_data[section] = {l: merged[l] for l in lemmas if l in merged}
+    if 'confidences' in word_data:
+        word_data['confidences'] = {l: confidences[l] for l in lemmas if l in confidences}
+    return True
+
+
+def merge_lemma_entries(entries: list) -> dict:
+    """Merge lemma_index entries of one cluster into a single entry."""
+    distribution = {}
+    source_poems = Counter()
+    for entry in entries:
+        for original, dist in entry.get('form_distribution', {}).items():
+            if original not in distribution:
+                distribution[original] = {'count': dist['count'], 'forms': list(dist.get('forms', [])),
+                                          'confidence_avg': dist.get('confidence_avg', 0.0)}
+                continue
+            merged = distribution[original]
+            count = merged['count'] + dist['count']
+            if count:
+                merged['confidence_avg'] = (merged['confidence_avg'] * merged['count'] +
+                                            dist.get('confidence_avg', 0.0) * dist['count']) / count
+            merged['count'] = count
+            merged['forms'] = sorted(set(merged['forms']) | set(dist.get('forms', [])))
+        source_poems.update(entry.get('source_poems', {}))
+
+    word_forms = []
+    for entry in entries:
+        word_forms.extend(w for w in entry.get('word_forms', []) if w not in word_forms)
+    word_forms.sort(key=lambda w: -distribution.get(w, {}).get('count', 0))
+
+    merged = dict(entries[0])
+    merged['word_forms'] = word_forms
+    merged['total_occurrences'] = sum(e.get('total_occurrences', 0) for e in entries)
+    if any('source_poems' in e for e in entries):
+        merged['source_poems'] = sort_poem_counts(source_poems)
+    merged['form_distribution'] = {w: distribution[w] for w in word_forms if w in distribution}
+    return merged
+
+
+def merge_ambiguous_entry(entry: dict, mapping: dict) -> dict:
+    """Re-key lemma_competition; returns None if only one lemma is left."""
+    competition = {}
+    for lemma, stats in entry.get('lemma_competition', {}).items():
+        canonical = mapping.get(lemma, lemma)
+        if canonical not in competition:
+            competition[canonical] = dict(stats)
+            continue
+        merged = competition[canonical]
+        chosen = merged.get('chosen', 0) + stats.get('chosen', 0)
+        if chosen:
+            merged['confidence_avg'] = (merged.get('confidence_avg', 0.0) * merged.get('chosen', 0) +
+                                        stats.get('confidence_avg', 0.0) * stats.get('chosen', 0)) / chosen
+        merged['chosen'] = chosen
+        merged['rejected'] = merged.get('rejected', 0) + stats.get('rejected', 0)
+
+    if len(competition) < 2:
+        return None
+    alternatives = []
+    for lemma in entry.get('alternatives_seen', []):
+        canonical = mapping.get(lemma, lemma)
+        if canonical not in alternatives:
+            alternatives.append(canonical)
+    entry['lemma_competition'] = competition
+    entry['alternatives_seen'] = alternatives
+    return entry
+
+
+def merge_corpus(corpus: dict, mapping: dict, clusters: list, impact: dict,
+                 collect_impact: bool = False) -> dict:
+    """
+    Re-key the aggregate corpus in place; returns change counts.
+
+    With collect_impact (no poem index given), impact stats are taken from
+    the aggregate's lemma_counts and source_poems instead of the tokens.
+    """
+    stats = {'word_forms_changed': 0, 'lemmas_removed': 0, 'ambiguous_resolved': 0}
+
+    for original, word_data in corpus.get('words', {}).items():
+        if collect_impact:
+            for lemma in word_data.get('lemmas', []):
+                if lemma in mapping:
+                    impact['tokens'][lemma] += word_data['lemma_counts'].get(lemma, 0)
+                    impact['word_forms'][lemma].add(original)
+                    impact['poems'][lemma].update(word_data.get('source_poems', {}))
+        if merge_word_entry(word_data, mapping):
+            stats['word_forms_changed'] += 1
+
+    lemma_index = corpus.get('lemma_index', {})
+    for cluster in clusters:
+        entries = [lemma_index[lemma] for lemma in
+                   [cluster['canonical']] + [m for m in cluster['members'] if m != cluster['canonical']]
+                   if lemma in lemma_index]
+        for lemma in cluster['members']:
+            if lemma != cluster['canonical'] and lemma_index.pop(lemma, None) is not None:
+                stats['lemmas_removed'] += 1
+        if entries:
+            lemma_index[cluster['canonical']] = merge_lemma_entries(entries)
+    corpus['lemma_index'] = {lemma: lemma_index[lemma] for lemma in sorted(lemma_index)}
+
+    ambiguous = corpus.get('ambiguous_words', {})
+    for original in list(ambiguous):
+        entry = ambiguous[original]
+        if not any(lemma in mapping for lemma in entry.get('lemma_competition', {})):
+            continue
+        if merge_ambiguous_entry(entry, mapping) is None:
+            del ambiguous[original]
+            stats['ambiguous_resolved'] += 1
+
+    metadata = corpus.setdefault('metadata', {})
+    metadata['unique_lemmas'] = len(corpus['lemma_index'])
+    metadata['lemma_merges_applied'] = len(mapping)
+    metadata['created'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return stats
+
+
+def lemma_frequencies(corpus: dict = None, poems_index: Path = None) -> Counter:
+    """Lemma occurrences from the aggregate lemma_index, else from a pass over poem tokens."""
+    if corpus is not None and corpus.get('lemma_index'):
+        return Counter({l: e.get('total_occurrences', 0) for l, e in corpus['lemma_index'].items()})
+    counts = Counter()
+    if poems_index is None:
+        return counts
+    for _, poem in PoemIndexReader(poems_index).poems():
+        counts.update(w.get('lemma') for w in poem.get('words', []))
+    return counts
+
+
+def merged_output_path(path: Path) -> Path:
+    """<name>_merged with the same (possibly double) suffix."""
+    name = path.name
+    for suffix in ('.jsonl.gz', '.json.gz', '.jsonl', '.json'):
+        if name.endswith(suffix):
+            return path.with_name(f"{name[:-len(suffix)]}_merged{suffix}")
+    return path.with_name(f"{path.stem}_merged{path.suffix}")
+
+
+def stream_merge_poems_index(path: Path, output: Path, mapping: dict, impact: dict) -> dict:
+    """Rewrite a poems index file poem by poem (output None: count only)."""
+    reader = PoemIndexReader(path)
+    writer = None
+    if output is not None:
+        writer = PoemIndexWriter(output)
+        leading = {key: reader.sections[key] for key in reader.leading_sections}
+        if 'metadata' in leading:
+            leading['metadata'] = {**leading['metadata'], 'lemma_merges_applied': len(mapping)}
+        writer.begin(leading)
+
+    stats = {}
+    for poem_id, poem in merge_poems(reader.poems(), mapping, impact, stats):
+        if writer is not None:
+            writer.write_poem(poem_id, poem)
+
+    if writer is not None:
+        trailing = {key: value for key, value in reader.sections.items()
+                    if key not in reader.leading_sections}
+        if 'metadata' in trailing:
+            trailing['metadata'] = {**trailing['metadata'], 'lemma_merges_applied': len(mapping)}
+        writer.end(trailing)
+    return stats
+
+
+def write_impact_report(path: Path, clusters: list, impact: dict, frequencies: dict):
+    """Write one row per merged lemma with its impact on the corpus."""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['canonical', 'merged_lemma', 'cluster_size', 'tokens_rewritten',
+                         'poems_affected', 'word_forms_affected',
+                         'canonical_occurrences_before', 'canonical_occurrences_after'])
+        for cluster in clusters:
+            canonical = cluster['canonical']
+            merged = [m for m in cluster['members'] if m != canonical]
+            after = frequencies.get(canonical, 0) + sum(frequencies.get(m, 0) for m in merged)
+            for lemma in sorted(merged, key=lambda m: -impact['tokens'][m]):
+                writer.writerow([canonical, lemma, len(cluster['members']), impact['tokens'][lemma],
+                                 len(impact['poems'][lemma]), len(impact['word_forms'][lemma]),
+                                 frequencies.get(canonical, 0), after])
+
+
+def write_conflicts(path: Path, conflicts: list):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=['type', 'cluster', 'detail'])
+        writer.writeheader()
+        writer.writerows(conflicts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Apply reviewed lemma merges to the poem index and aggregate corpus'
+    )
+    parser.add_argument('--merges', type=Path, required=True,
+                        help='Reviewed pairs CSV (lemma1, lemma2, decision[, canonical])')
+    parser.add_argument('--decision-column', default='decision',
+                        help="Column with merge/reject decisions (default: decision)")
+    parser.add_argument('--poems-index', type=Path, default=None,
+                        help='Input poems index (v2/v3/v4)')
+    parser.add_argument('--poems-output', type=Path, default=None,
+                        help='Output poems index (default: <input>_merged)')
+    parser.add_argument('--corpus', type=Path, default=None,
+                        help='Input aggregate corpus')
+    parser.add_argument('--corpus-output', type=Path, default=None,
+                        help='Output aggregate corpus (default: <input>_merged)')
+    parser.add_argument('--max-cluster-size', type=int, default=20,
+                        help='Skip clusters with more lemmas than this (default: 20)')
+    parser.add_argument('--force-rejected', action='store_true',
+                        help='Merge clusters that join a rejected pair through approved chains '
+                             '(default: skip them)')
+    parser.add_argument('--report', type=Path, default=Path('lemma_merge_impact.csv'),
+                        help='Per-merge impact CSV (default: lemma_merge_impact.csv)')
+    parser.add_argument('--conflicts', type=Path, default=Path('lemma_merge_conflicts.csv'),
+                        help='Conflicts CSV (default: lemma_merge_conflicts.csv)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Resolve merges and write the reports, but not the corpus files')
+    pipeline_metrics.add_arguments(parser)
+
+    args = parser.parse_args()
+    if not args.poems_index and not args.corpus:
+        parser.error('give --poems-index, --corpus or both')
+    pipeline_metrics.from_args(args, 'apply_lemma_merges')
+
+    if args.dry_run:
+        print("🔍 DRY RUN MODE - No corpus files will be written\n")
+
+    print(f"Loading merge decisions from {args.merges}...")
+    try:
+        approved, rejected, pins = load_merge_decisions(args.merges, args.decision_column)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"  {len(approved):,} approved, {len(rejected):,} rejected, {len(pins):,} pinned canonicals")
+
+    corpus = None
+    if args.corpus:
+        print(f"Loading corpus from {args.corpus}...")
+        with stage('load_corpus'):
+            corpus = load_json(args.corpus)
+
+    with stage('resolve', items=len(approved)):
+        if args.poems_index and (corpus is None or not corpus.get('lemma_index')):
+            print(f"Counting lemmas in {args.poems_index}...")
+        frequencies = lemma_frequencies(corpus, args.poems_index)
+        mapping, clusters, conflicts = resolve_clusters(approved, rejected, pins, frequencies,
+                                                        args.max_cluster_size, args.force_rejected)
+    print(f"✓ {len(clusters):,} clusters, {len(mapping):,} lemmas merged into canonicals")
+    if conflicts:
+        print(f"⚠ {len(conflicts):,} conflicts:")
+        for conflict_type, count in Counter(c['type'] for c in conflicts).most_common():
+            print(f"    {conflict_type}: {count:,}")
+
+    impact = new_impact()
+    if args.poems_index:
+        poems_output = None
+        if not args.dry_run:
+            poems_output = args.poems_output or merged_output_path(args.poems_index)
+        print(f"Rewriting poem index lemmas from {args.poems_index}"
+              + (f" into {poems_output}..." if poems_output else " (dry run)..."))
+        with stage('merge_poems_index') as s:
+            poem_stats = stream_merge_poems_index(args.poems_index, poems_output, mapping, impact)
+            s.items = poem_stats['total_words']
+        print(f"  Tokens rewritten: {poem_stats['words_changed']:,} "
+              f"in {poem_stats['poems_with_changes']:,} poems")
+        if poems_output:
+            print(f"Saved: {poems_output}")
+
+    if corpus is not None:
+        print("Re-keying aggregate corpus...")
+        with stage('merge_corpus') as s:
+            corpus_stats = merge_corpus(corpus, mapping, clusters, impact,
+                                        collect_impact=not args.poems_index)
+            s.items = len(corpus.get('words', {}))
+        print(f"  Word forms re-keyed: {corpus_stats['word_forms_changed']:,}")
+        print(f"  Lemma entries removed: {corpus_stats['lemmas_removed']:,}")
+        print(f"  Ambiguous forms resolved: {corpus_stats['ambiguous_resolved']:,}")
+
+    write_impact_report(args.report, clusters, impact, frequencies)
+    write_conflicts(args.conflicts, conflicts)
+    print(f"Saved: {args.report}, {args.conflicts}")
+
+    print("\nTop 10 merges by tokens rewritten:")
+    for lemma, count in impact['tokens'].most_common(10):
+        print(f"   {lemma} → {mapping[lemma]}: {count:,}")
+
+    if not args.dry_run:
+        if corpus is not None:
+            out = args.corpus_output or merged_output_path(args.corpus)
+            print(f"Writing {out}...")
+            with stage('save'):
+                save_json(corpus, out)
+            print(f"Saved: {out}")
+    else:
+        print("\n💡 Run without --dry-run to apply changes")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,6 +12,7 @@ analysis of 214 substitution combinations with 5 verse examples each.
 Usage:
     python apply_substitutions.py
     python apply_substitutions.py --dry-run  # Preview changes without writing
+    python apply_substitutions.py --cube substitution_cube.npz  # Instant estimate (see substitution_impact.py)
 
 Author: Claude (with human review)
 Date: 2025-12-16
@@ -20,10 +21,14 @@ Date: 2025-12-16
 import json
 import csv
 import argparse
+import time
 from pathlib import Path
 from collections import defaultdict
 from datetime import datetime
 
+import pipeline_metrics
+from pipeline_metrics import stage
+
 def load_substitutions(filepath: str) -> dict:
     """Load substitutions from CSV into lookup dictionary.
 
@@ -57,8 +62,9 @@ def apply_to_poems_index(input_path: str, output_path: str,
         Statistics about changes made
     """
     print(f"Loading {input_path}...")
-    with open(input_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with stage('load'):
+        with open(input_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
 
     stats = {
         'total_poems': 0,
@@ -70,33 +76,35 @@ def apply_to_poems_index(input_path: str, output_path: str,
     }
 
     print("Applying substitutions to poems...")
-    for poem_id, poem in data['poems'].items():
-        stats['total_poems'] += 1
-        poem_changed = False
+    with stage('apply') as s:
+        for poem_id, poem in data['poems'].items():
+            stats['total_poems'] += 1
+            poem_changed = False
 
-        for word in poem.get('words', []):
-            stats['total_words'] += 1
+            for word in poem.get('words', []):
+                stats['total_words'] += 1
 
-            # Only modify manual_override entries
-            if word.get('method') != 'manual_override':
-                continue
+                # Only modify manual_override entries
+                if word.get('method') != 'manual_override':
+                    continue
 
-            stats['manual_override_words'] += 1
+                stats['manual_override_words'] += 1
 
-            lemma = word.get('lemma', '').lower()
-            current_pos = word.get('pos', '')
-            key = (lemma, current_pos)
+                lemma = word.get('lemma', '').lower()
+                current_pos = word.get('pos', '')
+                key = (lemma, current_pos)
 
-            if key in substitutions:
-                correct_pos = substitutions[key]['correct_pos']
-                if current_pos != correct_pos:
-                    word['pos'] = correct_pos
-                    stats['words_changed'] += 1
-                    stats['changes_by_substitution'][f"{lemma}|{current_pos}→{correct_pos}"] += 1
-                    poem_changed = True
+                if key in substitutions:
+                    correct_pos = substitutions[key]['correct_pos']
+                    if current_pos != correct_pos:
+                        word['pos'] = correct_pos
+                        stats['words_changed'] += 1
+                        stats['changes_by_substitution'][f"{lemma}|{current_pos}→{correct_pos}"] += 1
+                        poem_changed = True
 
-        if poem_changed:
-            stats['poems_with_changes'] += 1
+            if poem_changed:
+                stats['poems_with_changes'] += 1
+        s.items = stats['total_words']
 
     # Update metadata
     data['metadata']['version'] = 'v3'
@@ -107,8 +115,9 @@ def apply_to_poems_index(input_path: str, output_path: str,
 
     if not dry_run:
         print(f"Writing {output_path}...")
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with stage('write'):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
         print(f"Saved: {output_path}")
 
     return stats
@@ -132,8 +141,9 @@ def apply_to_corpus(input_path: str, output_path: str,
         Statistics about changes made
     """
     print(f"Loading {input_path}...")
-    with open(input_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with stage('load'):
+        with open(input_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
 
     stats = {
         'total_words': 0,
@@ -147,23 +157,25 @@ def apply_to_corpus(input_path: str, output_path: str,
         lemma_subs[lemma].append((current_pos, sub_info['correct_pos']))
 
     print("Applying substitutions to corpus...")
-    for word_form, word_data in data['words'].items():
-        stats['total_words'] += 1
+    with stage('apply') as s:
+        for word_form, word_data in data['words'].items():
+            stats['total_words'] += 1
 
-        # Check each lemma for this word form
-        for lemma in word_data.get('lemmas', []):
-            lemma_lower = lemma.lower()
+            # Check each lemma for this word form
+            for lemma in word_data.get('lemmas', []):
+                lemma_lower = lemma.lower()
 
-            if lemma_lower in lemma_subs:
-                # This lemma has substitutions
-                pos_tags = word_data.get('pos_tags', {}).get(lemma, {})
+                if lemma_lower in lemma_subs:
+                    # This lemma has substitutions
+                    pos_tags = word_data.get('pos_tags', {}).get(lemma, {})
 
-                for current_pos, correct_pos in lemma_subs[lemma_lower]:
-                    if current_pos in pos_tags:
-                        count = pos_tags.pop(current_pos)
-                        pos_tags[correct_pos] = pos_tags.get(correct_pos, 0) + count
-                        stats['pos_counts_updated'] += count
-                        stats['lemmas_changed'] += 1
+                    for current_pos, correct_pos in lemma_subs[lemma_lower]:
+                        if current_pos in pos_tags:
+                            count = pos_tags.pop(current_pos)
+                            pos_tags[correct_pos] = pos_tags.get(correct_pos, 0) + count
+                            stats['pos_counts_updated'] += count
+                            stats['lemmas_changed'] += 1
+        s.items = stats['total_words']
 
     # Update metadata
     data['metadata']['version'] = 'v7_pos_corrected'
@@ -172,8 +184,9 @@ def apply_to_corpus(input_path: str, output_path: str,
 
     if not dry_run:
         print(f"Writing {output_path}...")
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with stage('write'):
+            with open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
         print(f"Saved: {output_path}")
 
     return stats
@@ -208,6 +221,24 @@ def print_stats(poems_stats: dict, corpus_stats: dict):
     print("\n" + "=" * 60)
 
 
+def estimate_from_cube(args):
+    """Dry run answered from a precomputed substitution cube."""
+    # Deferred: the cube needs NumPy, plain apply and --dry-run runs only need the stdlib
+    from substitution_impact import SubstitutionCube, load_substitution_selectors, print_estimate
+
+    print("🔍 DRY RUN MODE (cube estimate) - No files will be read or written\n")
+    with stage('load_cube'):
+        cube = SubstitutionCube.load(args.cube)
+        selectors = load_substitution_selectors(args.substitutions)
+    print(f"Loaded {len(selectors)} substitution rules, cube with {cube.total_tokens:,} tokens")
+
+    with stage('estimate', items=len(selectors)):
+        started = time.perf_counter()
+        result = cube.estimate(selectors, per_rule=True, top_poems=args.top_poems)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    print_estimate(result, cube.total_tokens, elapsed_ms)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Apply POS substitutions to corpus files'
@@ -224,32 +255,47 @@ def main():
                        help='Input corpus file')
     parser.add_argument('--corpus-output', default='corpus_full_source_poems_v2.json',
                        help='Output corpus file')
+    parser.add_argument('--cube', default=None,
+                       help='Estimate token and poem changes from a substitution_impact.py cube '
+                            'instead of loading the corpus files (implies --dry-run)')
+    parser.add_argument('--top-poems', type=int, default=10,
+                       help='With --cube: list the N most affected poems (default: 10)')
+    pipeline_metrics.add_arguments(parser)
 
     args = parser.parse_args()
+    pipeline_metrics.from_args(args, 'apply_substitutions')
+
+    if args.cube:
+        return estimate_from_cube(args)
 
     if args.dry_run:
         print("🔍 DRY RUN MODE - No files will be written\n")
 
     # Load substitutions
     print(f"Loading substitutions from {args.substitutions}...")
-    substitutions = load_substitutions(args.substitutions)
+    with stage('load_substitutions'):
+        substitutions = load_substitutions(args.substitutions)
     print(f"Loaded {len(substitutions)} substitution rules\n")
 
     # Apply to poems index
-    poems_stats = apply_to_poems_index(
-        args.poems_input,
-        args.poems_output,
-        substitutions,
-        args.dry_run
-    )
+    with stage('poems_index') as s:
+        poems_stats = apply_to_poems_index(
+            args.poems_input,
+            args.poems_output,
+            substitutions,
+            args.dry_run
+        )
+        s.items = poems_stats['total_words']
 
     # Apply to corpus
-    corpus_stats = apply_to_corpus(
-        args.corpus_input,
-        args.corpus_output,
-        substitutions,
-        args.dry_run
-    )
+    with stage('corpus') as s:
+        corpus_stats = apply_to_corpus(
+            args.corpus_input,
+            args.corpus_output,
+            substitutions,
+            args.dry_run
+        )
+        s.items = corpus_stats['total_words']
 
     # Print summary
     print_stats(poems_stats, corpus_stats)
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the corpus pipeline.
+
+Times the main pipeline stages on a synthetic corpus (synthetic_corpus.py):
+
+- load                     load_csv_data + load_poems_index
+- build_poems_index_v2     merge CSV and v1 annotations into the v2 index
+- run_verification         v2 verification suite
+- apply_substitutions      apply_to_poems_index + apply_to_corpus
+- lemma_overview           generate_lemma_overview_v2.generate_csv
+- lemma_similarity_pairs   generate_lemma_similarity_pairs.generate_csv
+- wordform_review          build_context_mapping + generate_wordform_review_csv.generate_csv
+
+Each stage runs in a forked child process, so peak RSS is per stage and
+no stage sees another stage's mutations. Inputs a stage needs are
+prepared in the parent before forking and are not timed. For every stage
+the harness records wall time, CPU time, throughput (items per second),
+peak RSS and RSS growth over the inherited inputs.
+
+Results are written as JSON. A previous results file can be given as a
+baseline; stages slower than the threshold are reported as regressions
+and the exit code is 1.
+
+Usage:
+    # Generate a 1% corpus (if needed) and run all stages
+    python run_benchmarks.py --scale 0.01 --data-dir data_1pct --output results_1pct.json
+
+    # Compare against a stored baseline
+    python run_benchmarks.py --data-dir data_1pct --baseline baseline_1pct.json
+
+    # Only some stages, repeated three times (minimum wall time is kept)
+    python run_benchmarks.py --data-dir data_1pct --stages load build_poems_index_v2 --repeat 3
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_DIR.parent))
+
+import apply_substitutions
+import generate_lemma_overview_v2
+import generate_lemma_similarity_pairs
+import generate_poem_index_v2
+import generate_wordform_review_csv
+from pipeline_metrics import current_rss_mb, peak_rss_mb
+from synthetic_corpus import generate_corpus
+
+
+def write_plain_json(data: dict, path: Path):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data, ensure_ascii=False))
+
+
+class BenchmarkContext:
+    """Lazily prepared stage inputs (prepared in the parent, inherited by children)."""
+
+    def __init__(self, data_dir: Path, work_dir: Path, manifest: dict, top_n: int):
+        self.data_dir = data_dir
+        self.work_dir = work_dir
+        self.manifest = manifest
+        self.top_n = top_n
+        self.files = {name: data_dir / filename for name, filename in manifest['files'].items()}
+        self._cache = {}
+
+    def _get(self, name: str, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def csv_data(self) -> dict:
+        return self._get('csv_data', lambda: generate_poem_index_v2.load_csv_data(self.files['csv']))
+
+    @property
+    def poems_index(self) -> dict:
+        return self._get('poems_index',
+                         lambda: generate_poem_index_v2.load_poems_index(self.files['poems_index']))
+
+    @property
+    def index_v2(self) -> dict:
+        return self._get('index_v2', lambda: generate_poem_index_v2.build_poems_index_v2(
+            self.csv_data, self.poems_index)[0])
+
+    @property
+    def corpus(self) -> dict:
+        def load():
+            with gzip.open(self.files['corpus'], 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        return self._get('corpus', load)
+
+    @property
+    def substitutions(self) -> dict:
+        return self._get('substitutions',
+                         lambda: apply_substitutions.load_substitutions(self.files['substitutions']))
+
+    @property
+    def index_v2_json(self) -> Path:
+        """The v2 index as plain JSON (apply_substitutions reads uncompressed files)."""
+        def write():
+            path = self.work_dir / 'poems_index_v2.json'
+            write_plain_json(self.index_v2, path)
+            return path
+        return self._get('index_v2_json', write)
+
+    @property
+    def corpus_json(self) -> Path:
+        def write():
+            path = self.work_dir / 'corpus.json'
+            write_plain_json(self.corpus, path)
+            return path
+        return self._get('corpus_json', write)
+
+
+def stage_load(ctx):
+    generate_poem_index_v2.load_csv_data(ctx.files['csv'])
+    poems_index = generate_poem_index_v2.load_poems_index(ctx.files['poems_index'])
+    return len(poems_index['poems'])
+
+
+def stage_build_poems_index_v2(ctx):
+    index_v2, _, _ = generate_poem_index_v2.build_poems_index_v2(ctx.csv_data, ctx.poems_index)
+    return len(index_v2['poems'])
+
+
+def stage_run_verification(ctx):
+    generate_poem_index_v2.run_verification(ctx.index_v2, ctx.csv_data, ctx.poems_index['poems'])
+    return len(ctx.index_v2['poems'])
+
+
+def stage_apply_substitutions(ctx):
+    poems_stats = apply_substitutions.apply_to_poems_index(
+        str(ctx.index_v2_json), str(ctx.work_dir / 'poems_index_v3.json'), ctx.substitutions)
+    apply_substitutions.apply_to_corpus(
+        str(ctx.corpus_json), str(ctx.work_dir / 'corpus_v2.json'), ctx.substitutions)
+    return poems_stats['total_words']
+
+
+def stage_lemma_overview(ctx):
+    generate_lemma_overview_v2.generate_csv(ctx.corpus, ctx.work_dir / 'lemma_overview.csv')
+    return len(ctx.corpus['lemma_index'])
+
+
+def stage_lemma_similarity_pairs(ctx):
+    generate_lemma_similarity_pairs.generate_csv(ctx.corpus, ctx.work_dir / 'lemma_similarity_pairs.csv')
+    return len(ctx.corpus['lemma_index'])
+
+
+def stage_wordform_review(ctx):
+    poems = ctx.poems_index
+    context_map = generate_wordform_review_csv.build_context_mapping(poems)
+    generate_wordform_review_csv.generate_csv(ctx.corpus, poems, context_map, ctx.top_n,
+                                              ctx.work_dir / 'wordform_review.csv')
+    return min(ctx.top_n, len(ctx.corpus['words']))
+
+
+# name -> (function, inputs prepared in the parent, throughput unit)
+STAGES = {
+    'load': (stage_load, [], 'poems'),
+    'build_poems_index_v2': (stage_build_poems_index_v2, ['csv_data', 'poems_index'], 'poems'),
+    'run_verification': (stage_run_verification, ['csv_data', 'poems_index', 'index_v2'], 'poems'),
+    'apply_substitutions': (stage_apply_substitutions, ['substitutions', 'index_v2_json', 'corpus_json'], 'words'),
+    'lemma_overview': (stage_lemma_overview, ['corpus'], 'lemmas'),
+    'lemma_similarity_pairs': (stage_lemma_similarity_pairs, ['corpus'], 'lemmas'),
+    'wordform_review': (stage_wordform_review, ['corpus', 'poems_index'], 'word forms')
+}
+
+
+def measure_stage(name: str, ctx: BenchmarkContext, verbose: bool) -> dict:
+    """Run one stage in the current process and measure it."""
+    func, _, unit = STAGES[name]
+    rss_start = current_rss_mb()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    with output:
+        items = func(ctx)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    peak = peak_rss_mb()
+    return {
+        'wall_s': round(wall, 4),
+        'cpu_s': round(cpu, 4),
+        'items': items,
+        'unit': unit,
+        'items_per_s': round(items / wall, 1) if wall > 0 else None,
+        'peak_rss_mb': round(peak, 1),
+        'rss_growth_mb': round(peak - rss_start, 1) if rss_start is not None else None
+    }
+
+
+def _child(name, ctx, verbose, conn):
+    try:
+        conn.send(measure_stage(name, ctx, verbose))
+    except BaseException as e:  # Stages may call sys.exit()
+        conn.send({'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()})
+    finally:
+        conn.close()
+
+
+def run_stage(name: str, ctx: BenchmarkContext, verbose: bool, timeout: float) -> dict:
+    """Run one stage in a forked child (in-process where fork is unavailable)."""
+    for attribute in STAGES[name][1]:
+        getattr(ctx, attribute)
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        try:
+            return measure_stage(name, ctx, verbose)
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+
+    mp = multiprocessing.get_context('fork')
+    parent_conn, child_conn = mp.Pipe(duplex=False)
+    process = mp.Process(target=_child, args=(name, ctx, verbose, child_conn))
+    process.start()
+    child_conn.close()
+
+    if parent_conn.poll(timeout):
+        result = parent_conn.recv()
+    else:
+        process.terminate()
+        result = {'error': f'timeout after {timeout:g}s'}
+    process.join()
+    return result
+
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compare stage wall times with a baseline results file.
+
+    Returns:
+        list of (stage, baseline_wall, wall, ratio) for regressed stages
+    """
+    regressions = []
+    for name, stage in results['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if not base or 'wall_s' not in base or 'wall_s' not in stage:
+            continue
+        ratio = stage['wall_s'] / base['wall_s'] if base['wall_s'] > 0 else float('inf')
+        stage['baseline_wall_s'] = base['wall_s']
+        stage['vs_baseline'] = round(ratio, 3)
+        if ratio > threshold:
+            regressions.append((name, base['wall_s'], stage['wall_s'], ratio))
+    return regressions
+
+
+def print_table(results: dict):
+    print("\n" + "=" * 92)
+    print(f"{'Stage':<24} {'Wall (s)':>10} {'CPU (s)':>10} {'Throughput':>22} "
+          f"{'Peak RSS':>10} {'Growth':>8} {'vs base':>8}")
+    print("-" * 92)
+    for name, stage in results['stages'].items():
+        if 'error' in stage:
+            print(f"{name:<24} ✗ {stage['error']}")
+            continue
+        throughput = f"{stage['items_per_s']:,.0f} {stage['unit']}/s" if stage['items_per_s'] else '-'
+        growth = f"{stage['rss_growth_mb']:.0f} MB" if stage['rss_growth_mb'] is not None else '-'
+        versus = f"{stage['vs_baseline']:.2f}x" if 'vs_baseline' in stage else ''
+        print(f"{name:<24} {stage['wall_s']:>10.3f} {stage['cpu_s']:>10.3f} {throughput:>22} "
+              f"{stage['peak_rss_mb']:>7.0f} MB {growth:>8} {versus:>8}")
+    print("=" * 92)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the corpus pipeline on a synthetic corpus')
+    parser.add_argument('--data-dir', type=Path, default=Path('data_synthetic'),
+                        help='Synthetic corpus directory (generated if it has no manifest.json)')
+    parser.add_argument('--scale', type=float, default=0.01,
+                        help='Scale used when generating the corpus (default: 0.01)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed used when generating the corpus')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES),
+                        help='Stages to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Runs per stage; the fastest run is kept (default: 1)')
+    parser.add_argument('--timeout', type=float, default=3600,
+                        help='Per-stage timeout in seconds (default: 3600)')
+    parser.add_argument('--top-n', type=int, default=20000,
+                        help='Word forms for the wordform review stage (default: 20000)')
+    parser.add_argument('--output', type=Path, default=None,
+                        help='Results JSON (default: <data-dir>/benchmark_results.json)')
+    parser.add_argument('--baseline', type=Path, default=None,
+                        help='Previous results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Wall time ratio over baseline counted as a regression (default: 1.2)')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of each stage')
+
+    args = parser.parse_args()
+
+    manifest_path = args.data_dir / 'manifest.json'
+    if not manifest_path.exists():
+        print(f"No synthetic corpus in {args.data_dir}, generating (scale {args.scale:g})...\n")
+        generate_corpus(args.scale, args.data_dir, args.seed, workers=os.cpu_count())
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    print(f"\nBenchmarking on {manifest['num_poems']:,} poems, {manifest['num_words']:,} words "
+          f"(scale {manifest['scale']:g})")
+
+    results = {
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'corpus': {key: manifest[key] for key in ('scale', 'seed', 'num_poems', 'num_words',
+                                                  'num_lemmas', 'num_word_forms')},
+        'repeat': args.repeat,
+        'stages': {}
+    }
+
+    with tempfile.TemporaryDirectory(prefix='corpus_bench_') as work_dir:
+        ctx = BenchmarkContext(args.data_dir, Path(work_dir), manifest, args.top_n)
+        for name in args.stages:
+            print(f"  Running {name}...")
+            runs = [run_stage(name, ctx, args.verbose, args.timeout) for _ in range(args.repeat)]
+            ok = [r for r in runs if 'error' not in r]
+            if not ok:
+                results['stages'][name] = runs[0]
+                print(f"  ✗ {name}: {runs[0]['error']}")
+                continue
+            best = dict(min(ok, key=lambda r: r['wall_s']))
+            best['peak_rss_mb'] = max(r['peak_rss_mb'] for r in ok)
+            results['stages'][name] = best
+            print(f"  ✓ {name}: {best['wall_s']:.3f}s")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('corpus', {}).get('num_poems') != manifest['num_poems']:
+            print(f"⚠ Baseline was measured on a different corpus size")
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+
+    print_table(results)
+
+    output = args.output or args.data_dir / 'benchmark_results.json'
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n✓ Results saved to {output}")
+
+    if regressions:
+        print(f"\n⚠ {len(regressions)} stages slower than {args.threshold:g}x baseline:")
+        for name, base, wall, ratio in regressions:
+            print(f"  {name}: {base:.3f}s → {wall:.3f}s ({ratio:.2f}x)")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Synthetic corpus generator matching the real input schemas.
+
+Produces schema-faithful stand-ins for the inputs that are not in the
+repository, at a fraction of the full corpus size:
+
+- koik_regilaulud_synthetic.csv   source CSV (p_id, poemText with " / " verse
+                                  markers, poemTitle, collection, placeNames, ...)
+- poems_index.json.gz             v1 poem index (words with lemma/pos/form/method/confidence)
+- corpus_synthetic.json.gz        aggregate corpus (words, lemma_index, ambiguous_words, ...)
+                                  rebuilt from the v1 index with rebuild_corpus_aggregates
+- substitutions_synthetic.csv     POS substitutions in final_substitutions.csv format
+
+Distributions are tuned to the published corpus statistics:
+
+- 108,969 poems at scale 1.0, ~18 verses per poem, ~3.7 words per verse
+  (~67 words per poem), 0.8% empty poems
+- Zipfian lemma frequencies (exponent 1.0); lemma vocabulary follows
+  Heaps' law from 102,361 lemmas at full scale
+- Zipfian choice of inflected form per lemma, with orthographic variants
+  (w/v, doubled vowels, h-dropping) giving several word forms per lemma
+- Method and confidence mix from the v7/v8 method distribution table
+
+Output is deterministic for a given --seed and --scale.
+
+Usage:
+    python synthetic_corpus.py --scale 0.01 --output-dir data_1pct
+    python synthetic_corpus.py --scale 1.0 --output-dir data_100pct --workers 8
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import random
+import sys
+from bisect import bisect
+from datetime import datetime
+from itertools import accumulate
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rebuild_corpus_aggregates import rebuild_aggregates
+
+
+FULL_POEMS = 108969
+FULL_LEMMAS = 102361
+HEAPS_BETA = 0.6
+ZIPF_EXPONENT = 1.0
+EMPTY_POEM_RATE = 844 / FULL_POEMS
+MEAN_VERSES = 18.4
+FIRST_POEM_ID = 89248
+POEMS_PER_BATCH = 1000
+
+# (words per verse, weight)
+VERSE_LENGTHS = [(2, 0.08), (3, 0.34), (4, 0.42), (5, 0.16)]
+
+# (POS, share of lemma vocabulary)
+POS_SHARES = [('S', 0.50), ('V', 0.22), ('A', 0.12), ('D', 0.08), ('K', 0.03),
+              ('P', 0.02), ('J', 0.01), ('I', 0.01), ('N', 0.01)]
+
+NOMINAL_FORMS = [('sg_n', ''), ('sg_g', 'e'), ('sg_p', 'da'), ('sg_ill', 'lle'),
+                 ('sg_in', 'sse'), ('sg_el', 'st'), ('sg_ad', 'lla'), ('sg_kom', 'ga'),
+                 ('pl_n', 'd'), ('pl_g', 'de'), ('pl_p', 'id'), ('sg_es', 'na')]
+VERB_FORMS = [('b', 'b'), ('s', 's'), ('da', 'da'), ('ma', 'ma'), ('nud', 'nud'),
+              ('o', ''), ('sin', 'sin'), ('vad', 'vad'), ('gu', 'gu'), ('takse', 'takse')]
+UNINFLECTED_POS = {'D', 'K', 'J', 'I'}
+
+# (method, share of tokens, confidence)
+METHODS = [
+    ('manual_override', 0.366, 1.0),
+    ('estnltk+dict', 0.302, 1.0),
+    ('estnltk', 0.087, 0.95),
+    ('dict', 0.075, 0.643),
+    ('levenshtein', 0.032, 0.308),
+    ('suffix_strip', 0.027, 0.8),
+    ('estnltk+dict_jarva_claude_3.5', 0.020, 1.0),
+    ('estnltk_validation_levenshtein_valid', 0.015, 0.95),
+    ('estnltk_deepseek_merged', 0.008, 0.95),
+    ('neurotolge_vro', 0.005, 0.0),
+    ('compound', 0.004, 0.3),
+    ('unknown', 0.059, 0.5)
+]
+
+ORTHOGRAPHIC_VARIANT_RATE = 0.08
+
+CONSONANTS = 'hjklmnprstvkpt'
+VOWELS = 'aeiouõäöü'
+
+PLACES = ['Kuusalu', 'Jõelähtme', 'Karksi', 'Viru-Jaagupi', 'Viru-Nigula', 'Kolga-Jaani',
+          'Paistu', 'Helme', 'Rõuge', 'Setu', 'Kihnu', 'Muhu', 'Anna', 'Ambla', 'Järva-Madise',
+          'Kadrina', 'Haljala', 'Otepää', 'Kodavere', 'Pöide', 'Karja', 'Vändra', 'Tarvastu']
+COLLECTIONS = ['erab', 'H', 'E', 'EKS', 'EÜS', 'KKI', 'RKM']
+COLLECTORS = ['Hurt', 'Eisen', 'Kallas', 'Normann', 'Tampere', 'Sarv', 'Viidalepp',
+              'Virkus', 'Tedre', 'Rüütel', 'Kõiva', 'Oras', 'Laugaste']
+TYPES = ['Kiigelaul', 'Pulmalaul', 'Karjaselaul', 'Hällilaul', 'Töölaul', 'Mängulaul',
+         'Kalendrilaul', 'Lüroeepiline laul', 'Laulmisest', 'Vaeslapse laul']
+
+
+class ZipfSampler:
+    """Draw ranks 0..n-1 with probability proportional to 1 / (rank + 1) ** s."""
+
+    def __init__(self, n: int, exponent: float = ZIPF_EXPONENT):
+        self.cum_weights = list(accumulate(1.0 / (rank + 1) ** exponent for rank in range(n)))
+        self.total = self.cum_weights[-1]
+
+    def sample(self, rng: random.Random) -> int:
+        return bisect(self.cum_weights, rng.random() * self.total)
+
+
+def make_lemma_strings(count: int, rng: random.Random) -> list:
+    """Unique pseudo-Estonian lemma strings of two to four syllables."""
+    lemmas = []
+    seen = set()
+    while len(lemmas) < count:
+        syllables = rng.choice([2, 2, 2, 3, 3, 4])
+        word = ''.join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(syllables))
+        if rng.random() < 0.3:
+            word = word[1:]
+        if word not in seen:
+            seen.add(word)
+            lemmas.append(word)
+    return lemmas
+
+
+def make_lexicon(num_lemmas: int, rng: random.Random) -> list:
+    """
+    Lemma entries ordered by frequency rank.
+
+    Returns:
+        list of (lemma, pos, forms) with forms as (form_label, suffix) pairs
+    """
+    strings = make_lemma_strings(num_lemmas, rng)
+    pos_values = [pos for pos, _ in POS_SHARES]
+    pos_weights = [share for _, share in POS_SHARES]
+
+    lexicon = []
+    for lemma in strings:
+        pos = rng.choices(pos_values, pos_weights)[0]
+        if pos == 'V':
+            lemma = lemma + 'ma'
+            forms = VERB_FORMS
+        elif pos in UNINFLECTED_POS:
+            forms = [('', '')]
+        else:
+            forms = NOMINAL_FORMS
+        lexicon.append((lemma, pos, forms))
+    return lexicon
+
+
+def orthographic_variant(word: str, rng: random.Random) -> str:
+    """Dialectal spelling variant of a word form (w/v, doubled vowel, h-dropping)."""
+    choice = rng.random()
+    if choice < 0.35 and 'v' in word:
+        return word.replace('v', 'w', 1)
+    if choice < 0.7:
+        for i, ch in enumerate(word):
+            if ch in VOWELS:
+                return word[:i + 1] + ch + word[i + 1:]
+    if word.startswith('h'):
+        return word[1:]
+    return word + 'h'
+
+
+def inflect(lemma: str, pos: str, suffix: str) -> str:
+    """Surface form of a lemma with an inflectional suffix."""
+    if pos == 'V':
+        return lemma[:-2] + suffix if suffix != 'ma' else lemma
+    return lemma + suffix
+
+
+class CorpusGenerator:
+    """Generates synthetic poems with metadata and v1 annotations."""
+
+    def __init__(self, scale: float, seed: int = 42):
+        self.rng = random.Random(seed)
+        self.num_poems = max(1, round(FULL_POEMS * scale))
+        num_lemmas = max(200, round(FULL_LEMMAS * scale ** HEAPS_BETA))
+        self.lexicon = make_lexicon(num_lemmas, self.rng)
+        self.lemma_sampler = ZipfSampler(len(self.lexicon))
+        self.form_samplers = {}
+        self.method_names = [m for m, _, _ in METHODS]
+        self.method_cum = list(accumulate(share for _, share, _ in METHODS))
+        self.method_confidence = {m: conf for m, _, conf in METHODS}
+        self.verse_lengths = [n for n, _ in VERSE_LENGTHS]
+        self.verse_cum = list(accumulate(w for _, w in VERSE_LENGTHS))
+
+    def _form_sampler(self, num_forms: int) -> ZipfSampler:
+        if num_forms not in self.form_samplers:
+            self.form_samplers[num_forms] = ZipfSampler(num_forms, 1.2)
+        return self.form_samplers[num_forms]
+
+    def make_token(self) -> dict:
+        rng = self.rng
+        lemma, pos, forms = self.lexicon[self.lemma_sampler.sample(rng)]
+        form, suffix = forms[self._form_sampler(len(forms)).sample(rng)]
+        original = inflect(lemma, pos, suffix)
+        if rng.random() < ORTHOGRAPHIC_VARIANT_RATE:
+            original = orthographic_variant(original, rng)
+
+        method = self.method_names[bisect(self.method_cum, rng.random() * self.method_cum[-1])]
+        confidence = self.method_confidence[method]
+        if method == 'unknown':
+            lemma, pos, form = original, 'X', ''
+        return {
+            'original': original,
+            'lemma': lemma,
+            'pos': pos,
+            'form': form,
+            'method': method,
+            'confidence': confidence
+        }
+
+    def make_verses(self) -> list:
+        rng = self.rng
+        if rng.random() < EMPTY_POEM_RATE:
+            return []
+        num_verses = round(rng.expovariate(1 / (MEAN_VERSES - 1))) + 1
+        verses = []
+        for _ in range(num_verses):
+            length = self.verse_lengths[bisect(self.verse_cum, rng.random() * self.verse_cum[-1])]
+            verses.append([self.make_token() for _ in range(length)])
+        return verses
+
+    def make_csv_row(self, poem_id: int, verses: list) -> dict:
+        rng = self.rng
+        places = rng.sample(PLACES, rng.choice([1, 1, 1, 1, 2]))
+        year = rng.randint(1840, 1990) if rng.random() < 0.95 else ''
+        return {
+            'p_id': str(poem_id),
+            'poemText': ' / '.join(' '.join(t['original'] for t in verse) for verse in verses),
+            'verseCount': str(len(verses)),
+            'poemTitle': f"{rng.choice(COLLECTIONS)} {rng.randint(1, 400)}, {rng.randint(1, 900)} ({rng.randint(1, 20)})",
+            'nro': str(rng.randint(1, 50)),
+            'collection': rng.choice(COLLECTIONS),
+            'placeNames': ', '.join(places),
+            'placeTypes': ', '.join('kihelkond' for _ in places),
+            'placeOrigIds': ', '.join(str(PLACES.index(p) + 1) for p in places),
+            'poemYear': str(year),
+            'typeNames': rng.choice(TYPES),
+            'typeDescriptions': '',
+            'collectorNames': ', '.join(rng.sample(COLLECTORS, rng.choice([1, 1, 1, 2])))
+        }
+
+    def generate(self):
+        """Yield (poem_id, csv_row, poem_v1) for all poems."""
+        for row_index in range(self.num_poems):
+            poem_id = FIRST_POEM_ID + row_index
+            verses = self.make_verses()
+            csv_row = self.make_csv_row(poem_id, verses)
+            words = [token for verse in verses for token in verse]
+            poem_v1 = {
+                'text': ' '.join(t['original'] for t in words),
+                'words': words,
+                'batch': f"batch_{row_index // POEMS_PER_BATCH + 1:05d}",
+                'row_index': row_index % POEMS_PER_BATCH,
+                'num_words': len(words)
+            }
+            yield str(poem_id), csv_row, poem_v1
+
+
+def make_substitutions(lexicon: list, count: int, rng: random.Random) -> list:
+    """POS substitution rows for frequent lemmas, in final_substitutions.csv format."""
+    rows = []
+    targets = ['D', 'P', 'K', 'A', 'S']
+    for rank, (lemma, pos, _) in enumerate(lexicon[:count * 2]):
+        if len(rows) >= count:
+            break
+        if rng.random() < 0.5:
+            continue
+        correct_pos = rng.choice([t for t in targets if t != pos])
+        rows.append({
+            'lemma': lemma,
+            'current_pos': pos,
+            'correct_pos': correct_pos,
+            'source': 'manual_override',
+            'confidence': 'high',
+            'frequency': str(count * 2 - rank),
+            'category': 'apply',
+            'notes': 'synthetic'
+        })
+    return rows
+
+
+def write_json_gz(data: dict, path: Path):
+    """Write gzipped JSON (json.dumps uses the C encoder, json.dump does not)."""
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps(data, ensure_ascii=False))
+
+
+def generate_corpus(scale: float, output_dir: Path, seed: int = 42, workers: int = 1,
+                    num_substitutions: int = 100) -> dict:
+    """
+    Write all synthetic inputs to output_dir.
+
+    Returns:
+        dict of output name -> path, plus corpus sizes
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    generator = CorpusGenerator(scale, seed)
+    print(f"Generating {generator.num_poems:,} poems over {len(generator.lexicon):,} lemmas "
+          f"(scale {scale:g}, seed {seed})...")
+
+    paths = {
+        'csv': output_dir / 'koik_regilaulud_synthetic.csv',
+        'poems_index': output_dir / 'poems_index.json.gz',
+        'corpus': output_dir / 'corpus_synthetic.json.gz',
+        'substitutions': output_dir / 'substitutions_synthetic.csv'
+    }
+
+    poems = {}
+    columns = ['p_id', 'poemText', 'verseCount', 'poemTitle', 'nro', 'collection', 'placeNames',
+               'placeTypes', 'placeOrigIds', 'poemYear', 'typeNames', 'typeDescriptions',
+               'collectorNames']
+    with open(paths['csv'], 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for poem_id, csv_row, poem_v1 in generator.generate():
+            writer.writerow(csv_row)
+            poems[poem_id] = poem_v1
+            if len(poems) % 10000 == 0:
+                print(f"  Generated {len(poems):,} / {generator.num_poems:,} poems")
+    print(f"✓ Saved {paths['csv']}")
+
+    total_words = sum(p['num_words'] for p in poems.values())
+    poems_index = {
+        'metadata': {
+            'version': 'v1',
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'created_from': f'synthetic_corpus.py (scale {scale:g}, seed {seed})',
+            'total_poems': len(poems),
+            'total_words': total_words,
+            'avg_words_per_poem': round(total_words / len(poems), 1)
+        },
+        'poems': poems
+    }
+    write_json_gz(poems_index, paths['poems_index'])
+    print(f"✓ Saved {paths['poems_index']}")
+
+    corpus = rebuild_aggregates(poems_index, workers, max(1, workers * 4),
+                                {'metadata': {'version': 'synthetic'}})
+    write_json_gz(corpus, paths['corpus'])
+    print(f"✓ Saved {paths['corpus']}")
+
+    substitutions = make_substitutions(generator.lexicon, num_substitutions, generator.rng)
+    with open(paths['substitutions'], 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(substitutions[0]) if substitutions else ['lemma'])
+        writer.writeheader()
+        writer.writerows(substitutions)
+    print(f"✓ Saved {paths['substitutions']}")
+
+    manifest = {
+        'scale': scale,
+        'seed': seed,
+        'num_poems': len(poems),
+        'num_words': total_words,
+        'num_lemmas': len(corpus['lemma_index']),
+        'num_word_forms': len(corpus['words']),
+        'files': {name: path.name for name, path in paths.items()}
+    }
+    with open(output_dir / 'manifest.json', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"\n  Poems: {manifest['num_poems']:,}")
+    print(f"  Words: {manifest['num_words']:,} ({total_words / len(poems):.1f} per poem)")
+    print(f"  Lemmas: {manifest['num_lemmas']:,}")
+    print(f"  Word forms: {manifest['num_word_forms']:,}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a schema-faithful synthetic corpus (CSV, v1 index, aggregate)'
+    )
+    parser.add_argument('--scale', type=float, default=0.01,
+                        help=f'Fraction of the full {FULL_POEMS:,}-poem corpus (default: 0.01)')
+    parser.add_argument('--output-dir', type=Path, default=Path('data_synthetic'),
+                        help='Output directory (default: data_synthetic)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Worker processes for the aggregate rebuild (default: all cores)')
+    parser.add_argument('--substitutions', type=int, default=100,
+                        help='Number of synthetic POS substitutions (default: 100)')
+
+    args = parser.parse_args()
+    generate_corpus(args.scale, args.output_dir, args.seed, args.workers, args.substitutions)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
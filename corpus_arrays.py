@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Integer-encoded token arrays for vectorised corpus analysis.
+
+Decodes a poems index (v2, v3 or v4) once into flat NumPy arrays, one
+entry per token, in poem order:
+
+    word, lemma, pos, form, method   int32 codes into vocab tables
+    confidence                       float32
+    verse                            int32 verse index within the poem (-1 = unaligned)
+    poem_offsets                     int64, tokens of poem i are [offsets[i], offsets[i+1])
+
+plus the poem ID table and per-poem metadata. Analyses (co-occurrence,
+lexical richness, facets, keyness) work on these arrays with grouped
+NumPy reductions instead of nested Python loops over dicts.
+
+Usage:
+    # Encode once and cache as .npz
+    python corpus_arrays.py --poems-index poems_index_v3.json.gz --output corpus_arrays.npz
+
+In Python:
+    arrays = TokenArrays.load('corpus_arrays.npz')
+    arrays.poem_of_token()          # poem ordinal per token
+    arrays.vocab['lemma'][code]     # decode a lemma code
+"""
+
+import argparse
+import sys
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from corpus_io import pack_json, unpack_json
+from poem_index_io import load_poems_index
+from poem_index_v4 import PoemView
+
+
+TOKEN_FIELDS = ('word', 'lemma', 'pos', 'form', 'method')
+
+
+class TokenArrays:
+    """Flat integer-encoded token stream of a poems index."""
+
+    def __init__(self, poem_ids: list, poem_offsets: np.ndarray, codes: dict,
+                 confidence: np.ndarray, verse: np.ndarray, vocab: dict,
+                 poem_metadata: list):
+        self.poem_ids = poem_ids
+        self.poem_offsets = poem_offsets
+        self.codes = codes
+        self.confidence = confidence
+        self.verse = verse
+        self.vocab = vocab
+        self.poem_metadata = poem_metadata
+
+    @property
+    def num_poems(self) -> int:
+        return len(self.poem_ids)
+
+    @property
+    def num_tokens(self) -> int:
+        return int(self.poem_offsets[-1])
+
+    def poem_lengths(self) -> np.ndarray:
+        """Number of tokens per poem."""
+        return np.diff(self.poem_offsets)
+
+    def poem_of_token(self) -> np.ndarray:
+        """Poem ordinal of every token."""
+        return np.repeat(np.arange(self.num_poems, dtype=np.int32), self.poem_lengths())
+
+    def verse_units(self) -> tuple:
+        """
+        Global verse number of every token (-1 for unaligned tokens).
+
+        Returns:
+            tuple: (unit_per_token, num_units)
+        """
+        poem = self.poem_of_token()
+        verses_per_poem = np.zeros(self.num_poems, dtype=np.int64)
+        aligned = self.verse >= 0
+        np.maximum.at(verses_per_poem, poem[aligned], self.verse[aligned].astype(np.int64) + 1)
+        verse_offsets = np.concatenate([[0], np.cumsum(verses_per_poem)])
+        units = np.where(aligned, verse_offsets[poem] + self.verse, -1)
+        return units, int(verse_offsets[-1])
+
+    def codes_for(self, field: str, values) -> np.ndarray:
+        """Codes of the given vocabulary values (unknown values are skipped)."""
+        lookup = {value: i for i, value in enumerate(self.vocab[field])}
+        return np.array([lookup[v] for v in values if v in lookup], dtype=np.int32)
+
+    def save(self, path: Path):
+        """Save to a NumPy .npz archive."""
+        arrays = {
+            'poem_offsets': self.poem_offsets,
+            'confidence': self.confidence,
+            'verse': self.verse,
+            'poem_ids': pack_json(self.poem_ids),
+            'poem_metadata': pack_json(self.poem_metadata)
+        }
+        for field in TOKEN_FIELDS:
+            arrays[f'code_{field}'] = self.codes[field]
+            arrays[f'vocab_{field}'] = pack_json(self.vocab[field])
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> 'TokenArrays':
+        """Load arrays saved with save()."""
+        with np.load(path) as archive:
+            return cls(
+                poem_ids=unpack_json(archive['poem_ids']),
+                poem_offsets=archive['poem_offsets'],
+                codes={field: archive[f'code_{field}'] for field in TOKEN_FIELDS},
+                confidence=archive['confidence'],
+                verse=archive['verse'],
+                vocab={field: unpack_json(archive[f'vocab_{field}']) for field in TOKEN_FIELDS},
+                poem_metadata=unpack_json(archive['poem_metadata'])
+            )
+
+
+def encode_poem_index(index: dict) -> TokenArrays:
+    """Encode a loaded poems index into TokenArrays."""
+    poems = index['poems']
+    poem_ids = sorted(poems, key=int)
+
+    vocab_lookup = {field: {} for field in TOKEN_FIELDS}
+    # array.array keeps per-token memory at 4 bytes while encoding
+    columns = {field: array('i') for field in TOKEN_FIELDS}
+    confidence = array('f')
+    verse = array('i')
+    offsets = [0]
+    poem_metadata = []
+
+    for poem_id in poem_ids:
+        view = PoemView(poems[poem_id])
+        for word, verse_idx, _ in view.iter_words():
+            values = (word.get('original', ''), word.get('lemma', ''), word.get('pos', ''),
+                      word.get('form', ''), word.get('method', ''))
+            for field, value in zip(TOKEN_FIELDS, values):
+                lookup = vocab_lookup[field]
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(lookup)
+                columns[field].append(code)
+            confidence.append(word.get('confidence', 0.0))
+            verse.append(verse_idx)
+        offsets.append(len(confidence))
+        poem_metadata.append(view.raw.get('metadata', {}))
+
+    return TokenArrays(
+        poem_ids=poem_ids,
+        poem_offsets=np.asarray(offsets, dtype=np.int64),
+        codes={field: np.frombuffer(columns[field], dtype=np.int32) for field in TOKEN_FIELDS},
+        confidence=np.frombuffer(confidence, dtype=np.float32),
+        verse=np.frombuffer(verse, dtype=np.int32),
+        vocab={field: list(vocab_lookup[field]) for field in TOKEN_FIELDS},
+        poem_metadata=poem_metadata
+    )
+
+
+def load_token_arrays(path: Path) -> TokenArrays:
+    """Load TokenArrays from an .npz cache or encode them from a poems index."""
+    if str(path).endswith('.npz'):
+        print(f"Loading token arrays from {path}...")
+        return TokenArrays.load(path)
+    return encode_poem_index(load_poems_index(path))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Encode a poems index into integer token arrays (.npz)'
+    )
+    parser.add_argument('--poems-index', type=Path, default=Path('poems_index_v3.json.gz'),
+                        help='Input poems index (v2/v3/v4)')
+    parser.add_argument('--output', type=Path, default=Path('corpus_arrays.npz'),
+                        help='Output .npz file')
+
+    args = parser.parse_args()
+
+    arrays = encode_poem_index(load_poems_index(args.poems_index))
+    arrays.save(args.output)
+
+    print(f"✓ Saved {args.output}")
+    print(f"  Poems: {arrays.num_poems:,}")
+    print(f"  Tokens: {arrays.num_tokens:,}")
+    for field in TOKEN_FIELDS:
+        print(f"  Distinct {field}: {len(arrays.vocab[field]):,}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Persistent decoded-corpus cache keyed by input checksum.
+
+view_poem.py, basic_usage.py and similar scripts decompress and parse the
+same gzip JSON on every start. load_cached(path) keeps the decoded object
+as a pickle in a cache directory and loads that instead, which is only
+about 2.5x faster than gzip+JSON because every poem or word form is still
+rebuilt. load_lazy(path, sections) stores the named sections (poems,
+words, ...) as one pickle per key with an offset table, and returns them
+as read-only mappings that unpickle a value when it is accessed; a script
+that looks up a few poems or word forms then reads only the offset table
+and those values.
+
+- entries are keyed by the md5 of the source file (and the loader), so
+  copies of the same file share an entry and any change to the content
+  misses;
+- the md5 is remembered per source path together with its size and
+  mtime, so an unchanged file is not rehashed on every start;
+- after each write, least recently used entries are evicted until the
+  cache fits in its size limit;
+- unpickling runs code chosen by whoever wrote the file, so the cache
+  directory and each entry must be owned by the current user and not be
+  writable by group or others; otherwise the cache is bypassed.
+
+Cache directory: $RUNOSONG_CACHE_DIR or ~/.cache/runosong-corpus.
+Size limit: $RUNOSONG_CACHE_MAX_GB (default 8). Set RUNOSONG_NO_CACHE=1
+to bypass the cache.
+
+Usage:
+    python corpus_cache.py warm poems_index.json.gz --sections poems
+    python corpus_cache.py warm corpus_unknown_reduced.json.gz --sections words lemma_index ambiguous_words
+    python corpus_cache.py info
+    python corpus_cache.py clear
+
+In Python:
+    from corpus_cache import load_cached, load_lazy
+    index = load_cached('poems_index.json.gz')
+    index = load_lazy('poems_index.json.gz', ['poems'])
+    poem = index['poems']['89248']   # unpickles this poem only
+"""
+
+import argparse
+import gc
+import json
+import os
+import pickle
+import stat
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from collections.abc import Mapping
+from functools import partial
+from pathlib import Path
+
+from corpus_sections import file_md5
+from rebuild_corpus_aggregates import load_json
+
+
+CACHE_VERSION = 1
+INDEX_NAME = 'index.json'
+DEFAULT_MAX_GB = 8.0
+FOOTER_OFFSET = struct.Struct('<q')
+
+
+def cache_dir() -> Path:
+    return Path(os.environ.get('RUNOSONG_CACHE_DIR', Path.home() / '.cache' / 'runosong-corpus'))
+
+
+def cache_enabled() -> bool:
+    return os.environ.get('RUNOSONG_NO_CACHE', '') in ('', '0')
+
+
+def default_max_bytes() -> int:
+    return int(float(os.environ.get('RUNOSONG_CACHE_MAX_GB', DEFAULT_MAX_GB)) * 1024 ** 3)
+
+
+class CorpusCache:
+    """Pickled decoded objects under one directory with an LRU index."""
+
+    def __init__(self, directory: Path = None, max_bytes: int = None):
+        self.directory = Path(directory) if directory else cache_dir()
+        self.max_bytes = default_max_bytes() if max_bytes is None else max_bytes
+        self.index_path = self.directory / INDEX_NAME
+
+    def read_index(self) -> dict:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == CACHE_VERSION:
+                return index
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return {'version': CACHE_VERSION, 'sources': {}, 'entries': {}}
+
+    def write_index(self, index: dict):
+        payload = json.dumps(index, ensure_ascii=False, indent=2).encode('utf-8')
+        self._write_atomic(self.index_path, lambda f: f.write(payload))
+
+    def source_md5(self, source: Path, index: dict) -> str:
+        """md5 of the source file, reusing the stored one while size and mtime match."""
+        stat = source.stat()
+        key = str(source.resolve())
+        known = index['sources'].get(key)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['md5']
+        md5 = file_md5(source)
+        index['sources'][key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'md5': md5}
+        return md5
+
+    def load(self, source: Path, loader=load_json):
+        """Decoded contents of source, from the cache when its checksum matches."""
+        return self._load(source, loader, f"{loader.__name__}.pickle", _read_pickle, _write_pickle)
+
+    def load_lazy(self, source: Path, sections, loader=load_json) -> dict:
+        """Like load(), with the given sections as mappings decoded per key on access."""
+        sections = sorted(sections)
+        return self._load(source, loader, f"{loader.__name__}-{'+'.join(sections)}.store",
+                          _read_store, partial(_write_store, sections=sections))
+
+    def _load(self, source: Path, loader, suffix: str, read, write):
+        source = Path(source)
+        if not _trusted(self.directory):
+            print(f"⚠ Not using corpus cache {self.directory}: "
+                  f"not owned by you or writable by others")
+            return _without_gc(loader, source)
+        index = self.read_index()
+        md5 = self.source_md5(source, index)
+        entry_name = f"{md5}-{suffix}"
+        entry_path = self.directory / entry_name
+
+        if entry_name in index['entries'] and entry_path.is_file():
+            start = time.perf_counter()
+            try:
+                if not _trusted(entry_path):
+                    raise pickle.UnpicklingError("not owned by you or writable by others")
+                data = _without_gc(read, entry_path)
+            except (pickle.UnpicklingError, EOFError, struct.error, OSError, ValueError,
+                    AttributeError, ImportError) as e:
+                # Damaged, truncated or written for classes that have moved: rebuild it
+                print(f"⚠ Dropping unreadable corpus cache entry {entry_path}: {e}")
+                entry_path.unlink(missing_ok=True)
+                del index['entries'][entry_name]
+            else:
+                index['entries'][entry_name]['last_used'] = time.time()
+                self.write_index(index)
+                print(f"  (cached decode of {source.name}: {time.perf_counter() - start:.1f} s)")
+                return data
+
+        data = _without_gc(loader, source)
+        try:
+            self._write_atomic(entry_path, lambda f: write(data, f))
+        except OSError as e:
+            print(f"⚠ Could not write corpus cache entry: {e}")
+            return data
+        index = self.read_index()  # Another process may have updated it meanwhile
+        self.source_md5(source, index)
+        index['entries'][entry_name] = {
+            'source': str(source.resolve()),
+            'bytes': entry_path.stat().st_size,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'last_used': time.time()
+        }
+        self.evict(index, keep=entry_name)
+        self.write_index(index)
+        return data
+
+    def evict(self, index: dict, keep: str = None) -> list:
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        entries = index['entries']
+        for name in [n for n in entries if not (self.directory / n).is_file()]:
+            del entries[name]
+        total = sum(e['bytes'] for e in entries.values())
+        removed = []
+        for name in sorted(entries, key=lambda n: entries[n]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            (self.directory / name).unlink(missing_ok=True)
+            total -= entries.pop(name)['bytes']
+            removed.append(name)
+        return removed
+
+    def clear(self) -> int:
+        index = self.read_index()
+        for name in index['entries']:
+            (self.directory / name).unlink(missing_ok=True)
+        count = len(index['entries'])
+        self.index_path.unlink(missing_ok=True)
+        return count
+
+    def _write_atomic(self, path: Path, write):
+        self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+
+def _trusted(path: Path) -> bool:
+    """True if path is missing, or owned by this user and not group/world-writable."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return True
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _read_pickle(path: Path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _write_pickle(data, f):
+    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class LazySection(Mapping):
+    """
+    Read-only mapping over one section of a store entry: keys and value
+    offsets are in memory, each value is unpickled when it is accessed.
+    """
+
+    def __init__(self, path: Path, keys: list, starts: bytes):
+        self.path = path
+        self.keys_list = keys
+        self.starts = array('q')
+        self.starts.frombytes(starts)
+        self.positions = {key: i for i, key in enumerate(keys)}
+        self._file = None
+
+    def __getitem__(self, key):
+        i = self.positions[key]
+        if self._file is None:
+            self._file = open(self.path, 'rb')
+        self._file.seek(self.starts[i])
+        return pickle.loads(self._file.read(self.starts[i + 1] - self.starts[i]))
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def __iter__(self):
+        return iter(self.keys_list)
+
+    def __len__(self):
+        return len(self.keys_list)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __del__(self):
+        self.close()
+
+
+def _write_store(data: dict, f, sections):
+    """
+    Store layout: the pickled values of each lazy section, then a pickled
+    footer (key order, the other sections, keys and value offsets per lazy
+    section), then the footer's offset as a little-endian int64.
+    """
+    footer = {'order': list(data), 'inline': {}, 'sections': {}}
+    for name, value in data.items():
+        if name not in sections or not isinstance(value, dict):
+            footer['inline'][name] = value
+            continue
+        starts = array('q', [f.tell()])
+        for item in value.values():
+            f.write(pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL))
+            starts.append(f.tell())
+        footer['sections'][name] = (list(value), starts.tobytes())
+    footer_offset = f.tell()
+    pickle.dump(footer, f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.write(FOOTER_OFFSET.pack(footer_offset))
+
+
+def _read_store(path: Path) -> dict:
+    with open(path, 'rb') as f:
+        f.seek(-FOOTER_OFFSET.size, os.SEEK_END)
+        footer_offset, = FOOTER_OFFSET.unpack(f.read(FOOTER_OFFSET.size))
+        f.seek(footer_offset)
+        footer = pickle.load(f)
+    data = {}
+    for name in footer['order']:
+        if name in footer['sections']:
+            data[name] = LazySection(path, *footer['sections'][name])
+        else:
+            data[name] = footer['inline'][name]
+    return data
+
+
+def _without_gc(func, *args):
+    # Building millions of small dicts triggers repeated full collections
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return func(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_cached(path, loader=load_json, use_cache: bool = True):
+    """Load a .json/.json.gz corpus or index through the cache (unless disabled)."""
+    if not (use_cache and cache_enabled()):
+        return loader(Path(path))
+    return CorpusCache().load(path, loader)
+
+
+def load_lazy(path, sections, loader=load_json, use_cache: bool = True) -> dict:
+    """
+    Load a .json/.json.gz corpus or index with the given sections decoded per
+    key on access (plain dicts when the cache is disabled).
+    """
+    if not (use_cache and cache_enabled()):
+        return loader(Path(path))
+    return CorpusCache().load_lazy(path, sections, loader)
+
+
+def run_info(cache: CorpusCache):
+    index = cache.read_index()
+    entries = index['entries']
+    total = sum(e['bytes'] for e in entries.values())
+    print(f"\n📦 {cache.directory}: {len(entries)} entries, {total / 1024 ** 3:.2f} GB "
+          f"of {cache.max_bytes / 1024 ** 3:.2f} GB")
+    for name, entry in sorted(entries.items(), key=lambda x: -x[1]['last_used']):
+        used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_used']))
+        print(f"  {entry['bytes'] / (1024 * 1024):>9.1f} MB  used {used}  {entry['source']}")
+    return 0
+
+
+def run_warm(cache: CorpusCache, paths: list, sections: list = None):
+    for path in paths:
+        start = time.perf_counter()
+        print(f"Loading {path}...")
+        if sections:
+            cache.load_lazy(path, sections)
+        else:
+            cache.load(path)
+        print(f"✓ {path} ({time.perf_counter() - start:.1f} s)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Persistent decoded-corpus cache')
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                        help='Cache directory (default: $RUNOSONG_CACHE_DIR or ~/.cache/runosong-corpus)')
+    parser.add_argument('--max-gb', type=float, default=None,
+                        help=f'Size limit in GB (default: $RUNOSONG_CACHE_MAX_GB or {DEFAULT_MAX_GB:g})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('info', help='List cache entries')
+    subparsers.add_parser('clear', help='Remove all cache entries')
+    warm_parser = subparsers.add_parser('warm', help='Decode files into the cache')
+    warm_parser.add_argument('paths', type=Path, nargs='+', help='Corpus or index files (.json/.json.gz)')
+    warm_parser.add_argument('--sections', nargs='+', default=None,
+                             help='Build the per-key store for these sections, as load_lazy() '
+                                  '(e.g. poems, or words lemma_index ambiguous_words)')
+
+    args = parser.parse_args()
+    max_bytes = int(args.max_gb * 1024 ** 3) if args.max_gb is not None else None
+    cache = CorpusCache(args.cache_dir, max_bytes)
+    if args.command == 'info':
+        return run_info(cache)
+    if args.command == 'clear':
+        print(f"✓ Removed {cache.clear()} cache entries from {cache.directory}")
+        return 0
+    return run_warm(cache, args.paths, args.sections)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Token-level delta patches between poem index versions.
+
+A new release of the poem index usually changes a small share of token
+fields (v3 changed 382,574 POS values on top of v2), yet users download
+the whole 135 MB index again. `diff` compares two poem indexes and writes
+only what changed:
+
+- token changes grouped by (field, old value, new value), each with the
+  word indices per poem id, so 10,000 identical S -> D flips cost a few
+  bytes each after gzip;
+- poem-level fields that changed (whole poem words lists are replaced when
+  the number of words or a word's keys differ, e.g. across schema changes);
+- added and removed poems, top-level sections (metadata) and poem order.
+
+`patch` applies a delta to the base index. Every token change records its
+old value, and the base and result are checked against content checksums
+stored in the delta.
+
+Both commands stream: the two indexes (.json/.json.gz or JSONL, sorted by
+poem ID) are merge-joined poem by poem, so only the delta itself and one
+poem per side are in memory. The patched index is written to a temporary
+file and moved into place only once both checksums match. The checksum
+covers the canonical JSON (sorted keys, no whitespace) of the non-poem
+sections and of each [poem_id, poem] record in order, so it does not
+depend on gzip settings or key order; the gzip bytes of a patched file
+differ from the published parts and their checksum.md5.
+
+Usage:
+    python corpus_delta.py diff --base poems_index_v2.json.gz \
+        --target poems_index_v3.json.gz --output poems_index_v2_to_v3.delta.json.gz
+
+    python corpus_delta.py patch --base poems_index_v2.json.gz \
+        --delta poems_index_v2_to_v3.delta.json.gz --output poems_index_v3.json.gz
+
+    python corpus_delta.py info --delta poems_index_v2_to_v3.delta.json.gz
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import pipeline_metrics
+from pipeline_metrics import stage
+from poem_index_io import PoemIndexReader, PoemIndexWriter, check_sorted, merge_join, poem_sort_key
+from rebuild_corpus_aggregates import load_json, save_json
+
+
+DELTA_FORMAT = 'poems_index_delta'
+DELTA_VERSION = 1
+
+# Sentinel for "key not present" (None is a valid JSON value)
+_MISSING = object()
+
+
+class DeltaError(Exception):
+    """The delta does not apply to the given base index."""
+
+
+def canonical_json(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+class ContentChecksum:
+    """
+    Content checksum built one poem at a time: MD5 over the canonical
+    non-poem sections followed by the MD5 of the [poem_id, poem] records.
+    """
+
+    def __init__(self):
+        self.poems_digest = hashlib.md5()
+        self.count = 0
+
+    def track(self, poems):
+        """Pass (poem_id, poem) pairs through, adding each to the checksum."""
+        for poem_id, poem in poems:
+            self.poems_digest.update(canonical_json([poem_id, poem]))
+            self.count += 1
+            yield poem_id, poem
+
+    def hexdigest(self, sections: dict) -> str:
+        digest = hashlib.md5(canonical_json({k: v for k, v in sections.items() if k != 'poems'}))
+        digest.update(self.poems_digest.digest())
+        return digest.hexdigest()
+
+
+def content_md5(index: dict) -> str:
+    """Content checksum of an in-memory index (same value as streaming it)."""
+    checksum = ContentChecksum()
+    for _ in checksum.track(index['poems'].items()):
+        pass
+    return checksum.hexdigest(index)
+
+
+def describe(path: Path, sections: dict, poems: int, checksum: str) -> dict:
+    metadata = sections.get('metadata', {})
+    return {
+        'file': Path(path).name,
+        'version': metadata.get('version', ''),
+        'poems': poems,
+        'content_md5': checksum
+    }
+
+
+def diff_words(old_words: list, new_words: list):
+    """
+    Token changes between two word lists as (index, field, old, new), or
+    None when the lists cannot be diffed token by token.
+    """
+    if len(old_words) != len(new_words):
+        return None
+    changes = []
+    for i, (old, new) in enumerate(zip(old_words, new_words)):
+        if old == new:
+            continue
+        if old.keys() != new.keys():
+            return None
+        for field, value in new.items():
+            if old[field] != value:
+                changes.append((i, field, old[field], value))
+    return changes
+
+
+def diff_sections(base: dict, target: dict) -> dict:
+    """Top-level (non-poem) sections that changed."""
+    return {
+        'top_level': {key: value for key, value in target.items()
+                      if key != 'poems' and base.get(key, _MISSING) != value},
+        'top_level_removed': [key for key in base if key != 'poems' and key not in target]
+    }
+
+
+def diff_poems(base_poems, target_poems) -> dict:
+    """
+    Build the poem part of the delta from two (poem_id, poem) streams, both
+    sorted by poem ID.
+    """
+    # (field, old, new) -> {poem_id: [word indices]}
+    groups = defaultdict(lambda: defaultdict(list))
+    poem_fields = {}
+    poem_fields_removed = {}
+    added = {}
+    removed_poems = []
+    stats = {'poems_compared': 0, 'poems_changed': 0, 'tokens_changed': 0,
+             'field_changes': 0, 'words_replaced': 0}
+
+    joined = merge_join(check_sorted(base_poems, 'base index'),
+                        check_sorted(target_poems, 'target index'))
+    for poem_id, old_poem, new_poem in joined:
+        if old_poem is None:
+            added[poem_id] = new_poem
+            continue
+        if new_poem is None:
+            removed_poems.append(poem_id)
+            continue
+        stats['poems_compared'] += 1
+        if old_poem == new_poem:
+            continue
+        stats['poems_changed'] += 1
+
+        fields = {key: value for key, value in new_poem.items()
+                  if key != 'words' and old_poem.get(key, _MISSING) != value}
+        removed = [key for key in old_poem if key not in new_poem]
+
+        old_words = old_poem.get('words', [])
+        new_words = new_poem.get('words', [])
+        if old_words != new_words:
+            changes = diff_words(old_words, new_words)
+            if changes is None:
+                fields['words'] = new_words
+                stats['words_replaced'] += 1
+            else:
+                changed_tokens = set()
+                for i, field, old, new in changes:
+                    groups[(field, json.dumps(old), json.dumps(new))][poem_id].append(i)
+                    changed_tokens.add(i)
+                    stats['field_changes'] += 1
+                stats['tokens_changed'] += len(changed_tokens)
+
+        if fields:
+            poem_fields[poem_id] = fields
+        if removed:
+            poem_fields_removed[poem_id] = removed
+
+    changes = []
+    for (field, old, new), poems in sorted(groups.items(), key=lambda x: -sum(map(len, x[1].values()))):
+        changes.append({
+            'field': field,
+            'old': json.loads(old),
+            'new': json.loads(new),
+            'tokens': [[poem_id, indices] for poem_id, indices in poems.items()]
+        })
+
+    stats['poems_added'] = len(added)
+    stats['poems_removed'] = len(removed_poems)
+    stats['change_groups'] = len(changes)
+
+    return {
+        'changes': changes,
+        'poem_fields': poem_fields,
+        'poem_fields_removed': poem_fields_removed,
+        'poems_added': added,
+        'poems_removed': removed_poems,
+        'stats': stats
+    }
+
+
+def diff_indexes(base: dict, target: dict) -> dict:
+    """Build the delta that turns an in-memory base index into target."""
+    return {**diff_poems(base['poems'].items(), target['poems'].items()),
+            **diff_sections(base, target)}
+
+
+def patch_sections(sections: dict, delta: dict) -> dict:
+    """Top-level sections after the delta (new sections go last)."""
+    patched = {key: value for key, value in sections.items() if key not in delta['top_level_removed']}
+    patched.update(delta['top_level'])
+    return patched
+
+
+def patch_poems(base_poems, delta: dict, stats: dict):
+    """
+    Apply the poem part of a delta to a (poem_id, poem) stream sorted by poem
+    ID, yielding the patched stream; raises DeltaError on mismatch.
+    """
+    token_changes = defaultdict(list)
+    for group in delta['changes']:
+        for poem_id, indices in group['tokens']:
+            token_changes[poem_id].append((group['field'], group['old'], group['new'], indices))
+    poem_fields = delta['poem_fields']
+    poem_fields_removed = delta['poem_fields_removed']
+    removed = set(delta['poems_removed'])
+    pending = set(token_changes) | set(poem_fields) | set(poem_fields_removed) | removed
+
+    stats.update({'tokens_changed': 0, 'poems_changed': 0})
+    added = sorted(delta['poems_added'].items(), key=lambda x: poem_sort_key(x[0]))
+
+    for poem_id, poem, new_poem in merge_join(check_sorted(base_poems, 'base index'), added):
+        if poem is None:
+            yield poem_id, new_poem
+            continue
+        if new_poem is not None:
+            raise DeltaError(f"poem {poem_id} to add is already in the base index")
+        if poem_id not in pending:
+            yield poem_id, poem
+            continue
+        pending.discard(poem_id)
+        if poem_id in removed:
+            continue
+
+        words = poem.get('words', [])
+        for field, old, new, indices in token_changes.get(poem_id, ()):
+            for i in indices:
+                if i >= len(words) or words[i].get(field, _MISSING) != old:
+                    raise DeltaError(f"poem {poem_id} word {i}: expected {field}={old!r}")
+                words[i][field] = new
+            stats['tokens_changed'] += len(indices)
+        poem.update(poem_fields.get(poem_id, {}))
+        for key in poem_fields_removed.get(poem_id, ()):
+            poem.pop(key, None)
+        stats['poems_changed'] += 1
+        yield poem_id, poem
+
+    if pending:
+        missing = sorted(pending, key=poem_sort_key)
+        raise DeltaError(f"poem {missing[0]} is not in the base index"
+                         + (f" (and {len(missing) - 1:,} more)" if len(missing) > 1 else ''))
+
+
+def apply_delta(index: dict, delta: dict) -> dict:
+    """Apply a delta to an in-memory base index in place; raises DeltaError on mismatch."""
+    stats = {}
+    poems = dict(patch_poems(index['poems'].items(), delta, stats))
+    patched = patch_sections(index, delta)
+    index.clear()
+    index.update(patched)
+    index['poems'] = poems
+    return stats
+
+
+def run_diff(args) -> int:
+    print(f"Streaming base {args.base} and target {args.target}...")
+    base = PoemIndexReader(args.base)
+    target = PoemIndexReader(args.target)
+    base_sum = ContentChecksum()
+    target_sum = ContentChecksum()
+    with stage('diff') as s:
+        try:
+            delta = diff_poems(base_sum.track(base.poems()), target_sum.track(target.poems()))
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        s.items = target_sum.count
+    base_info = describe(args.base, base.sections, base_sum.count, base_sum.hexdigest(base.sections))
+    target_info = describe(args.target, target.sections, target_sum.count,
+                           target_sum.hexdigest(target.sections))
+
+    delta = {
+        'format': DELTA_FORMAT,
+        'delta_version': DELTA_VERSION,
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'base': base_info,
+        'target': target_info,
+        **delta,
+        **diff_sections(base.sections, target.sections)
+    }
+
+    with stage('write'):
+        save_json(delta, args.output)
+
+    stats = delta['stats']
+    print("\n" + "=" * 60)
+    print("DELTA SUMMARY")
+    print("=" * 60)
+    print(f"   Base: {base_info['file']} ({base_info['version']}, {base_info['poems']:,} poems)")
+    print(f"   Target: {target_info['file']} ({target_info['version']}, {target_info['poems']:,} poems)")
+    print(f"   Poems changed: {stats['poems_changed']:,}")
+    print(f"   Tokens changed: {stats['tokens_changed']:,} ({stats['field_changes']:,} field values, "
+          f"{stats['change_groups']:,} groups)")
+    print(f"   Word lists replaced: {stats['words_replaced']:,}")
+    print(f"   Poems added / removed: {stats['poems_added']:,} / {stats['poems_removed']:,}")
+    if delta['changes']:
+        print(f"\n🔝 Top 10 changes:")
+        for group in delta['changes'][:10]:
+            count = sum(len(indices) for _, indices in group['tokens'])
+            print(f"   {group['field']}: {group['old']!r} -> {group['new']!r}: {count:,} tokens")
+
+    delta_size = args.output.stat().st_size
+    target_size = Path(args.target).stat().st_size
+    print(f"\nSaved: {args.output} ({delta_size / 1024:,.1f} KB, "
+          f"{delta_size / target_size * 100:.2f}% of {target_info['file']})")
+    return 0
+
+
+def check_checksum(label: str, actual: str, expected: str) -> bool:
+    if actual == expected:
+        print(f"✓ {label} verified ({actual})")
+        return True
+    print(f"Error: {label.lower()} checksum mismatch", file=sys.stderr)
+    print(f"  Expected: {expected}", file=sys.stderr)
+    print(f"  Actual: {actual}", file=sys.stderr)
+    return False
+
+
+def run_patch(args) -> int:
+    print(f"Loading delta {args.delta}...")
+    delta = load_json(args.delta)
+    if delta.get('format') != DELTA_FORMAT or delta.get('delta_version') != DELTA_VERSION:
+        print(f"Error: {args.delta} is not a version {DELTA_VERSION} poem index delta", file=sys.stderr)
+        return 1
+
+    print(f"Patching {args.base} into {args.output}...")
+    base = PoemIndexReader(args.base)
+    base_sum = ContentChecksum()
+    result_sum = ContentChecksum()
+    # Same suffix, so the writer picks the same format as the final name
+    tmp_path = args.output.with_name(f".tmp-{args.output.name}")
+    writer = PoemIndexWriter(tmp_path)
+    stats = {}
+    try:
+        with stage('patch') as s:
+            if writer.jsonl:
+                # JSONL keeps every section in the header line
+                leading = patch_sections(base.sections, delta)
+            else:
+                leading = {key: delta['top_level'].get(key, base.sections[key])
+                           for key in base.leading_sections if key not in delta['top_level_removed']}
+            writer.begin(leading)
+            patched = patch_poems(base_sum.track(base.poems()), delta, stats)
+            for poem_id, poem in result_sum.track(patched):
+                writer.write_poem(poem_id, poem)
+            writer.end({key: value for key, value in patch_sections(base.sections, delta).items()
+                        if key not in leading})
+            s.items = stats['tokens_changed']
+        print(f"  {stats['tokens_changed']:,} token values in {stats['poems_changed']:,} poems, "
+              f"{len(delta['poems_added']):,} poems added, {len(delta['poems_removed']):,} removed")
+
+        if not args.no_verify:
+            base_md5 = base_sum.hexdigest(base.sections)
+            if not check_checksum('Base', base_md5, delta['base']['content_md5']):
+                print(f"  This delta applies to {delta['base']['file']} ({delta['base']['version']}); "
+                      f"not writing {args.output}", file=sys.stderr)
+                return 1
+            result_md5 = result_sum.hexdigest(patch_sections(base.sections, delta))
+            if not check_checksum('Result', result_md5, delta['target']['content_md5']):
+                print(f"  Not writing {args.output}", file=sys.stderr)
+                return 1
+        os.replace(tmp_path, args.output)
+    except (DeltaError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        writer.close()
+        tmp_path.unlink(missing_ok=True)
+
+    print(f"\nSaved: {args.output} ({delta['target']['version']}, {result_sum.count:,} poems)")
+    return 0
+
+
+def run_info(args) -> int:
+    delta = load_json(args.delta)
+    stats = delta['stats']
+    for side in ('base', 'target'):
+        info = delta[side]
+        print(f"{side.capitalize()}: {info['file']} ({info['version']}, {info['poems']:,} poems, "
+              f"content md5 {info['content_md5']})")
+    print(f"Created: {delta['created']}")
+    print(f"Tokens changed: {stats['tokens_changed']:,} in {stats['poems_changed']:,} poems")
+    print(f"Poems added / removed: {stats['poems_added']:,} / {stats['poems_removed']:,}")
+    for group in delta['changes'][:args.top]:
+        count = sum(len(indices) for _, indices in group['tokens'])
+        print(f"  {group['field']}: {group['old']!r} -> {group['new']!r}: {count:,} tokens "
+              f"in {len(group['tokens']):,} poems")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Token-level delta patches between poem index versions'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    diff_parser = subparsers.add_parser('diff', help='Write the delta from one index version to the next')
+    diff_parser.add_argument('--base', type=Path, required=True, help='Older poems index')
+    diff_parser.add_argument('--target', type=Path, required=True, help='Newer poems index')
+    diff_parser.add_argument('--output', type=Path, required=True, help='Delta file (.json.gz)')
+    pipeline_metrics.add_arguments(diff_parser)
+
+    patch_parser = subparsers.add_parser('patch', help='Apply a delta to the older index')
+    patch_parser.add_argument('--base', type=Path, required=True, help='Older poems index')
+    patch_parser.add_argument('--delta', type=Path, required=True, help='Delta file from diff')
+    patch_parser.add_argument('--output', type=Path, required=True, help='Patched poems index')
+    patch_parser.add_argument('--no-verify', action='store_true',
+                              help='Skip the base and result checksum checks')
+    pipeline_metrics.add_arguments(patch_parser)
+
+    info_parser = subparsers.add_parser('info', help='Summarise a delta file')
+    info_parser.add_argument('--delta', type=Path, required=True, help='Delta file')
+    info_parser.add_argument('--top', type=int, default=20, help='Change groups to list')
+
+    args = parser.parse_args()
+    if args.command == 'diff':
+        pipeline_metrics.from_args(args, 'corpus_delta_diff')
+        return run_diff(args)
+    if args.command == 'patch':
+        pipeline_metrics.from_args(args, 'corpus_delta_patch')
+        return run_patch(args)
+    return run_info(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Shared loaders and .npz encodings for the array-based corpus tools.
+
+- load_corpus(): the aggregate corpus (.json or .json.gz);
+- pack_json() / unpack_json(): a JSON value (vocabularies, labels, metadata)
+  as a uint8 array, so it can be stored next to numeric arrays;
+- string_table(): a string table as (UTF-8 data, int64 offsets) arrays;
+- pack_strings() / unpack_strings(): the same table as one uint8 array
+  (magic, count, offsets, data) for .npz files, so any character,
+  including newlines, may occur in a string.
+
+In Python:
+    arrays = {'keys': pack_strings(keys)}
+    np.savez_compressed('table.npz', **arrays)
+    keys = unpack_strings(np.load('table.npz')['keys'])
+"""
+
+import gzip
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+STRING_TABLE_MAGIC = b'\x00STRTBL1'
+
+
+def load_corpus(corpus_path: Path) -> dict:
+    """Load the corpus JSON file"""
+    print(f"Loading corpus from {corpus_path}...")
+    if str(corpus_path).endswith('.gz'):
+        with gzip.open(corpus_path, 'rt', encoding='utf-8') as f:
+            corpus = json.load(f)
+    else:
+        with open(corpus_path, 'r', encoding='utf-8') as f:
+            corpus = json.load(f)
+    print(f"✓ Loaded corpus with {len(corpus.get('words', {})):,} word forms")
+    return corpus
+
+
+def pack_json(value) -> np.ndarray:
+    return np.frombuffer(json.dumps(value, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+
+
+def unpack_json(packed: np.ndarray):
+    return json.loads(packed.tobytes().decode('utf-8'))
+
+
+def string_table(strings) -> tuple:
+    """(data, offsets) arrays: string i is data[offsets[i]:offsets[i + 1]] as UTF-8."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def pack_strings(strings: list) -> np.ndarray:
+    """Pack a string table into a single uint8 array (any character may occur)."""
+    data, offsets = string_table(strings)
+    payload = (STRING_TABLE_MAGIC + (len(offsets) - 1).to_bytes(8, 'little')
+               + offsets.tobytes() + data.tobytes())
+    return np.frombuffer(payload, dtype=np.uint8)
+
+
+def unpack_strings(packed: np.ndarray) -> list:
+    data = packed.tobytes()
+    if not data.startswith(STRING_TABLE_MAGIC):
+        # Newline-separated tables written before offsets were stored
+        text = data.decode('utf-8')
+        return text.split('\n') if text else []
+    start = len(STRING_TABLE_MAGIC)
+    count = int.from_bytes(data[start:start + 8], 'little')
+    offsets = np.frombuffer(data, dtype='<i8', count=count + 1, offset=start + 8).tolist()
+    base = start + 8 + 8 * (count + 1)
+    return [data[base + s:base + e].decode('utf-8') for s, e in zip(offsets, offsets[1:])]
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Sectioned aggregate corpus: one file per top-level section plus a manifest.
+
+corpus_full_source_poems_v2.json.gz and corpus_validation_improved.json.gz
+bundle words, lemma_index, ambiguous_words, method_analytics,
+quality_tiers and morphological_patterns in one JSON object, so a script
+that only needs method_analytics still decodes every word form. A
+sectioned corpus is a directory:
+
+    corpus_full_source_poems_v2.sections/
+        manifest.json            section order, file, size, md5, entry count
+        metadata.json.gz
+        words.json.gz
+        lemma_index.json.gz
+        ...
+
+and load_sections(path, sections=[...]) decodes only the requested
+sections (metadata is small and always included). Plain .json/.json.gz
+corpora are accepted too and loaded whole, so callers can take either.
+
+Usage:
+    python corpus_sections.py split --corpus corpus_full_source_poems_v2.json.gz
+    python corpus_sections.py info corpus_full_source_poems_v2.sections --time
+    python corpus_sections.py join corpus_full_source_poems_v2.sections --output corpus_rejoined.json.gz
+
+In Python:
+    corpus = load_sections('corpus_full_source_poems_v2.sections', ['method_analytics'])
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from rebuild_corpus_aggregates import load_json, save_json
+
+
+SECTIONS_FORMAT = 'corpus_sections'
+SECTIONS_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+ALWAYS_LOADED = ('metadata',)
+
+
+class SectionError(Exception):
+    """Missing section, missing file or checksum mismatch."""
+
+
+def file_md5(path: Path) -> str:
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def default_output(corpus_path: Path) -> Path:
+    name = corpus_path.name
+    for suffix in ('.json.gz', '.json'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return corpus_path.with_name(name + '.sections')
+
+
+def manifest_path(path: Path) -> Path:
+    path = Path(path)
+    return path if path.name == MANIFEST_NAME else path / MANIFEST_NAME
+
+
+def is_sectioned(path: Path) -> bool:
+    """True for a sectioned corpus directory (or its manifest.json)."""
+    return manifest_path(path).is_file()
+
+
+def read_manifest(path: Path) -> dict:
+    try:
+        with open(manifest_path(path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise SectionError(f"No {MANIFEST_NAME} in {path}") from None
+    if manifest.get('format') != SECTIONS_FORMAT:
+        raise SectionError(f"{path} is not a sectioned corpus")
+    if manifest.get('version') != SECTIONS_VERSION:
+        raise SectionError(f"{path}: unsupported version {manifest.get('version')}")
+    return manifest
+
+
+def split_corpus(corpus: dict, output_dir: Path, source: str = None) -> dict:
+    """Write every top-level section of a corpus to its own file and return the manifest."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sections = {}
+    for name, value in corpus.items():
+        file_name = f"{name}.json.gz"
+        path = output_dir / file_name
+        save_json(value, path)
+        sections[name] = {
+            'file': file_name,
+            'bytes': path.stat().st_size,
+            'md5': file_md5(path),
+            'entries': len(value) if isinstance(value, (dict, list)) else None
+        }
+    manifest = {
+        'format': SECTIONS_FORMAT,
+        'version': SECTIONS_VERSION,
+        'source': source,
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'order': list(corpus),
+        'sections': sections
+    }
+    with open(output_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def available_sections(path: Path) -> list:
+    """Section names of a sectioned corpus, in their original order."""
+    return read_manifest(path)['order']
+
+
+def load_sections(path: Path, sections=None, verify: bool = False) -> dict:
+    """
+    Load the given sections of a corpus (all when sections is None).
+
+    Args:
+        path: sectioned corpus directory, its manifest, or a plain .json/.json.gz corpus
+        sections: section names; metadata is always included when present
+        verify: check each section file's md5 against the manifest
+
+    Returns:
+        dict: the requested sections, in the corpus's original key order
+    """
+    path = Path(path)
+    if not is_sectioned(path):
+        corpus = load_json(path)
+        if sections is None:
+            return corpus
+        wanted = set(sections) | set(ALWAYS_LOADED)
+        return {name: value for name, value in corpus.items() if name in wanted}
+
+    manifest = read_manifest(path)
+    directory = manifest_path(path).parent
+    order = manifest['order']
+    if sections is None:
+        wanted = set(order)
+    else:
+        missing = [name for name in sections if name not in manifest['sections']]
+        if missing:
+            raise SectionError(f"{path} has no section(s) {', '.join(missing)} "
+                               f"(available: {', '.join(order)})")
+        wanted = set(sections) | (set(ALWAYS_LOADED) & set(order))
+
+    corpus = {}
+    for name in order:
+        if name not in wanted:
+            continue
+        entry = manifest['sections'][name]
+        section_path = directory / entry['file']
+        if not section_path.is_file():
+            raise SectionError(f"Missing section file {section_path}")
+        if verify and file_md5(section_path) != entry['md5']:
+            raise SectionError(f"Checksum mismatch for section {name} ({section_path})")
+        corpus[name] = load_json(section_path)
+    return corpus
+
+
+def run_split(args):
+    output = args.output or default_output(args.corpus)
+    print(f"Loading corpus from {args.corpus}...")
+    corpus = load_json(args.corpus)
+    print(f"\nWriting {len(corpus)} sections to {output}/...")
+    manifest = split_corpus(corpus, output, source=args.corpus.name)
+    for name in manifest['order']:
+        entry = manifest['sections'][name]
+        entries = f"{entry['entries']:,}" if entry['entries'] is not None else '-'
+        print(f"  {name:25s} {entries:>10} entries {entry['bytes'] / (1024 * 1024):>9.2f} MB")
+    print(f"✓ Saved {output / MANIFEST_NAME}")
+    return 0
+
+
+def run_info(args):
+    manifest = read_manifest(args.path)
+    print(f"\n📦 {args.path} (from {manifest.get('source')}, created {manifest['created']})")
+    header = f"  {'Section':25s} {'Entries':>10} {'MB':>9}"
+    print(header + (f" {'Load (s)':>9}" if args.time else ''))
+    for name in manifest['order']:
+        entry = manifest['sections'][name]
+        entries = f"{entry['entries']:,}" if entry['entries'] is not None else '-'
+        line = f"  {name:25s} {entries:>10} {entry['bytes'] / (1024 * 1024):>9.2f}"
+        if args.time:
+            start = time.perf_counter()
+            load_json(manifest_path(args.path).parent / entry['file'])
+            line += f" {time.perf_counter() - start:>9.2f}"
+        print(line)
+    return 0
+
+
+def run_join(args):
+    print(f"Loading all sections of {args.path}...")
+    corpus = load_sections(args.path, verify=not args.no_verify)
+    save_json(corpus, args.output)
+    print(f"✓ Saved {args.output} ({len(corpus)} sections)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Split an aggregate corpus into independently loadable sections'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    split_parser = subparsers.add_parser('split', help='Write one file per section plus a manifest')
+    split_parser.add_argument('--corpus', type=Path, required=True, help='Aggregate corpus JSON (.json or .json.gz)')
+    split_parser.add_argument('--output', type=Path, default=None,
+                              help='Output directory (default: <corpus>.sections next to the input)')
+
+    info_parser = subparsers.add_parser('info', help='List the sections of a sectioned corpus')
+    info_parser.add_argument('path', type=Path, help='Sectioned corpus directory')
+    info_parser.add_argument('--time', action='store_true', help='Time loading each section')
+
+    join_parser = subparsers.add_parser('join', help='Reassemble a single corpus file')
+    join_parser.add_argument('path', type=Path, help='Sectioned corpus directory')
+    join_parser.add_argument('--output', type=Path, required=True, help='Output corpus (.json or .json.gz)')
+    join_parser.add_argument('--no-verify', action='store_true', help='Skip section checksums')
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'split':
+            return run_split(args)
+        if args.command == 'info':
+            return run_info(args)
+        return run_join(args)
+    except SectionError as e:
+        print(f"⚠ {e}")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+Local HTTP/JSON query service over one warm in-memory corpus.
+
+Loads the poem index (v1-v4) and, optionally, the aggregate corpus once
+and serves them to any number of clients (annotation UI, notebooks):
+
+    GET /poem/<poem_id>                       poem with v2-style annotations
+    GET /word/<word form>                     aggregate entry (lookup_word in basic_usage.py)
+    GET /lemma/<lemma>?top=20                 word forms of a lemma (find_lemma_variants)
+    GET /concordance?lemma=piir&width=5       keyword-in-context lines
+        (or word=...; optional pos=, method=, min_confidence=, limit=, offset=)
+    GET /poems?place=Karksi&decade=1890s      poem ids matching facet filters
+        (place, decade, collector, collection, lemma, word; limit=, offset=)
+    GET /metrics                              request latency and cache statistics
+
+The token stream is encoded once into TokenArrays (corpus_arrays.py).
+Concordance and facet queries run in a process pool of forked workers
+that share the loaded arrays copy-on-write; the small lookups are answered
+on the event loop. Responses are kept in an LRU cache, and identical
+queries in flight at the same time share one computation.
+
+Usage:
+    python corpus_server.py --poems-index poems_index_v3.json.gz \
+        --corpus corpus_full_source_poems_v2.json.gz --port 8765
+
+    curl 'http://127.0.0.1:8765/concordance?lemma=piir&limit=5'
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from corpus_arrays import encode_poem_index
+from facet_matrices import FACETS, facet_values
+from poem_index_v4 import PoemView
+from rebuild_corpus_aggregates import load_json
+
+
+MAX_LIMIT = 1000
+LATENCY_WINDOW = 1000
+
+# Loaded once in the server process; forked workers inherit it
+_STATE = {}
+
+
+class QueryError(Exception):
+    """Bad request or missing entry; carries the HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def init_state(index: dict, corpus: dict = None):
+    """Encode the token arrays and set up the shared query state."""
+    arrays = encode_poem_index(index)
+    _STATE.clear()
+    _STATE.update({
+        'index': index,
+        'corpus': corpus,
+        'arrays': arrays,
+        'poem_of_token': arrays.poem_of_token(),
+        'vocab_lookup': {field: {value: code for code, value in enumerate(values)}
+                         for field, values in arrays.vocab.items()}
+    })
+    return arrays
+
+
+def _int_param(params: dict, name: str, default: int, maximum: int = None) -> int:
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise QueryError(400, f"{name} must be an integer")
+    if value < 0:
+        raise QueryError(400, f"{name} must not be negative")
+    return min(value, maximum) if maximum is not None else value
+
+
+def _require_corpus() -> dict:
+    corpus = _STATE['corpus']
+    if corpus is None:
+        raise QueryError(503, "aggregate corpus not loaded (start with --corpus)")
+    return corpus
+
+
+def query_poem(poem_id: str) -> dict:
+    poem = _STATE['index']['poems'].get(poem_id)
+    if poem is None:
+        raise QueryError(404, f"poem {poem_id} not found")
+    return {'poem_id': poem_id, **PoemView(poem).to_v2()}
+
+
+def query_word(word: str) -> dict:
+    """Aggregate entry of a word form, with its ambiguity record if any."""
+    corpus = _require_corpus()
+    data = corpus['words'].get(word)
+    if data is None:
+        raise QueryError(404, f"word '{word}' not found")
+    result = {key: value for key, value in data.items() if key != 'source_poems'}
+    result['word'] = word
+    result['source_poem_count'] = len(data.get('source_poems', []))
+    ambiguous = corpus.get('ambiguous_words', {}).get(word)
+    if ambiguous is not None:
+        result['ambiguous'] = ambiguous
+    return result
+
+
+def query_lemma(lemma: str, params: dict) -> dict:
+    """Word forms of a lemma, most frequent first."""
+    corpus = _require_corpus()
+    data = corpus['lemma_index'].get(lemma)
+    if data is None:
+        raise QueryError(404, f"lemma '{lemma}' not found")
+    top = _int_param(params, 'top', 20, MAX_LIMIT)
+    form_dist = data.get('form_distribution', {})
+    variants = sorted(form_dist.items(), key=lambda x: -x[1]['count'])[:top]
+    return {
+        'lemma': lemma,
+        'total_occurrences': data['total_occurrences'],
+        'word_forms': data['word_forms'],
+        'form_distribution': [{'word': word_form, **stats} for word_form, stats in variants]
+    }
+
+
+def _token_mask(params: dict) -> np.ndarray:
+    """Boolean token mask for lemma/word/pos/method/min_confidence filters."""
+    arrays = _STATE['arrays']
+    lookup = _STATE['vocab_lookup']
+    mask = None
+    for param, field in (('lemma', 'lemma'), ('word', 'word'), ('pos', 'pos'), ('method', 'method')):
+        if param not in params:
+            continue
+        code = lookup[field].get(params[param])
+        if code is None:
+            return np.zeros(arrays.num_tokens, dtype=bool)
+        selected = arrays.codes[field] == code
+        mask = selected if mask is None else mask & selected
+    if 'min_confidence' in params:
+        try:
+            selected = arrays.confidence >= np.float32(params['min_confidence'])
+        except ValueError:
+            raise QueryError(400, "min_confidence must be a number")
+        mask = selected if mask is None else mask & selected
+    return mask
+
+
+def query_concordance(params: dict) -> dict:
+    """Keyword-in-context lines for a lemma or word form."""
+    if 'lemma' not in params and 'word' not in params:
+        raise QueryError(400, "give lemma= or word=")
+    arrays = _STATE['arrays']
+    width = _int_param(params, 'width', 5, 50)
+    limit = _int_param(params, 'limit', 50, MAX_LIMIT)
+    offset = _int_param(params, 'offset', 0)
+
+    hits = np.flatnonzero(_token_mask(params))
+    words = arrays.vocab['word']
+    word_codes = arrays.codes['word']
+    offsets = arrays.poem_offsets
+    poem_of_token = _STATE['poem_of_token']
+
+    lines = []
+    for position in hits[offset:offset + limit]:
+        poem = poem_of_token[position]
+        start, end = offsets[poem], offsets[poem + 1]
+        left_start = max(start, position - width)
+        right_end = min(end, position + width + 1)
+        lines.append({
+            'poem_id': arrays.poem_ids[poem],
+            'word_index': int(position - start),
+            'verse_index': int(arrays.verse[position]),
+            'left': ' '.join(words[c] for c in word_codes[left_start:position]),
+            'keyword': words[word_codes[position]],
+            'right': ' '.join(words[c] for c in word_codes[position + 1:right_end]),
+            'lemma': arrays.vocab['lemma'][arrays.codes['lemma'][position]],
+            'pos': arrays.vocab['pos'][arrays.codes['pos'][position]],
+            'form': arrays.vocab['form'][arrays.codes['form'][position]]
+        })
+    return {
+        'total_hits': int(hits.size),
+        'total_poems': int(np.unique(poem_of_token[hits]).size),
+        'offset': offset,
+        'lines': lines
+    }
+
+
+def query_poems(params: dict) -> dict:
+    """Poem ids matching all facet and token filters."""
+    arrays = _STATE['arrays']
+    limit = _int_param(params, 'limit', 100, MAX_LIMIT * 10)
+    offset = _int_param(params, 'offset', 0)
+
+    selected = np.ones(arrays.num_poems, dtype=bool)
+    facet_filters = {facet: params[facet] for facet in FACETS if facet in params}
+    if facet_filters:
+        for poem, metadata in enumerate(arrays.poem_metadata):
+            for facet, value in facet_filters.items():
+                if value not in facet_values(metadata, facet):
+                    selected[poem] = False
+                    break
+
+    mask = _token_mask(params)
+    if mask is not None:
+        with_tokens = np.zeros(arrays.num_poems, dtype=bool)
+        with_tokens[_STATE['poem_of_token'][mask]] = True
+        selected &= with_tokens
+
+    ordinals = np.flatnonzero(selected)
+    return {
+        'total_poems': int(ordinals.size),
+        'offset': offset,
+        'poem_ids': [arrays.poem_ids[i] for i in ordinals[offset:offset + limit]]
+    }
+
+
+# Endpoints answered in the worker pool
+POOL_QUERIES = {'concordance': query_concordance, 'poems': query_poems}
+
+ENDPOINTS = {'index', 'poem', 'word', 'lemma', 'metrics', *POOL_QUERIES}
+
+
+def run_pooled_query(name: str, params: dict):
+    """Worker entry point: returns (status, result)."""
+    try:
+        return 200, POOL_QUERIES[name](params)
+    except QueryError as e:
+        return e.status, {'error': str(e)}
+
+
+class ResponseCache:
+    """LRU cache of encoded responses keyed by request target."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class LatencyMetrics:
+    """Request counts and latency percentiles per endpoint."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.cached = defaultdict(int)
+        self.coalesced = defaultdict(int)
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def record(self, endpoint: str, seconds: float, status: int, source: str):
+        """source: 'computed', 'cached' (response cache) or 'coalesced' (shared in-flight computation)."""
+        self.requests[endpoint] += 1
+        self.errors[endpoint] += status >= 400
+        self.cached[endpoint] += source == 'cached'
+        self.coalesced[endpoint] += source == 'coalesced'
+        self.latencies[endpoint].append(seconds * 1000)
+
+    def summary(self) -> dict:
+        endpoints = {}
+        for endpoint, count in sorted(self.requests.items()):
+            latencies = np.fromiter(self.latencies[endpoint], dtype=np.float64)
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            endpoints[endpoint] = {
+                'requests': count,
+                'errors': self.errors[endpoint],
+                'cached': self.cached[endpoint],
+                'coalesced': self.coalesced[endpoint],
+                'latency_ms': {'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3),
+                               'max': round(float(latencies.max()), 3)}
+            }
+        return {'uptime_s': round(time.time() - self.started, 1), 'endpoints': endpoints}
+
+
+class CorpusServer:
+    """asyncio HTTP/1.1 server dispatching GET requests to the query functions."""
+
+    def __init__(self, executor=None, cache_size: int = 1024):
+        self.executor = executor
+        self.cache = ResponseCache(cache_size)
+        self.metrics = LatencyMetrics()
+        self.pending = {}
+
+    async def dispatch(self, target: str) -> tuple:
+        """Answer one request target; returns (endpoint, status, body bytes, source)."""
+        parts = urlsplit(target)
+        segments = [unquote(s) for s in parts.path.strip('/').split('/', 1)]
+        endpoint = segments[0] or 'index'
+        if endpoint not in ENDPOINTS:
+            return 'unknown', 404, _encode({'error': f"unknown endpoint /{endpoint}"}), 'computed'
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+        if endpoint == 'metrics':
+            summary = self.metrics.summary()
+            summary['cache'] = {'entries': len(self.cache.entries), 'hits': self.cache.hits,
+                                'misses': self.cache.misses}
+            return endpoint, 200, _encode(summary), 'computed'
+
+        key = (parts.path, tuple(sorted(params.items())))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return endpoint, cached[0], cached[1], 'cached'
+
+        # Identical requests in flight share one computation
+        if key in self.pending:
+            status, body = await asyncio.shield(self.pending[key])
+            return endpoint, status, body, 'coalesced'
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            try:
+                status, result = await self.compute(endpoint, segments, params)
+            except Exception as e:
+                status, result = 500, {'error': f"{type(e).__name__}: {e}"}
+            body = _encode(result)
+            if status == 200:
+                self.cache.put(key, (status, body))
+            future.set_result((status, body))
+        finally:
+            del self.pending[key]
+            if not future.done():
+                # This request was cancelled (client gone, shutdown); waiters must not hang
+                future.set_result((503, _encode({'error': 'computation was cancelled, retry'})))
+        return endpoint, status, body, 'computed'
+
+    async def compute(self, endpoint: str, segments: list, params: dict) -> tuple:
+        if endpoint in POOL_QUERIES:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, run_pooled_query, endpoint, params)
+        try:
+            if endpoint == 'index':
+                return 200, {'endpoints': ['/poem/<id>', '/word/<form>', '/lemma/<lemma>',
+                                           '/concordance', '/poems', '/metrics'],
+                             'poems': len(_STATE['index']['poems']),
+                             'tokens': _STATE['arrays'].num_tokens,
+                             'corpus_loaded': _STATE['corpus'] is not None}
+            if len(segments) < 2 or not segments[1]:
+                raise QueryError(400, f"usage: /{endpoint}/<{endpoint}>")
+            if endpoint == 'poem':
+                return 200, query_poem(segments[1])
+            if endpoint == 'word':
+                return 200, query_word(segments[1])
+            return 200, query_lemma(segments[1], params)
+        except QueryError as e:
+            return e.status, {'error': str(e)}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, _encode({'error': 'malformed request line'}), False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+
+                if method not in ('GET', 'HEAD'):
+                    await self.respond(writer, 405, _encode({'error': 'only GET is supported'}), keep_alive)
+                else:
+                    start = time.perf_counter()
+                    endpoint, status, body, source = await self.dispatch(target)
+                    self.metrics.record(endpoint, time.perf_counter() - start, status, source)
+                    await self.respond(writer, status, b'' if method == 'HEAD' else body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status: int, body: bytes, keep_alive: bool):
+        reason = HTTP_REASONS.get(status, 'Error')
+        head = (f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Access-Control-Allow-Origin: *\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+def _encode(result) -> bytes:
+    return json.dumps(result, ensure_ascii=False).encode('utf-8')
+
+
+def make_executor(workers: int):
+    """Process pool of forked workers, or None to use the default thread pool."""
+    if workers <= 0:
+        return None
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        print("⚠ fork is not available here; running heavy queries in threads")
+        return None
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+    # Start the workers now, while the parent holds only the loaded corpus
+    for future in [executor.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return executor
+
+
+async def serve(args, executor):
+    server = CorpusServer(executor, cache_size=args.cache_size)
+    tcp_server = await asyncio.start_server(server.handle_connection, args.host, args.port)
+    print(f"\n✓ Serving on http://{args.host}:{args.port}/ (Ctrl+C to stop)")
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Local HTTP/JSON query service over the poem index and aggregate corpus'
+    )
+    parser.add_argument('--poems-index', type=Path, default=Path('poems_index_v3.json.gz'),
+                        help='Poems index (v1-v4)')
+    parser.add_argument('--corpus', type=Path, default=None,
+                        help='Aggregate corpus for /word and /lemma')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port (default: 8765)')
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1),
+                        help='Worker processes for concordance/facet queries (0 = threads)')
+    parser.add_argument('--cache-size', type=int, default=1024,
+                        help='Cached responses (LRU, default: 1024)')
+
+    args = parser.parse_args()
+
+    print(f"Loading {args.poems_index}...")
+    index = load_json(args.poems_index)
+    corpus = None
+    if args.corpus:
+        print(f"Loading {args.corpus}...")
+        corpus = load_json(args.corpus)
+    print("Encoding token arrays...")
+    arrays = init_state(index, corpus)
+    print(f"  {arrays.num_poems:,} poems, {arrays.num_tokens:,} tokens"
+          + (f", {len(corpus['words']):,} word forms" if corpus else ""))
+
+    executor = make_executor(args.workers)
+    try:
+        asyncio.run(serve(args, executor))
+    except KeyboardInterrupt:
+        print("\nStopped")
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
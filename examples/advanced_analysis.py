@@ -8,21 +8,67 @@ This script demonstrates more sophisticated linguistic analysis:
 - Quality assessment
 - Method performance comparison
 - Dialectal variation detection
+
+With --cube (built by analytics_cube.py), the POS, morphological form,
+quality and method analyses are answered from the precomputed cube
+instead of scanning the corpus:
+
+    python ../analytics_cube.py build --poems-index ../poems_index_v3.json.gz \
+        --output ../analytics_cube.npz
+    python advanced_analysis.py --cube ../analytics_cube.npz
+
+With a sectioned corpus (corpus_sections.py), only the sections the
+selected analyses read are loaded:
+
+    python ../corpus_sections.py split --corpus ../corpus_unknown_reduced.json.gz
+    python advanced_analysis.py --corpus ../corpus_unknown_reduced.sections --analyses methods ambiguity
 """
 
-import json
-import gzip
 import sqlite3
+import argparse
+import sys
+from pathlib import Path
 from collections import Counter, defaultdict
 
-def analyze_pos_patterns(corpus):
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+ANALYSES = ('pos', 'forms', 'quality', 'methods', 'dialectal', 'ambiguity')
+
+# Corpus sections each analysis reads; the first four fall back to
+# aggregating 'words' when the precomputed section is missing
+ANALYSIS_SECTIONS = {
+    'pos': 'method_analytics',
+    'forms': 'morphological_patterns',
+    'quality': 'quality_tiers',
+    'methods': 'method_analytics',
+    'dialectal': 'lemma_index',
+    'ambiguity': 'ambiguous_words'
+}
+
+def analyze_pos_patterns(corpus, cube=None):
     """Analyze part-of-speech tag patterns in the corpus"""
     print("\n" + "="*60)
     print("POS TAG ANALYSIS")
     print("="*60)
 
+    if cube is not None:
+        pos_counts = cube.rollup(['pos'])
+        pos_lemmas = cube.rollup(['pos'], 'lemma_types')
+        total = cube.total_tokens
+
+        print("\nPOS tag distribution (from analytics cube):")
+        for (pos,), count in list(pos_counts.items())[:15]:
+            percentage = (count / total) * 100
+            print(f"  {pos:10s}: {count:>8,} ({percentage:>5.2f}%) "
+                  f"[{pos_lemmas.get((pos,), 0):,} lemmas]")
+
+        print("\nPOS diversity by processing method:")
+        method_pos = cube.rollup(['method', 'pos'])
+        for (method,), total_method in cube.rollup(['method']).items():
+            unique_pos = sum(1 for (m, _) in method_pos if m == method)
+            print(f"  {method:20s}: {unique_pos:2d} different POS tags ({total_method:>8,} words)")
     # Use method_analytics from corpus if available
-    if 'method_analytics' in corpus:
+    elif 'method_analytics' in corpus:
         print("\nMethod distribution (from corpus analytics):")
         metadata = corpus.get('metadata', {})
         for method, data in sorted(corpus['method_analytics'].items(),
@@ -67,14 +113,26 @@ def analyze_pos_patterns(corpus):
                 total_method = sum(pos_by_method[method].values())
                 print(f"  {method:20s}: {unique_pos:2d} different POS tags ({total_method:>8,} words)")
 
-def analyze_morphological_forms(corpus):
+def analyze_morphological_forms(corpus, cube=None):
     """Analyze morphological form patterns"""
     print("\n" + "="*60)
     print("MORPHOLOGICAL FORM ANALYSIS")
     print("="*60)
 
+    if cube is not None:
+        form_methods = cube.rollup(['form', 'method'])
+        print("\nMost common morphological forms (from analytics cube):")
+        for (form,), count in list(cube.rollup(['form']).items())[:20]:
+            print(f"  {form or '(none)':15s}: {count:>8,}")
+            top_methods = [(m, c) for (f, m), c in form_methods.items() if f == form][:3]
+            method_str = ', '.join(f"{m}({c / count * 100:.0f}%)" for m, c in top_methods)
+            print(f"    Methods: {method_str}")
+
+        summary = cube.summary
+        print(f"\nAverage forms per word: {summary['avg_forms_per_word']:.2f}")
+        print(f"Words with multiple forms: {summary['words_with_multiple_forms']:,}")
     # Use morphological_patterns from corpus if available
-    if 'morphological_patterns' in corpus:
+    elif 'morphological_patterns' in corpus:
         print("\nMost common morphological forms (from corpus analytics):")
         for form, data in list(corpus['morphological_patterns'].items())[:20]:
             print(f"  {form:15s}: {data['total_count']:>8,}")
@@ -106,14 +164,23 @@ def analyze_morphological_forms(corpus):
         print(f"\nAverage forms per word: {avg_forms:.2f}")
         print(f"Words with multiple forms: {sum(1 for f in forms_per_word if f > 1):,}")
 
-def analyze_quality_vs_frequency(corpus):
+def analyze_quality_vs_frequency(corpus, cube=None):
     """Analyze relationship between quality tiers and word frequency"""
     print("\n" + "="*60)
     print("QUALITY VS FREQUENCY ANALYSIS")
     print("="*60)
 
+    if cube is not None:
+        print("\nQuality tier statistics (from analytics cube):")
+        for quality, stats in cube.summary['word_tiers'].items():
+            avg_freq = stats['total_freq'] / stats['count'] if stats['count'] > 0 else 0
+            print(f"\n  {quality}:")
+            print(f"    Unique words: {stats['count']:,}")
+            print(f"    Total instances: {stats['total_freq']:,}")
+            print(f"    Average frequency: {avg_freq:.1f}")
+            print(f"    High-frequency words (>100): {stats['high_freq']:,}")
     # Use quality_tiers from corpus if available
-    if 'quality_tiers' in corpus:
+    elif 'quality_tiers' in corpus:
         print("\nQuality tier statistics (from corpus analytics):")
         for tier, data in corpus['quality_tiers'].items():
             print(f"\n  {tier}:")
@@ -168,14 +235,35 @@ def analyze_quality_vs_frequency(corpus):
                 print(f"    Average frequency: {avg_freq:.1f}")
                 print(f"    High-frequency words (>100): {stats['high_freq']:,}")
 
-def compare_method_performance(corpus):
+def compare_method_performance(corpus, cube=None):
     """Compare performance of different processing methods"""
     print("\n" + "="*60)
     print("METHOD PERFORMANCE COMPARISON")
     print("="*60)
 
+    if cube is not None:
+        from analytics_cube import METHOD_BANDS
+
+        print("\nMethod performance (from analytics cube):")
+        total = cube.total_tokens
+        avg_confidence = cube.avg_confidence(['method'])
+        method_bands = cube.rollup(['method', 'band'])
+        method_pos = cube.rollup(['method', 'pos'])
+        for (method,), count in cube.rollup(['method']).items():
+            print(f"\n  {method}:")
+            print(f"    Total uses: {count:,} ({count / total * 100:.1f}%)")
+            print(f"    Average confidence: {avg_confidence[(method,)]:.3f}")
+            conf_dist = {
+                name: sum(method_bands.get((method, band), 0) for band in bands) / count * 100
+                for name, bands in METHOD_BANDS.items()
+            }
+            print(f"    Confidence: high={conf_dist['high']:.1f}%, "
+                  f"medium={conf_dist['medium']:.1f}%, "
+                  f"low={conf_dist['low']:.1f}%")
+            top_pos = [(p, c) for (m, p), c in method_pos.items() if m == method][:3]
+            print(f"    Top POS: {', '.join(f'{pos}({c:,})' for pos, c in top_pos)}")
     # Use method_analytics directly if available
-    if 'method_analytics' in corpus:
+    elif 'method_analytics' in corpus:
         print("\nMethod performance (from corpus analytics):")
         metadata = corpus.get('metadata', {})
         for method, data in sorted(corpus['method_analytics'].items(),
@@ -195,7 +283,8 @@ def compare_method_performance(corpus):
             # Top POS
             if 'by_pos' in data and data['by_pos']:
                 top_pos = sorted(data['by_pos'].items(), key=lambda x: -x[1]['count'])[:3]
-                print(f"    Top POS: {', '.join(f'{pos}({stats['count']:,})' for pos, stats in top_pos)}")
+                pos_str = ', '.join(f"{pos}({stats['count']:,})" for pos, stats in top_pos)
+                print(f"    Top POS: {pos_str}")
     else:
         print("\nMethod analytics not available in corpus")
 
@@ -262,18 +351,60 @@ def analyze_ambiguity_patterns(corpus):
 
 def main():
     """Run advanced analyses"""
-    print("Loading corpus...")
-    with gzip.open('../corpus_unknown_reduced.json.gz', 'rt', encoding='utf-8') as f:
-        corpus = json.load(f)
-    print(f"✅ Loaded corpus with {len(corpus['words']):,} unique words")
+    parser = argparse.ArgumentParser(description='Advanced corpus analyses')
+    parser.add_argument('--corpus', default=None,
+                        help='Aggregate corpus file or sectioned corpus directory '
+                             '(default: ../corpus_unknown_reduced.json.gz, or none when --cube is given)')
+    parser.add_argument('--cube', default=None,
+                        help='Analytics cube from analytics_cube.py for instant POS, form, '
+                             'quality and method analyses')
+    parser.add_argument('--analyses', nargs='+', choices=ANALYSES, default=list(ANALYSES),
+                        help='Analyses to run (default: all)')
+    args = parser.parse_args()
+    analyses = set(args.analyses)
+
+    cube = None
+    if args.cube:
+        from analytics_cube import AnalyticsCube
+        cube = AnalyticsCube.load(args.cube)
+        print(f"✅ Loaded analytics cube with {cube.total_tokens:,} tokens")
+
+    corpus = {}
+    corpus_path = args.corpus or (None if cube is not None else '../corpus_unknown_reduced.json.gz')
+    if corpus_path:
+        from corpus_sections import available_sections, is_sectioned, load_sections
+
+        print("Loading corpus...")
+        if is_sectioned(corpus_path):
+            available = set(available_sections(corpus_path))
+            cube_answers = {'pos', 'forms', 'quality', 'methods'} if cube is not None else set()
+            sections = set()
+            for analysis in analyses - cube_answers:
+                section = ANALYSIS_SECTIONS[analysis]
+                if section in available:
+                    sections.add(section)
+                elif analysis in ('pos', 'forms', 'quality'):
+                    sections.add('words')
+            corpus = load_sections(corpus_path, sorted(sections))
+            print(f"✅ Loaded corpus sections: {', '.join(corpus)}")
+        else:
+            corpus = load_sections(corpus_path)
+            print(f"✅ Loaded corpus with {len(corpus['words']):,} unique words")
 
     # Run analyses
-    analyze_pos_patterns(corpus)
-    analyze_morphological_forms(corpus)
-    analyze_quality_vs_frequency(corpus)
-    compare_method_performance(corpus)
-    find_dialectal_variants(corpus, 'piir')
-    analyze_ambiguity_patterns(corpus)
+    if 'pos' in analyses:
+        analyze_pos_patterns(corpus, cube)
+    if 'forms' in analyses:
+        analyze_morphological_forms(corpus, cube)
+    if 'quality' in analyses:
+        analyze_quality_vs_frequency(corpus, cube)
+    if 'methods' in analyses:
+        compare_method_performance(corpus, cube)
+    if corpus:
+        if 'dialectal' in analyses:
+            find_dialectal_variants(corpus, 'piir')
+        if 'ambiguity' in analyses:
+            analyze_ambiguity_patterns(corpus)
 
     print("\n" + "="*60)
     print("Analysis complete!")
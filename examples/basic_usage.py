@@ -8,17 +8,24 @@ This script demonstrates fundamental operations with the corpus:
 - Finding lemma variants
 - Analyzing ambiguous words
 - Extracting statistics
+
+The corpus is cached on disk by corpus_cache.py with one entry per word
+form and lemma, so repeated runs decode only the entries they look up
+(set RUNOSONG_NO_CACHE=1 to bypass the cache).
 """
 
-import json
-import gzip
+import sys
+from pathlib import Path
 from collections import Counter
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from corpus_cache import load_lazy
+
 def load_corpus(path='../corpus_unknown_reduced.json.gz'):
-    """Load the compressed JSON corpus"""
+    """Load the compressed JSON corpus (entries decoded on access through the corpus cache)"""
     print(f"Loading corpus from {path}...")
-    with gzip.open(path, 'rt', encoding='utf-8') as f:
-        corpus = json.load(f)
+    corpus = load_lazy(path, ['words', 'lemma_index', 'ambiguous_words'])
     print(f"✅ Loaded corpus with {len(corpus['words']):,} unique word forms")
     return corpus
 
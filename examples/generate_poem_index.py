@@ -34,10 +34,16 @@ Output structure:
 import json
 import gzip
 import argparse
+import sys
 from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pipeline_metrics
+from pipeline_metrics import stage
+
 
 def process_batch_file(batch_path):
     """Extract poem data from a single batch file"""
@@ -114,18 +120,19 @@ def generate_poem_index(batch_dir, output_path, sample_size=None):
     stats = defaultdict(int)
 
     # Process each batch file
-    for batch_path in tqdm(batch_files, desc="Processing batches"):
-        poems = process_batch_file(batch_path)
-
-        # Merge poems (shouldn't have duplicates, but check)
-        for poem_id, poem_data in poems.items():
-            if poem_id in all_poems:
-                stats['duplicates'] += 1
-                print(f"Warning: Duplicate poem_id {poem_id} found")
-            else:
-                all_poems[poem_id] = poem_data
-                stats['total_poems'] += 1
-                stats['total_words'] += poem_data['num_words']
+    with stage('process_batches', items=len(batch_files)):
+        for batch_path in tqdm(batch_files, desc="Processing batches"):
+            poems = process_batch_file(batch_path)
+
+            # Merge poems (shouldn't have duplicates, but check)
+            for poem_id, poem_data in poems.items():
+                if poem_id in all_poems:
+                    stats['duplicates'] += 1
+                    print(f"Warning: Duplicate poem_id {poem_id} found")
+                else:
+                    all_poems[poem_id] = poem_data
+                    stats['total_poems'] += 1
+                    stats['total_words'] += poem_data['num_words']
 
     # Create index with metadata
     index = {
@@ -145,8 +152,9 @@ def generate_poem_index(batch_dir, output_path, sample_size=None):
     output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with gzip.open(output_path, 'wt', encoding='utf-8') as f:
-        json.dump(index, f, ensure_ascii=False, indent=2)
+    with stage('save', items=stats['total_poems']):
+        with gzip.open(output_path, 'wt', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
 
     # Print statistics
     print("\n" + "="*60)
@@ -186,8 +194,10 @@ def main():
         type=int,
         help='Process only first N batches (for testing)'
     )
+    pipeline_metrics.add_arguments(parser)
 
     args = parser.parse_args()
+    pipeline_metrics.from_args(args, 'generate_poem_index')
 
     # Validate batch directory
     batch_dir = Path(args.batch_dir)
@@ -21,21 +21,29 @@ Usage examples:
 
     # Export poem to JSON
     python view_poem.py 89248 --export poem_89248.json
+
+The index is cached on disk by corpus_cache.py with one entry per poem, so
+only the first run after the index changes pays for decompressing and
+parsing it, and later runs decode just the poems they show (--no-cache
+bypasses the cache).
 """
 
 import json
-import gzip
 import argparse
 import random
+import sys
 from pathlib import Path
 from collections import defaultdict
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from corpus_cache import load_lazy
 
-def load_poem_index(index_path='../poems_index.json.gz'):
-    """Load the compressed poem index"""
+
+def load_poem_index(index_path='../poems_index.json.gz', use_cache=True):
+    """Load the compressed poem index (poems decoded on access through the corpus cache)"""
     print(f"Loading poem index from {index_path}...")
-    with gzip.open(index_path, 'rt', encoding='utf-8') as f:
-        index = json.load(f)
+    index = load_lazy(index_path, ['poems'], use_cache=use_cache)
     print(f"✅ Loaded {index['metadata']['total_poems']:,} poems")
     return index
 
@@ -243,10 +251,16 @@ def main():
         help='Export poem to JSON file'
     )
 
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Parse the index file directly instead of using the decoded-corpus cache'
+    )
+
     args = parser.parse_args()
 
     # Load index
-    index = load_poem_index(args.index)
+    index = load_poem_index(args.index, use_cache=not args.no_cache)
 
     # Show statistics
     if args.list_stats:
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Facet x lemma sparse count matrices (place, decade, collector, collection).
+
+Precomputes, from the integer-encoded token stream (corpus_arrays.py):
+
+- place x lemma        from metadata.places
+- decade x lemma       from metadata.year (first four-digit year)
+- collector x lemma    from metadata.collectors
+- collection x lemma   from metadata.collection
+
+Each matrix is F^T P, where F is the sparse poem x facet-value incidence
+matrix and P the poem x lemma token count matrix. Facet totals (tokens
+and poems per facet value) are stored alongside, so distributions can be
+normalised by subcorpus size. A poem with several places or collectors
+counts in full for each of them.
+
+Usage:
+    # Build once
+    python facet_matrices.py build --poems-index corpus_arrays.npz \
+        --output facet_matrices.npz
+
+    # Where does 'kuldne' occur, relative to parish size?
+    python facet_matrices.py query --facets facet_matrices.npz \
+        --lemma kuldne --facet place --top 20
+
+In Python:
+    facets = FacetMatrices.load('facet_matrices.npz')
+    facets.distribution('decade', ['kuldne', 'hõbe'])
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from corpus_arrays import load_token_arrays
+from corpus_io import pack_json, unpack_json
+
+
+FACETS = ('place', 'decade', 'collector', 'collection')
+
+YEAR_PATTERN = re.compile(r'\d{4}')
+
+
+def facet_values(metadata: dict, facet: str) -> list:
+    """Facet values of one poem (empty list if unknown)."""
+    if facet == 'place':
+        return [p for p in metadata.get('places', []) if p]
+    if facet == 'collector':
+        return [c for c in metadata.get('collectors', []) if c]
+    if facet == 'collection':
+        collection = metadata.get('collection', '')
+        return [collection] if collection else []
+    if facet == 'decade':
+        match = YEAR_PATTERN.search(str(metadata.get('year', '') or ''))
+        return [f'{int(match.group()) // 10 * 10}s'] if match else []
+    raise ValueError(f"Unknown facet: {facet}")
+
+
+def incidence_matrix(poem_metadata: list, facet: str) -> tuple:
+    """
+    Sparse poem x facet-value incidence matrix.
+
+    Returns:
+        tuple: (csr_matrix, value_list)
+    """
+    lookup = {}
+    rows, cols = [], []
+    for poem, metadata in enumerate(poem_metadata):
+        for value in dict.fromkeys(facet_values(metadata, facet)):
+            col = lookup.get(value)
+            if col is None:
+                col = lookup[value] = len(lookup)
+            rows.append(poem)
+            cols.append(col)
+
+    data = np.ones(len(rows), dtype=np.float64)
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(poem_metadata), len(lookup)))
+    return matrix, list(lookup)
+
+
+class FacetMatrices:
+    """Facet x lemma token counts with facet totals."""
+
+    def __init__(self, lemmas: list, facets: dict):
+        """
+        Args:
+            lemmas: Lemma vocabulary (matrix columns)
+            facets: facet -> {'values', 'counts' (csr), 'tokens', 'poems'}
+        """
+        self.lemmas = lemmas
+        self.facets = facets
+        self._lemma_lookup = {lemma: i for i, lemma in enumerate(lemmas)}
+
+    @classmethod
+    def build(cls, arrays) -> 'FacetMatrices':
+        """Build all facet matrices from TokenArrays."""
+        poem = arrays.poem_of_token()
+        lemma_codes = arrays.codes['lemma']
+        data = np.ones(poem.size, dtype=np.float64)
+        # Duplicate (poem, lemma) entries are summed into token counts
+        poem_lemma = sparse.csr_matrix((data, (poem, lemma_codes)),
+                                       shape=(arrays.num_poems, len(arrays.vocab['lemma'])))
+        poem_tokens = arrays.poem_lengths().astype(np.float64)
+
+        facets = {}
+        for facet in FACETS:
+            incidence, values = incidence_matrix(arrays.poem_metadata, facet)
+            incidence_t = incidence.T.tocsr()
+            facets[facet] = {
+                'values': values,
+                'counts': (incidence_t @ poem_lemma).tocsr(),
+                'tokens': incidence_t @ poem_tokens,
+                'poems': np.asarray(incidence.sum(axis=0)).ravel()
+            }
+            print(f"  {facet}: {len(values):,} values, {facets[facet]['counts'].nnz:,} non-zeros")
+        return cls(list(arrays.vocab['lemma']), facets)
+
+    def save(self, path: Path):
+        """Save to a NumPy .npz archive."""
+        arrays = {'lemmas': pack_json(self.lemmas)}
+        for facet, entry in self.facets.items():
+            counts = entry['counts']
+            arrays[f'{facet}_values'] = pack_json(entry['values'])
+            arrays[f'{facet}_data'] = counts.data.astype(np.int64)
+            arrays[f'{facet}_indices'] = counts.indices
+            arrays[f'{facet}_indptr'] = counts.indptr
+            arrays[f'{facet}_tokens'] = entry['tokens'].astype(np.int64)
+            arrays[f'{facet}_poems'] = entry['poems'].astype(np.int64)
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> 'FacetMatrices':
+        """Load matrices saved with save()."""
+        with np.load(path) as archive:
+            lemmas = unpack_json(archive['lemmas'])
+            facets = {}
+            for facet in FACETS:
+                values = unpack_json(archive[f'{facet}_values'])
+                counts = sparse.csr_matrix(
+                    (archive[f'{facet}_data'], archive[f'{facet}_indices'], archive[f'{facet}_indptr']),
+                    shape=(len(values), len(lemmas))
+                )
+                facets[facet] = {
+                    'values': values,
+                    'counts': counts,
+                    'tokens': archive[f'{facet}_tokens'],
+                    'poems': archive[f'{facet}_poems']
+                }
+        return cls(lemmas, facets)
+
+    def has_lemma(self, lemma: str) -> bool:
+        return lemma in self._lemma_lookup
+
+    def lemma_id(self, lemma: str) -> int:
+        """Matrix column of a lemma (KeyError when unknown)."""
+        return self._lemma_lookup[lemma]
+
+    def lemma_counts(self, facet: str, lemmas) -> np.ndarray:
+        """Summed token counts of a lemma or lemma set per facet value."""
+        if isinstance(lemmas, str):
+            lemmas = [lemmas]
+        cols = [self.lemma_id(l) for l in lemmas if self.has_lemma(l)]
+        counts = self.facets[facet]['counts']
+        if not cols:
+            return np.zeros(counts.shape[0], dtype=np.int64)
+        return np.asarray(counts[:, cols].sum(axis=1)).ravel().astype(np.int64)
+
+    def distribution(self, facet: str, lemmas, min_tokens: int = 0) -> list:
+        """
+        Normalised distribution of a lemma or lemma set over facet values.
+
+        Args:
+            facet: One of FACETS
+            lemmas: Lemma or list of lemmas (counts are summed)
+            min_tokens: Skip facet values with fewer tokens in total
+
+        Returns:
+            list of dicts sorted by relative frequency (per 10,000 tokens)
+        """
+        entry = self.facets[facet]
+        counts = self.lemma_counts(facet, lemmas)
+        tokens = entry['tokens']
+        total = counts.sum()
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            per_10k = np.where(tokens > 0, counts / tokens * 10000, 0.0)
+        keep = np.flatnonzero((counts > 0) & (tokens >= min_tokens))
+        order = keep[np.lexsort((-counts[keep], -per_10k[keep]))]
+
+        return [{
+            'value': entry['values'][i],
+            'count': int(counts[i]),
+            'facet_tokens': int(tokens[i]),
+            'facet_poems': int(entry['poems'][i]),
+            'per_10k': round(float(per_10k[i]), 4),
+            'share': round(float(counts[i] / total), 4)
+        } for i in order]
+
+    def totals(self, facet: str) -> list:
+        """Token and poem totals per facet value, largest first."""
+        entry = self.facets[facet]
+        order = np.argsort(-entry['tokens'], kind='stable')
+        return [{
+            'value': entry['values'][i],
+            'tokens': int(entry['tokens'][i]),
+            'poems': int(entry['poems'][i])
+        } for i in order]
+
+
+def run_build(args):
+    arrays = load_token_arrays(args.poems_index)
+
+    print("\nBuilding facet x lemma matrices...")
+    facets = FacetMatrices.build(arrays)
+    facets.save(args.output)
+    print(f"✓ Saved {args.output} ({args.output.stat().st_size / (1024 * 1024):.2f} MB)")
+    return 0
+
+
+def run_query(args):
+    facets = FacetMatrices.load(args.facets)
+
+    if not args.lemma:
+        rows = facets.totals(args.facet)[:args.top]
+        print(f"Largest {args.facet} values:")
+        for row in rows:
+            print(f"  {row['value']}: {row['tokens']:,} tokens, {row['poems']:,} poems")
+        return 0
+
+    unknown = [l for l in args.lemma if not facets.has_lemma(l)]
+    if unknown:
+        print(f"⚠ Unknown lemmas: {', '.join(unknown)}")
+
+    rows = facets.distribution(args.facet, args.lemma, args.min_tokens)
+    total = sum(row['count'] for row in rows)
+    print(f"{' + '.join(args.lemma)}: {total:,} occurrences in {len(rows):,} {args.facet} values")
+    for row in rows[:args.top]:
+        print(f"  {row['value']:<30} {row['count']:>7,} / {row['facet_tokens']:>9,} tokens  "
+              f"{row['per_10k']:>8.2f} per 10k  {row['share']:>6.1%}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Facet x lemma sparse count matrices (place, decade, collector, collection)'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build facet matrices from the poem index')
+    build.add_argument('--poems-index', type=Path, default=Path('poems_index_v3.json.gz'),
+                       help='Poems index or corpus_arrays.npz')
+    build.add_argument('--output', type=Path, default=Path('facet_matrices.npz'),
+                       help='Output .npz file')
+
+    query = subparsers.add_parser('query', help='Distribution of lemmas over a facet')
+    query.add_argument('--facets', type=Path, default=Path('facet_matrices.npz'),
+                       help='Facet matrices file from the build command')
+    query.add_argument('--facet', choices=FACETS, default='place', help='Facet to query')
+    query.add_argument('--lemma', action='append', default=[],
+                       help='Lemma (repeatable, counts are summed); omit to list facet totals')
+    query.add_argument('--min-tokens', type=int, default=0,
+                       help='Skip facet values with fewer tokens in total')
+    query.add_argument('--top', type=int, default=20, help='Number of facet values to list')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        return run_build(args)
+    return run_query(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Top-k fuzzy lemma suggestions for unknown and low-confidence word forms.
+
+Tokens lemmatised by `levenshtein` (confidence 0.308) or left `unknown`
+are corrected by hand, each time with an ad-hoc edit-distance scan over
+the lemma list. This module prebuilds a symmetric-delete candidate index
+(as in SymSpell) over the trusted lemmas and their attested word forms:
+
+- a target is a lemma, or a word form of a lemma, seen with average
+  confidence >= --min-confidence, so earlier low-confidence guesses do not
+  suggest themselves;
+- every target prefix (first --prefix-length characters) is expanded into
+  all strings reachable by up to --max-distance deletions, and each
+  deletion string is stored under a 64-bit hash with the targets it came
+  from (sorted keys + CSR arrays in one .npz).
+
+A query generates its own deletions, looks up their hashes, and verifies
+the candidates with the real Levenshtein distance. Lemmas are ranked by
+edit distance to the nearest target, then by the length of the common
+ending (a matched word form with the same case ending is the stronger
+hint), then by corpus frequency from lemma_index.
+
+Usage:
+    python fuzzy_lemma_suggest.py build --corpus corpus_full_source_poems_v2.json.gz \
+        --output lemma_suggest.npz
+
+    python fuzzy_lemma_suggest.py suggest --index lemma_suggest.npz --word piirj --word kulda -k 5
+
+    # Suggestions for every levenshtein/unknown or low-confidence form
+    python fuzzy_lemma_suggest.py batch --index lemma_suggest.npz \
+        --corpus corpus_full_source_poems_v2.json.gz --output lemma_suggestions.csv --workers 4
+"""
+
+import argparse
+import csv
+import hashlib
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+import numpy as np
+
+import pipeline_metrics
+from corpus_io import load_corpus, pack_strings, unpack_strings
+from generate_lemma_similarity_pairs import levenshtein_distance
+from pipeline_metrics import stage
+
+
+DEFAULT_MAX_DISTANCE = 2
+DEFAULT_PREFIX_LENGTH = 10
+DEFAULT_MIN_CONFIDENCE = 0.7
+DEFAULT_K = 5
+REVIEW_METHODS = ('levenshtein', 'unknown')
+
+# Common endings longer than this add nothing to the ranking
+MAX_ENDING = 3
+
+
+def deletes(word: str, max_distance: int, prefix_length: int) -> set:
+    """The word prefix and every string reachable from it by up to max_distance deletions."""
+    word = word[:prefix_length]
+    result = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - result
+        result |= frontier
+    return result
+
+
+def string_hash(text: str) -> int:
+    """Stable 64-bit hash (collisions only add candidates that fail verification)."""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def common_ending(a: str, b: str) -> int:
+    n = 0
+    while n < MAX_ENDING and n < len(a) and n < len(b) and a[-1 - n] == b[-1 - n]:
+        n += 1
+    return n
+
+
+class SuggestionIndex:
+    """Symmetric-delete index from deletion hashes to target strings and their lemmas."""
+
+    def __init__(self, targets: list, is_lemma: np.ndarray, target_offsets: np.ndarray,
+                 target_lemmas: np.ndarray, lemmas: list, lemma_frequency: np.ndarray,
+                 keys: np.ndarray, key_offsets: np.ndarray, key_targets: np.ndarray,
+                 max_distance: int, prefix_length: int):
+        self.targets = targets
+        self.is_lemma = is_lemma
+        self.target_offsets = target_offsets
+        self.target_lemmas = target_lemmas
+        self.lemmas = lemmas
+        self.lemma_frequency = lemma_frequency
+        self.keys = keys
+        self.key_offsets = key_offsets
+        self.key_targets = key_targets
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+
+    @classmethod
+    def build(cls, corpus: dict, max_distance: int = DEFAULT_MAX_DISTANCE,
+              prefix_length: int = DEFAULT_PREFIX_LENGTH,
+              min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> 'SuggestionIndex':
+        """Build from the lemma_index of a loaded aggregate corpus."""
+        target_lemmas = {}
+        trusted = {}
+        for lemma, data in corpus.get('lemma_index', {}).items():
+            forms = [word_form for word_form, stats in data.get('form_distribution', {}).items()
+                     if stats.get('confidence_avg', 0) >= min_confidence]
+            if not forms:
+                continue
+            trusted[lemma] = data.get('total_occurrences', 0)
+            for target in [lemma] + forms:
+                target_lemmas.setdefault(target, set()).add(lemma)
+
+        lemmas = sorted(trusted)
+        lemma_id = {lemma: i for i, lemma in enumerate(lemmas)}
+        targets = sorted(target_lemmas)
+
+        target_offsets = [0]
+        linked = []
+        for target in targets:
+            linked.extend(sorted(lemma_id[lemma] for lemma in target_lemmas[target]))
+            target_offsets.append(len(linked))
+
+        key_hashes, key_target_ids = [], []
+        for target_id, target in enumerate(targets):
+            for deletion in deletes(target, max_distance, prefix_length):
+                key_hashes.append(string_hash(deletion))
+                key_target_ids.append(target_id)
+        key_hashes = np.asarray(key_hashes, dtype=np.uint64)
+        key_target_ids = np.asarray(key_target_ids, dtype=np.int32)
+        order = np.lexsort((key_target_ids, key_hashes))
+        keys, starts = np.unique(key_hashes[order], return_index=True)
+
+        return cls(
+            targets=targets,
+            is_lemma=np.array([target in trusted for target in targets], dtype=bool),
+            target_offsets=np.asarray(target_offsets, dtype=np.int64),
+            target_lemmas=np.asarray(linked, dtype=np.int32),
+            lemmas=lemmas,
+            lemma_frequency=np.array([trusted[lemma] for lemma in lemmas], dtype=np.int64),
+            keys=keys,
+            key_offsets=np.append(starts, key_hashes.size).astype(np.int64),
+            key_targets=key_target_ids[order],
+            max_distance=max_distance,
+            prefix_length=prefix_length
+        )
+
+    def save(self, path: Path):
+        """Save to a NumPy .npz archive."""
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                targets=pack_strings(self.targets),
+                is_lemma=self.is_lemma,
+                target_offsets=self.target_offsets,
+                target_lemmas=self.target_lemmas,
+                lemmas=pack_strings(self.lemmas),
+                lemma_frequency=self.lemma_frequency,
+                keys=self.keys,
+                key_offsets=self.key_offsets,
+                key_targets=self.key_targets,
+                params=np.array([self.max_distance, self.prefix_length], dtype=np.int64)
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> 'SuggestionIndex':
+        """Load an index saved with save()."""
+        with np.load(path) as archive:
+            max_distance, prefix_length = (int(v) for v in archive['params'])
+            return cls(
+                targets=unpack_strings(archive['targets']),
+                is_lemma=archive['is_lemma'],
+                target_offsets=archive['target_offsets'],
+                target_lemmas=archive['target_lemmas'],
+                lemmas=unpack_strings(archive['lemmas']),
+                lemma_frequency=archive['lemma_frequency'],
+                keys=archive['keys'],
+                key_offsets=archive['key_offsets'],
+                key_targets=archive['key_targets'],
+                max_distance=max_distance,
+                prefix_length=prefix_length
+            )
+
+    def candidates(self, word: str, max_distance: int) -> np.ndarray:
+        """Target ids sharing a deletion string with the word."""
+        hashes = np.fromiter((string_hash(d) for d in deletes(word, max_distance, self.prefix_length)),
+                             dtype=np.uint64)
+        positions = np.searchsorted(self.keys, hashes)
+        found = positions < self.keys.size
+        found[found] = self.keys[positions[found]] == hashes[found]
+        positions = positions[found]
+        if not positions.size:
+            return np.zeros(0, dtype=np.int32)
+        starts, ends = self.key_offsets[positions], self.key_offsets[positions + 1]
+        return np.unique(np.concatenate([self.key_targets[s:e] for s, e in zip(starts, ends)]))
+
+    def suggest(self, word: str, k: int = DEFAULT_K, max_distance: int = None) -> list:
+        """Top-k lemma suggestions for a word form, best first."""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        best = {}
+        for target_id in self.candidates(word, max_distance):
+            target = self.targets[target_id]
+            if abs(len(target) - len(word)) > max_distance:
+                continue
+            distance = levenshtein_distance(word, target)
+            if distance > max_distance:
+                continue
+            ending = common_ending(word, target)
+            for lemma_id in self.target_lemmas[self.target_offsets[target_id]:self.target_offsets[target_id + 1]]:
+                rank = (distance, -ending, -int(self.lemma_frequency[lemma_id]))
+                if lemma_id not in best or rank < best[lemma_id][0]:
+                    best[lemma_id] = (rank, target_id)
+
+        suggestions = []
+        for lemma_id, (rank, target_id) in sorted(best.items(), key=lambda x: (x[1][0], self.lemmas[x[0]]))[:k]:
+            suggestions.append({
+                'lemma': self.lemmas[lemma_id],
+                'distance': rank[0],
+                'matched': self.targets[target_id],
+                'matched_type': 'lemma' if self.is_lemma[target_id] and self.targets[target_id] == self.lemmas[lemma_id] else 'form',
+                'common_ending': -rank[1],
+                'lemma_frequency': -rank[2]
+            })
+        return suggestions
+
+
+def review_queue(corpus: dict, methods=REVIEW_METHODS, max_confidence: float = None) -> list:
+    """
+    Word forms needing review: any lemma assigned by one of the methods,
+    or (with max_confidence) an average confidence below it.
+
+    Returns:
+        list: (word, tokens, current lemmas, methods) sorted by tokens
+    """
+    methods = set(methods)
+    queue = []
+    for word, data in corpus.get('words', {}).items():
+        flagged, flagged_methods, tokens = [], set(), 0
+        for lemma in data.get('lemmas', []):
+            lemma_methods = data.get('methods', {}).get(lemma, {})
+            hit = methods.intersection(lemma_methods)
+            avg = data.get('confidences', {}).get(lemma, {}).get('avg', 1.0)
+            if hit or (max_confidence is not None and avg < max_confidence):
+                flagged.append(lemma)
+                flagged_methods.update(hit or lemma_methods)
+                tokens += data.get('lemma_counts', {}).get(lemma, 0)
+        if flagged:
+            queue.append((word, tokens, flagged, sorted(flagged_methods)))
+    queue.sort(key=lambda x: (-x[1], x[0]))
+    return queue
+
+
+_worker_index = None
+
+
+def _init_worker(index_path):
+    global _worker_index
+    _worker_index = SuggestionIndex.load(index_path)
+
+
+def _suggest_chunk(args):
+    words, k, max_distance = args
+    return [_worker_index.suggest(word, k, max_distance) for word in words]
+
+
+def suggest_all(index_path: Path, words: list, k: int, max_distance: int, workers: int = 1,
+                chunk_size: int = 2000) -> list:
+    """Suggestions for every word, in order; workers > 1 uses a process pool."""
+    if workers <= 1 or len(words) <= chunk_size:
+        _init_worker(index_path)
+        return _suggest_chunk((words, k, max_distance))
+    chunks = [(words[i:i + chunk_size], k, max_distance) for i in range(0, len(words), chunk_size)]
+    results = []
+    with Pool(workers, initializer=_init_worker, initargs=(index_path,)) as pool:
+        for done, chunk_results in enumerate(pool.imap(_suggest_chunk, chunks), 1):
+            results.extend(chunk_results)
+            print(f"  Suggested {len(results):,} / {len(words):,} forms ({done / len(chunks) * 100:.1f}%)")
+    return results
+
+
+def run_build(args):
+    corpus = load_corpus(args.corpus)
+    print(f"\nBuilding candidate index (distance <= {args.max_distance}, "
+          f"prefix {args.prefix_length}, confidence >= {args.min_confidence})...")
+    with stage('build') as s:
+        index = SuggestionIndex.build(corpus, args.max_distance, args.prefix_length, args.min_confidence)
+        s.items = len(index.targets)
+    print(f"  {len(index.lemmas):,} trusted lemmas, {len(index.targets):,} targets, "
+          f"{index.keys.size:,} deletion keys")
+    with stage('write'):
+        index.save(args.output)
+    print(f"✓ Saved {args.output} ({args.output.stat().st_size / (1024 * 1024):.2f} MB)")
+    return 0
+
+
+def run_suggest(args):
+    index = SuggestionIndex.load(args.index)
+    for word in args.word:
+        start = time.perf_counter()
+        suggestions = index.suggest(word, args.k, args.max_distance)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"\n🔍 {word} ({elapsed:.2f} ms)")
+        if not suggestions:
+            print("    no lemma within distance")
+        for i, s in enumerate(suggestions, 1):
+            print(f"  {i}. {s['lemma']:20s} distance {s['distance']}  via {s['matched_type']} "
+                  f"'{s['matched']}'  ending {s['common_ending']}  freq {s['lemma_frequency']:,}")
+    return 0
+
+
+def run_batch(args):
+    corpus = load_corpus(args.corpus)
+    with stage('queue') as s:
+        queue = review_queue(corpus, args.methods, args.max_confidence)
+        s.items = len(queue)
+    del corpus
+    print(f"Review queue: {len(queue):,} word forms, {sum(q[1] for q in queue):,} tokens")
+
+    with stage('suggest') as s:
+        results = suggest_all(args.index, [q[0] for q in queue], args.k, args.max_distance, args.workers)
+        s.items = len(queue)
+
+    with stage('write'):
+        with open(args.output, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['word', 'tokens', 'current_lemmas', 'methods', 'rank', 'suggested_lemma',
+                             'distance', 'matched', 'matched_type', 'common_ending', 'lemma_frequency'])
+            for (word, tokens, lemmas, methods), suggestions in zip(queue, results):
+                base = [word, tokens, '|'.join(lemmas), '|'.join(methods)]
+                if not suggestions:
+                    writer.writerow(base + [0, '', '', '', '', '', ''])
+                for rank, s in enumerate(suggestions, 1):
+                    writer.writerow(base + [rank, s['lemma'], s['distance'], s['matched'], s['matched_type'],
+                                            s['common_ending'], s['lemma_frequency']])
+
+    with_suggestions = sum(1 for r in results if r)
+    changed = sum(1 for (_, _, lemmas, _), r in zip(queue, results) if r and r[0]['lemma'] not in lemmas)
+    print(f"\n   Forms with suggestions: {with_suggestions:,} / {len(queue):,}")
+    print(f"   Top suggestion differs from current lemma: {changed:,}")
+    print(f"✓ Saved {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Top-k fuzzy lemma suggestions for unknown and low-confidence word forms'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build the candidate index from an aggregate corpus')
+    build.add_argument('--corpus', type=Path, required=True, help='Aggregate corpus JSON (.json or .json.gz)')
+    build.add_argument('--output', type=Path, default=Path('lemma_suggest.npz'),
+                       help='Output .npz (default: lemma_suggest.npz)')
+    build.add_argument('--max-distance', type=int, default=DEFAULT_MAX_DISTANCE,
+                       help=f'Largest edit distance served (default: {DEFAULT_MAX_DISTANCE})')
+    build.add_argument('--prefix-length', type=int, default=DEFAULT_PREFIX_LENGTH,
+                       help=f'Characters expanded into deletions (default: {DEFAULT_PREFIX_LENGTH})')
+    build.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE,
+                       help=f'Average confidence for a form to be a target (default: {DEFAULT_MIN_CONFIDENCE})')
+    pipeline_metrics.add_arguments(build)
+
+    suggest = subparsers.add_parser('suggest', help='Suggest lemmas for word forms')
+    suggest.add_argument('--index', type=Path, default=Path('lemma_suggest.npz'), help='Candidate index .npz')
+    suggest.add_argument('--word', action='append', required=True, help='Word form (repeatable)')
+    suggest.add_argument('-k', type=int, default=DEFAULT_K, help=f'Suggestions per form (default: {DEFAULT_K})')
+    suggest.add_argument('--max-distance', type=int, default=None, help='Edit distance limit (default: index limit)')
+
+    batch = subparsers.add_parser('batch', help='Suggest lemmas for the whole review queue')
+    batch.add_argument('--index', type=Path, default=Path('lemma_suggest.npz'), help='Candidate index .npz')
+    batch.add_argument('--corpus', type=Path, required=True, help='Aggregate corpus with the forms to review')
+    batch.add_argument('--output', type=Path, default=Path('lemma_suggestions.csv'),
+                       help='Output CSV (default: lemma_suggestions.csv)')
+    batch.add_argument('--methods', nargs='+', default=list(REVIEW_METHODS),
+                       help=f"Methods whose forms are reviewed (default: {' '.join(REVIEW_METHODS)})")
+    batch.add_argument('--max-confidence', type=float, default=None,
+                       help='Also review lemmas with average confidence below this')
+    batch.add_argument('-k', type=int, default=DEFAULT_K, help=f'Suggestions per form (default: {DEFAULT_K})')
+    batch.add_argument('--max-distance', type=int, default=None, help='Edit distance limit (default: index limit)')
+    batch.add_argument('--workers', type=int, default=1, help='Worker processes (default: 1)')
+    pipeline_metrics.add_arguments(batch)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        pipeline_metrics.from_args(args, 'fuzzy_lemma_suggest_build')
+        return run_build(args)
+    if args.command == 'batch':
+        pipeline_metrics.from_args(args, 'fuzzy_lemma_suggest_batch')
+        return run_batch(args)
+    return run_suggest(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
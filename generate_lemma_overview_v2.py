@@ -14,6 +14,9 @@ import csv
 from collections import Counter
 from pathlib import Path
 
+import pipeline_metrics
+from pipeline_metrics import stage
+
 def load_corpus(corpus_path='corpus_validation_improved.json.gz'):
     """Load the corpus JSON file"""
     print(f"Loading corpus from {corpus_path}...")
@@ -199,22 +202,24 @@ def generate_csv(corpus, output_path='lemma_overview_v2.csv'):
     rows = []
     total_lemmas = len(lemma_index)
 
-    for idx, (lemma, lemma_data) in enumerate(lemma_index.items(), 1):
-        if idx % 5000 == 0:
-            print(f"  Processed {idx:,} / {total_lemmas:,} lemmas ({idx/total_lemmas*100:.1f}%)")
+    with stage('analyze_lemmas', items=total_lemmas):
+        for idx, (lemma, lemma_data) in enumerate(lemma_index.items(), 1):
+            if idx % 5000 == 0:
+                print(f"  Processed {idx:,} / {total_lemmas:,} lemmas ({idx/total_lemmas*100:.1f}%)")
 
-        row = analyze_lemma(lemma, lemma_data, words_data, ambiguous_data)
-        rows.append(row)
+            row = analyze_lemma(lemma, lemma_data, words_data, ambiguous_data)
+            rows.append(row)
 
     # Sort by total occurrences (descending)
     rows.sort(key=lambda x: x['total_occurrences'], reverse=True)
 
     # Write CSV
     print(f"\nWriting CSV to {output_path}...")
-    with open(output_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=columns)
-        writer.writeheader()
-        writer.writerows(rows)
+    with stage('write_csv', items=len(rows)):
+        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
 
     print(f"✓ CSV written with {len(rows):,} lemmas")
 
@@ -238,14 +243,18 @@ def main():
                         help='Path to corpus JSON file (default: corpus_validation_improved.json.gz)')
     parser.add_argument('--output', default='lemma_overview_v2.csv',
                         help='Output CSV file path (default: lemma_overview_v2.csv)')
+    pipeline_metrics.add_arguments(parser)
 
     args = parser.parse_args()
+    pipeline_metrics.from_args(args, 'generate_lemma_overview_v2')
 
     # Load corpus
-    corpus = load_corpus(args.corpus)
+    with stage('load_corpus'):
+        corpus = load_corpus(args.corpus)
 
     # Generate CSV
-    generate_csv(corpus, args.output)
+    with stage('generate_csv'):
+        generate_csv(corpus, args.output)
 
     print(f"\n✓ Done! CSV file: {args.output}")
     print(f"\nUsage examples:")
@@ -5,15 +5,30 @@ Generate Lemma Similarity Pairs CSV for Merge Review
 Finds lemma pairs with Levenshtein distance = 1 to identify potential typos
 or variants that could be merged.
 
+With --blocking, lemmas (and optionally word forms) are grouped into blocks
+by an orthographic normalisation key instead, e.g. with õ/ö/ä and w/v folded,
+length marking collapsed and initial h dropped. Only lemmas in the same
+block are compared, so dialect and spelling variants at any edit distance
+are found without comparing unrelated lemmas.
+
+Lemma statistics are computed once per lemma into a table; pair rows are
+then scored from the table in a process pool (--workers).
+
 Based on generate_lemma_overview_v2.py structure.
 """
 
 import json
 import gzip
 import csv
+import os
+import re
 from collections import Counter, defaultdict
+from multiprocessing import Pool
 from pathlib import Path
 
+import pipeline_metrics
+from pipeline_metrics import stage
+
 
 def levenshtein_distance(s1, s2):
     """Calculate Levenshtein distance between two strings"""
@@ -115,6 +130,94 @@ def find_similar_pairs_efficient(lemma_list):
     return list(pairs)
 
 
+# Normalisation rules for blocking keys, applied in this order
+NORMALISATION_RULES = {
+    'lower': lambda s: s.lower(),
+    'fold_vowels': lambda s: s.translate(str.maketrans('öäõ', 'õõõ')),
+    'fold_y': lambda s: s.translate(str.maketrans('üy', 'ii')),
+    'fold_wv': lambda s: s.replace('w', 'v'),
+    'drop_h': lambda s: re.sub(r'^h(?=..)|(?<=..)h$', '', s),  # initial and final h
+    'fold_stops': lambda s: s.translate(str.maketrans('gbd', 'kpt')),
+    'collapse_doubles': lambda s: re.sub(r'(.)\1+', r'\1', s),
+}
+
+DEFAULT_BLOCKING_RULES = ['lower', 'fold_vowels', 'fold_wv', 'drop_h', 'collapse_doubles']
+
+
+def parse_blocking_rules(spec):
+    """Parse a comma-separated rule list ('default' expands to the default rules)"""
+    rules = []
+    for name in spec.split(','):
+        name = name.strip()
+        if name == 'default':
+            rules.extend(DEFAULT_BLOCKING_RULES)
+        elif name in NORMALISATION_RULES:
+            rules.append(name)
+        elif name:
+            raise ValueError(f"Unknown blocking rule '{name}' "
+                             f"(available: {', '.join(NORMALISATION_RULES)})")
+    # Rules always apply in table order, so 'collapse_doubles' sees folded letters
+    return [name for name in NORMALISATION_RULES if name in rules]
+
+
+def blocking_key(text, rules):
+    """Normalise a lemma or word form into its blocking key"""
+    for name in rules:
+        text = NORMALISATION_RULES[name](text)
+    return text
+
+
+def find_blocked_pairs(lemma_list, words_data, rules, block_on='lemmas', max_block_size=50):
+    """
+    Find candidate lemma pairs that share a blocking key.
+
+    block_on='lemmas' groups lemmas by their own key; 'forms' groups word
+    forms by key and pairs the lemmas of colliding forms; 'both' does both.
+    Blocks with more than max_block_size lemmas are skipped as too generic.
+
+    Returns (pairs, pair_keys, comparisons) where pair_keys maps each pair
+    to the key of the first block that produced it ('form:' prefixed for
+    word-form blocks).
+    """
+    print(f"Finding lemma pairs within blocks ({', '.join(rules)})...")
+
+    blocks = []
+    if block_on in ('lemmas', 'both'):
+        by_key = defaultdict(set)
+        for lemma in lemma_list:
+            by_key[blocking_key(lemma, rules)].add(lemma)
+        blocks.extend(by_key.items())
+
+    if block_on in ('forms', 'both'):
+        known = set(lemma_list)
+        by_key = defaultdict(set)
+        for form, data in words_data.items():
+            by_key[blocking_key(form, rules)].update(l for l in data.get('lemmas', []) if l in known)
+        blocks.extend((f"form:{key}", lemmas) for key, lemmas in by_key.items())
+
+    pair_keys = {}
+    comparisons = 0
+    skipped = 0
+    for key, lemmas in blocks:
+        if len(lemmas) < 2:
+            continue
+        if len(lemmas) > max_block_size:
+            skipped += 1
+            continue
+        members = sorted(lemmas)
+        comparisons += len(members) * (len(members) - 1) // 2
+        for i, lemma in enumerate(members):
+            for other in members[i + 1:]:
+                pair_keys.setdefault((lemma, other), key)
+
+    naive = len(lemma_list) * (len(lemma_list) - 1) // 2
+    print(f"✓ Found {len(pair_keys):,} candidate pairs in {len(blocks):,} blocks "
+          f"({comparisons:,} comparisons vs {naive:,} all-pairs)")
+    if skipped:
+        print(f"  ⚠ Skipped {skipped:,} blocks larger than {max_block_size} lemmas")
+    return list(pair_keys), pair_keys, comparisons
+
+
 def get_lemma_stats(lemma, lemma_data, words_data, ambiguous_data):
     """Extract comprehensive statistics for a lemma"""
     stats = {
@@ -186,26 +289,49 @@ def get_lemma_stats(lemma, lemma_data, words_data, ambiguous_data):
     return stats
 
 
+def build_stats_table(lemmas, lemma_index, words_data, ambiguous_data):
+    """
+    Compute get_lemma_stats once per lemma.
+
+    Word forms and POS tags are stored as frozensets and the display
+    strings are precomputed, so scoring a pair is set intersection and
+    dict lookups only.
+
+    Returns dict: {lemma: stats}
+    """
+    table = {}
+    for lemma in lemmas:
+        stats = get_lemma_stats(lemma, lemma_index.get(lemma, {}), words_data, ambiguous_data)
+        table[lemma] = {
+            'total_occurrences': stats['total_occurrences'],
+            'word_forms': frozenset(stats['word_forms']),
+            'word_forms_display': ', '.join(sorted(stats['word_forms'][:20])),  # Limit for readability
+            'pos_tags': frozenset(stats['pos_tags']),
+            'pos_display': ', '.join(sorted(stats['pos_tags'])),
+            'avg_confidence': stats['avg_confidence'],
+            'validation_status': stats['validation_status'],
+            'is_ambiguous': stats['is_ambiguous']
+        }
+    return table
+
+
 def analyze_pair(lemma1, lemma2, lemma_index, words_data, ambiguous_data):
     """Analyze a pair of similar lemmas"""
+    table = build_stats_table((lemma1, lemma2), lemma_index, words_data, ambiguous_data)
+    return score_pair(lemma1, lemma2, table[lemma1], table[lemma2])
 
-    lemma1_data = lemma_index.get(lemma1, {})
-    lemma2_data = lemma_index.get(lemma2, {})
 
-    # Get statistics for each lemma
-    stats1 = get_lemma_stats(lemma1, lemma1_data, words_data, ambiguous_data)
-    stats2 = get_lemma_stats(lemma2, lemma2_data, words_data, ambiguous_data)
+def score_pair(lemma1, lemma2, stats1, stats2):
+    """Build the CSV row of a lemma pair from precomputed stats (see build_stats_table)"""
 
     # Combined frequency
     combined_frequency = stats1['total_occurrences'] + stats2['total_occurrences']
 
     # Shared word forms
-    forms1 = set(stats1['word_forms'])
-    forms2 = set(stats2['word_forms'])
-    shared_forms = forms1.intersection(forms2)
+    shared_forms = stats1['word_forms'] & stats2['word_forms']
 
     # POS match
-    pos_tags_match = bool(stats1['pos_tags'].intersection(stats2['pos_tags']))
+    pos_tags_match = not stats1['pos_tags'].isdisjoint(stats2['pos_tags'])
 
     # Frequency ratio (higher/lower)
     if stats1['total_occurrences'] > 0 and stats2['total_occurrences'] > 0:
@@ -231,12 +357,12 @@ def analyze_pair(lemma1, lemma2, lemma_index, words_data, ambiguous_data):
         'lemma1': lemma1,
         'lemma2': lemma2,
         'combined_frequency': combined_frequency,
-        'lemma1_wordforms': ', '.join(sorted(stats1['word_forms'][:20])),  # Limit for readability
-        'lemma2_wordforms': ', '.join(sorted(stats2['word_forms'][:20])),
+        'lemma1_wordforms': stats1['word_forms_display'],
+        'lemma2_wordforms': stats2['word_forms_display'],
         'pos_tags_match': pos_tags_match,
         'shared_wordforms': len(shared_forms),
-        'lemma1_pos': ', '.join(sorted(stats1['pos_tags'])),
-        'lemma2_pos': ', '.join(sorted(stats2['pos_tags'])),
+        'lemma1_pos': stats1['pos_display'],
+        'lemma2_pos': stats2['pos_display'],
         'lemma1_occurrences': stats1['total_occurrences'],
         'lemma2_occurrences': stats2['total_occurrences'],
         'frequency_ratio': round(frequency_ratio, 2),
@@ -252,6 +378,37 @@ def analyze_pair(lemma1, lemma2, lemma_index, words_data, ambiguous_data):
     }
 
 
+_worker_stats = None
+
+
+def _init_worker(stats_table):
+    global _worker_stats
+    _worker_stats = stats_table
+
+
+def _score_chunk(pairs):
+    return [score_pair(l1, l2, _worker_stats[l1], _worker_stats[l2]) for l1, l2 in pairs]
+
+
+def score_pairs(pairs, stats_table, workers=1, chunk_size=5000):
+    """
+    Score all pairs from the stats table.
+
+    With workers > 1 the pairs are scored in chunks by a process pool;
+    each worker receives the stats table once at start-up.
+    """
+    if workers <= 1 or len(pairs) <= chunk_size:
+        return [score_pair(l1, l2, stats_table[l1], stats_table[l2]) for l1, l2 in pairs]
+
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    rows = []
+    with Pool(workers, initializer=_init_worker, initargs=(stats_table,)) as pool:
+        for done, chunk_rows in enumerate(pool.imap(_score_chunk, chunks), 1):
+            rows.extend(chunk_rows)
+            print(f"  Analyzed {len(rows):,} / {len(pairs):,} pairs ({done/len(chunks)*100:.1f}%)")
+    return rows
+
+
 def load_corpus(corpus_path='corpus_validation_improved.json.gz'):
     """Load the corpus JSON file"""
     print(f"Loading corpus from {corpus_path}...")
@@ -261,8 +418,14 @@ def load_corpus(corpus_path='corpus_validation_improved.json.gz'):
     return corpus
 
 
-def generate_csv(corpus, output_path='lemma_similarity_pairs.csv'):
-    """Generate the lemma similarity pairs CSV"""
+def generate_csv(corpus, output_path='lemma_similarity_pairs.csv', workers=1,
+                 blocking_rules=None, block_on='lemmas', max_block_size=50):
+    """
+    Generate the lemma similarity pairs CSV
+
+    With blocking_rules, candidate pairs come from find_blocked_pairs() and
+    the CSV gains 'edit_distance' and 'blocking_key' columns.
+    """
 
     print(f"\nGenerating lemma similarity pairs CSV...")
 
@@ -272,7 +435,12 @@ def generate_csv(corpus, output_path='lemma_similarity_pairs.csv'):
 
     # Find similar pairs
     lemma_list = list(lemma_index.keys())
-    pairs = find_similar_pairs_efficient(lemma_list)
+    with stage('find_pairs', items=len(lemma_list)):
+        if blocking_rules:
+            pairs, pair_keys, _ = find_blocked_pairs(lemma_list, words_data, blocking_rules,
+                                                     block_on, max_block_size)
+        else:
+            pairs = find_similar_pairs_efficient(lemma_list)
 
     # Define CSV columns
     columns = [
@@ -298,26 +466,40 @@ def generate_csv(corpus, output_path='lemma_similarity_pairs.csv'):
         'edit_type',
         'edit_position'
     ]
+    if blocking_rules:
+        columns += ['edit_distance', 'blocking_key']
+
+    # Lemma statistics, once per lemma that occurs in a pair
+    pair_lemmas = {lemma for pair in pairs for lemma in pair}
+    print(f"\nComputing statistics for {len(pair_lemmas):,} lemmas...")
+    with stage('lemma_stats', items=len(pair_lemmas)):
+        stats_table = build_stats_table(pair_lemmas, lemma_index, words_data, ambiguous_data)
 
     # Analyze all pairs
     print(f"\nAnalyzing {len(pairs):,} pairs...")
-    rows = []
-    for idx, (lemma1, lemma2) in enumerate(pairs, 1):
-        if idx % 1000 == 0:
-            print(f"  Analyzed {idx:,} / {len(pairs):,} pairs ({idx/len(pairs)*100:.1f}%)")
-
-        row = analyze_pair(lemma1, lemma2, lemma_index, words_data, ambiguous_data)
-        rows.append(row)
+    with stage('analyze_pairs', items=len(pairs)):
+        rows = score_pairs(pairs, stats_table, workers)
+
+    if blocking_rules:
+        for row in rows:
+            distance = levenshtein_distance(row['lemma1'], row['lemma2'])
+            if distance > 1:
+                # The single-edit position does not apply to multi-edit pairs
+                row['edit_type'] = 'multiple'
+                row['edit_position'] = ''
+            row['edit_distance'] = distance
+            row['blocking_key'] = pair_keys[(row['lemma1'], row['lemma2'])]
 
     # Sort by combined frequency (descending) - tackle high-impact pairs first
     rows.sort(key=lambda x: x['combined_frequency'], reverse=True)
 
     # Write CSV
     print(f"\nWriting CSV to {output_path}...")
-    with open(output_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=columns)
-        writer.writeheader()
-        writer.writerows(rows)
+    with stage('write_csv', items=len(rows)):
+        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
 
     print(f"✓ CSV written with {len(rows):,} similar pairs")
 
@@ -332,6 +514,10 @@ def generate_csv(corpus, output_path='lemma_similarity_pairs.csv'):
     edit_types = Counter(r['edit_type'] for r in rows)
     for edit_type, count in edit_types.most_common():
         print(f"  {edit_type}: {count:,}")
+    if blocking_rules:
+        print(f"\nEdit distance distribution:")
+        for distance, count in sorted(Counter(r['edit_distance'] for r in rows).items()):
+            print(f"  {distance}: {count:,}")
 
 
 def main():
@@ -343,14 +529,36 @@ def main():
                        help='Path to corpus JSON file (default: corpus_validation_improved.json.gz)')
     parser.add_argument('--output', default='lemma_similarity_pairs.csv',
                        help='Output CSV file path (default: lemma_similarity_pairs.csv)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                       help='Worker processes for pair analysis (default: all cores)')
+    parser.add_argument('--blocking', nargs='?', const='default', default=None, metavar='RULES',
+                       help='Compare only lemmas sharing a normalisation key instead of all '
+                            'distance-1 pairs. RULES is a comma-separated list of '
+                            f"{', '.join(NORMALISATION_RULES)} "
+                            f"(default: {','.join(DEFAULT_BLOCKING_RULES)})")
+    parser.add_argument('--block-on', choices=['lemmas', 'forms', 'both'], default='lemmas',
+                       help='Build blocks from lemma keys, word-form keys or both (default: lemmas)')
+    parser.add_argument('--max-block-size', type=int, default=50,
+                       help='Skip blocks with more lemmas than this (default: 50)')
+    pipeline_metrics.add_arguments(parser)
 
     args = parser.parse_args()
+    blocking_rules = None
+    if args.blocking:
+        try:
+            blocking_rules = parse_blocking_rules(args.blocking)
+        except ValueError as e:
+            parser.error(str(e))
+    pipeline_metrics.from_args(args, 'generate_lemma_similarity_pairs')
 
     # Load corpus
-    corpus = load_corpus(args.corpus)
+    with stage('load_corpus'):
+        corpus = load_corpus(args.corpus)
 
     # Generate CSV
-    generate_csv(corpus, args.output)
+    with stage('generate_csv'):
+        generate_csv(corpus, args.output, args.workers,
+                     blocking_rules, args.block_on, args.max_block_size)
 
     print(f"\n✓ Done! CSV file: {args.output}")
     print(f"\nUsage examples:")
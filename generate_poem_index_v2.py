@@ -8,6 +8,7 @@ Features:
 - Enhanced metadata from CSV (title, collection, places, etc.)
 - Full morphological annotations from existing poems_index
 - Comprehensive verification suite
+- Per-poem content hashes for incremental rebuilds
 
 Usage:
     python generate_poem_index_v2.py \
@@ -15,6 +16,17 @@ Usage:
         --poems-index poems_index.json.gz \
         --output poems_index_v2.json.gz
 
+    # Rebuild only poems whose CSV row or v1 annotations changed
+    python generate_poem_index_v2.py --incremental --output poems_index_v2.json.gz
+
+    # Normalised v4 layout (tokens stored once, see poem_index_v4.py)
+    python generate_poem_index_v2.py --schema v4 --output poems_index_v4.json.gz
+
+    # Bounded-memory build: merge-join a CSV sorted by p_id with a sorted JSONL index
+    python generate_poem_index_v2.py --export-jsonl poems_index.jsonl.gz
+    python generate_poem_index_v2.py --streaming --csv koik_regilaulud_sorted.csv \
+        --poems-jsonl poems_index.jsonl.gz --output poems_index_v2.json.gz
+
 Created: 2025-12-14
 """
 
@@ -22,11 +34,36 @@ import json
 import gzip
 import csv
 import argparse
+import hashlib
 import sys
 from pathlib import Path
 from datetime import datetime
 from collections import defaultdict
 
+import pipeline_metrics
+import poem_index_io
+from pipeline_metrics import stage
+from poem_index_io import check_sorted, iter_poems_jsonl, merge_join, open_text, poem_sort_key
+from poem_index_v4 import PoemView, V4_FEATURES, verse_starts_from_lengths
+
+
+def extract_csv_row(row: dict) -> dict:
+    """Extract the fields used for the v2 index from a raw CSV row."""
+    return {
+        'poemText': row.get('poemText', ''),
+        'verseCount': int(row.get('verseCount', 0)) if row.get('verseCount') else 0,
+        'poemTitle': row.get('poemTitle', ''),
+        'nro': row.get('nro', ''),
+        'collection': row.get('collection', ''),
+        'placeNames': row.get('placeNames', ''),
+        'placeTypes': row.get('placeTypes', ''),
+        'placeOrigIds': row.get('placeOrigIds', ''),
+        'poemYear': row.get('poemYear', ''),
+        'typeNames': row.get('typeNames', ''),
+        'typeDescriptions': row.get('typeDescriptions', ''),
+        'collectorNames': row.get('collectorNames', '')
+    }
+
 
 def load_csv_data(csv_path: Path) -> dict:
     """
@@ -40,45 +77,44 @@ def load_csv_data(csv_path: Path) -> dict:
     with open(csv_path, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for row in reader:
-            poem_id = row['p_id']
-            csv_data[poem_id] = {
-                'poemText': row.get('poemText', ''),
-                'verseCount': int(row.get('verseCount', 0)) if row.get('verseCount') else 0,
-                'poemTitle': row.get('poemTitle', ''),
-                'nro': row.get('nro', ''),
-                'collection': row.get('collection', ''),
-                'placeNames': row.get('placeNames', ''),
-                'placeTypes': row.get('placeTypes', ''),
-                'placeOrigIds': row.get('placeOrigIds', ''),
-                'poemYear': row.get('poemYear', ''),
-                'typeNames': row.get('typeNames', ''),
-                'typeDescriptions': row.get('typeDescriptions', ''),
-                'collectorNames': row.get('collectorNames', '')
-            }
+            csv_data[row['p_id']] = extract_csv_row(row)
 
     print(f"  Loaded {len(csv_data):,} poems from CSV")
     return csv_data
 
 
-def load_poems_index(index_path: Path) -> dict:
+def iter_csv_data(csv_path: Path):
     """
-    Load existing poems index with annotations.
+    Stream CSV rows from a CSV sorted by p_id.
 
-    Handles both .json and .json.gz files.
+    Yields (poem_id, csv_row) in file order, one row in memory at a time.
     """
-    print(f"Loading poems index from {index_path}...")
+    with open(csv_path, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        rows = ((row['p_id'], extract_csv_row(row)) for row in reader)
+        yield from check_sorted(rows, str(csv_path))
 
-    if str(index_path).endswith('.gz'):
-        with gzip.open(index_path, 'rt', encoding='utf-8') as f:
-            data = json.load(f)
-    else:
-        with open(index_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
 
+def export_poems_jsonl(index_path: Path, jsonl_path: Path):
+    """Convert a JSON poems index into a JSONL index sorted by poem ID."""
+    poems_index = load_poems_index(index_path)
+    poems = poems_index['poems']
+
+    print(f"\nWriting sorted JSONL index to {jsonl_path}...")
+    with open_text(jsonl_path, 'wt') as f:
+        f.write(json.dumps({'metadata': poems_index['metadata']}, ensure_ascii=False) + '\n')
+        for poem_id in sorted(poems, key=poem_sort_key):
+            f.write(json.dumps({'poem_id': poem_id, 'poem': poems[poem_id]},
+                               ensure_ascii=False) + '\n')
+    print(f"  Wrote {len(poems):,} poems")
+
+
+def load_poems_index(index_path: Path) -> dict:
+    """Load existing poems index with annotations (.json, .json.gz or JSONL)."""
+    data = poem_index_io.load_poems_index(index_path)
     poems = data.get('poems', {})
     metadata = data.get('metadata', {})
 
-    print(f"  Loaded {len(poems):,} poems")
     print(f"  Version: {metadata.get('version', 'unknown')}")
     print(f"  Total words: {metadata.get('total_words', 'unknown'):,}")
 
@@ -242,17 +278,7 @@ def build_poem_v2(poem_id: str, csv_row: dict, poem_v1: dict) -> tuple:
         'words': aligned_words,
         'num_words': len(aligned_words),
         'is_empty': is_empty,  # Flag for empty poems
-        'metadata': {
-            'title': csv_row.get('poemTitle', ''),
-            'collection': csv_row.get('collection', ''),
-            'nro': csv_row.get('nro', ''),
-            'places': [p.strip() for p in csv_row.get('placeNames', '').split(',') if p.strip()],
-            'place_types': [p.strip() for p in csv_row.get('placeTypes', '').split(',') if p.strip()],
-            'year': csv_row.get('poemYear', ''),
-            'types': [t.strip() for t in csv_row.get('typeNames', '').split(',') if t.strip()],
-            'type_descriptions': [t.strip() for t in csv_row.get('typeDescriptions', '').split(',') if t.strip()],
-            'collectors': [c.strip() for c in csv_row.get('collectorNames', '').split(',') if c.strip()]
-        },
+        'metadata': build_poem_metadata(csv_row),
         'batch': poem_v1.get('batch', ''),
         'row_index': poem_v1.get('row_index', 0)
     }
@@ -260,18 +286,159 @@ def build_poem_v2(poem_id: str, csv_row: dict, poem_v1: dict) -> tuple:
     return poem_v2, issues
 
 
-def build_poems_index_v2(csv_data: dict, poems_index: dict) -> tuple:
+def build_poem_metadata(csv_row: dict) -> dict:
+    """Build the per-poem metadata block from a CSV row."""
+    return {
+        'title': csv_row.get('poemTitle', ''),
+        'collection': csv_row.get('collection', ''),
+        'nro': csv_row.get('nro', ''),
+        'places': [p.strip() for p in csv_row.get('placeNames', '').split(',') if p.strip()],
+        'place_types': [p.strip() for p in csv_row.get('placeTypes', '').split(',') if p.strip()],
+        'year': csv_row.get('poemYear', ''),
+        'types': [t.strip() for t in csv_row.get('typeNames', '').split(',') if t.strip()],
+        'type_descriptions': [t.strip() for t in csv_row.get('typeDescriptions', '').split(',') if t.strip()],
+        'collectors': [c.strip() for c in csv_row.get('collectorNames', '').split(',') if c.strip()]
+    }
+
+
+def build_poem_v4(poem_id: str, csv_row: dict, poem_v1: dict) -> tuple:
+    """
+    Build v4 poem entry (see poem_index_v4.py) from CSV data and v1 annotations.
+
+    The v1 annotation dicts are reused as-is; verse structure is stored as
+    word offsets instead of per-word fields and duplicated text.
+
+    Returns:
+        tuple: (poem_v4_dict, issues_list)
+    """
+    verse_lines, csv_words, cleaned_text = parse_verses(csv_row.get('poemText', ''))
+    v1_words = poem_v1.get('words', [])
+    is_empty = len(v1_words) == 0
+
+    issues = [] if is_empty else verify_word_alignment(poem_id, csv_words, v1_words)
+
+    poem_v4 = {
+        'words': v1_words,
+        'verse_starts': None,
+        'is_empty': is_empty,
+        'metadata': build_poem_metadata(csv_row),
+        'batch': poem_v1.get('batch', ''),
+        'row_index': poem_v1.get('row_index', 0)
+    }
+
+    if not issues and (not is_empty or not verse_lines):
+        poem_v4['verse_starts'] = verse_starts_from_lengths([len(v.split()) for v in verse_lines])
+        # Keep the CSV text if tokens cannot reproduce it (e.g. repeated spaces)
+        if PoemView(poem_v4).text != cleaned_text:
+            poem_v4['verse_starts'] = None
+    if poem_v4['verse_starts'] is None and cleaned_text:
+        poem_v4['text_override'] = cleaned_text
+
+    return poem_v4, issues
+
+
+def compute_poem_hash(csv_row: dict, poem_v1: dict) -> str:
+    """
+    Hash the inputs a v2 poem is built from.
+
+    Covers the poem's CSV row and its v1 entry (annotations, batch,
+    row_index), so any change to either produces a different hash.
+    """
+    payload = json.dumps([csv_row, poem_v1], ensure_ascii=False, sort_keys=True,
+                         separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_hashes_path(output_path: Path) -> Path:
+    """Return the content hash file stored alongside an output index."""
+    name = output_path.name
+    for suffix in ('.json.gz', '.json'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return output_path.with_name(f"{name}.hashes.json")
+
+
+def load_content_hashes(hashes_path: Path) -> dict:
+    """
+    Load per-poem content hashes written by a previous build.
+
+    Returns dict: {'hashes': {poem_id: sha256}, 'issues': {poem_id: [...]}}
+    """
+    with open(hashes_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return {'hashes': data.get('hashes', {}), 'issues': data.get('issues', {})}
+
+
+def save_content_hashes(hashes_path: Path, hashes: dict, issues: dict):
+    """Save per-poem content hashes and build issues for incremental rebuilds."""
+    print(f"Saving content hashes to {hashes_path}...")
+    with open(hashes_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'algorithm': 'sha256',
+            'hashes': hashes,
+            'issues': issues
+        }, f, ensure_ascii=False)
+
+
+def build_metadata_v2(total_poems: int, total_words: int, total_verses: int,
+                      empty_poems: int, schema: str = 'v2') -> dict:
+    """Build the index metadata block from build totals."""
+    metadata = {
+        'version': schema,
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'created_from': 'poems_index + koik_regilaulud_okt_2025.csv',
+        'total_poems': total_poems,
+        'total_words': total_words,
+        'total_verses': total_verses,
+        'empty_poems': empty_poems,
+        'non_empty_poems': total_poems - empty_poems,
+        'avg_words_per_poem': total_words / total_poems if total_poems else 0,
+        'avg_verses_per_poem': total_verses / total_poems if total_poems else 0,
+        'features': [
+            'verse_markers',
+            'verse_lines_array',
+            'enhanced_metadata',
+            'verse_indices_per_word',
+            'morphological_annotations',
+            'empty_poem_tracking'
+        ]
+    }
+    if schema == 'v4':
+        metadata['features'] = V4_FEATURES
+    return metadata
+
+
+def build_poems_index_v2(csv_data: dict, poems_index: dict, previous: dict = None,
+                         schema: str = 'v2') -> tuple:
     """
     Build v2 index merging CSV text with annotations.
 
+    Args:
+        csv_data: CSV rows by poem ID (see load_csv_data)
+        poems_index: v1 index (see load_poems_index)
+        previous: Optional previous build for incremental mode:
+            {'poems': {...}, 'hashes': {...}, 'issues': {...}}.
+            Poems whose content hash is unchanged are reused as-is.
+        schema: 'v2' (default) or 'v4' for the normalised layout
+
     Returns:
-        tuple: (index_v2, all_issues)
+        tuple: (index_v2, all_issues, content_hashes)
     """
-    print("\nBuilding poems_index_v2...")
+    print(f"\nBuilding poems_index_{schema}...")
+    build_poem = build_poem_v4 if schema == 'v4' else build_poem_v2
 
     poems_v1 = poems_index['poems']
     poems_v2 = {}
     all_issues = {}
+    content_hashes = {}
+
+    previous_poems = previous['poems'] if previous else {}
+    previous_hashes = previous['hashes'] if previous else {}
+    previous_issues = previous['issues'] if previous else {}
+    rebuilt = 0
+    reused = 0
 
     total_words = 0
     total_verses = 0
@@ -287,45 +454,40 @@ def build_poems_index_v2(csv_data: dict, poems_index: dict) -> tuple:
 
         # Get CSV data for this poem
         csv_row = csv_data.get(poem_id)
+        poem_hash = compute_poem_hash(csv_row, poem_v1)
+        content_hashes[poem_id] = poem_hash
 
         if csv_row is None:
             all_issues[poem_id] = [f"Poem {poem_id} not found in CSV"]
             poems_v2[poem_id] = poem_v1  # Keep original
             continue
 
-        # Build v2 entry
-        poem_v2, issues = build_poem_v2(poem_id, csv_row, poem_v1)
+        # Reuse the previous entry if its inputs are unchanged
+        if previous_hashes.get(poem_id) == poem_hash and poem_id in previous_poems:
+            poem_v2 = previous_poems[poem_id]
+            issues = previous_issues.get(poem_id, [])
+            reused += 1
+        else:
+            poem_v2, issues = build_poem(poem_id, csv_row, poem_v1)
+            rebuilt += 1
         poems_v2[poem_id] = poem_v2
 
         if issues:
             all_issues[poem_id] = issues
 
-        total_words += poem_v2['num_words']
-        total_verses += poem_v2['verse_count']
+        view = PoemView(poem_v2)
+        total_words += view.num_words
+        total_verses += view.verse_count
         if poem_v2.get('is_empty', False):
             empty_poems += 1
 
     # Build v2 metadata
-    metadata_v2 = {
-        'version': 'v2',
-        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'created_from': 'poems_index + koik_regilaulud_okt_2025.csv',
-        'total_poems': len(poems_v2),
-        'total_words': total_words,
-        'total_verses': total_verses,
-        'empty_poems': empty_poems,
-        'non_empty_poems': len(poems_v2) - empty_poems,
-        'avg_words_per_poem': total_words / len(poems_v2) if poems_v2 else 0,
-        'avg_verses_per_poem': total_verses / len(poems_v2) if poems_v2 else 0,
-        'features': [
-            'verse_markers',
-            'verse_lines_array',
-            'enhanced_metadata',
-            'verse_indices_per_word',
-            'morphological_annotations',
-            'empty_poem_tracking'
-        ]
-    }
+    metadata_v2 = build_metadata_v2(len(poems_v2), total_words, total_verses, empty_poems, schema)
+    if previous:
+        metadata_v2['incremental'] = {
+            'rebuilt_poems': rebuilt,
+            'reused_poems': reused
+        }
 
     index_v2 = {
         'metadata': metadata_v2,
@@ -337,8 +499,84 @@ def build_poems_index_v2(csv_data: dict, poems_index: dict) -> tuple:
     print(f"  Total verses: {total_verses:,}")
     print(f"  Empty poems: {empty_poems:,}")
     print(f"  Issues found: {len(all_issues)}")
+    if previous:
+        print(f"  Rebuilt poems: {rebuilt:,} (reused {reused:,} unchanged)")
+
+    return index_v2, all_issues, content_hashes
+
+
+def build_poems_index_v2_streaming(csv_rows, index_poems, output_path: Path,
+                                   schema: str = 'v2') -> tuple:
+    """
+    Build v2 index by merge-joining two poem-ID-sorted streams.
 
-    return index_v2, all_issues
+    Poems are joined, built and written one at a time, so memory stays
+    flat regardless of corpus size. Poems missing from the CSV are kept
+    as-is (like build_poems_index_v2); CSV rows without annotations are
+    reported and skipped.
+
+    Returns:
+        tuple: (metadata_v2, all_issues, content_hashes)
+    """
+    print(f"\nBuilding poems_index_{schema} (streaming) into {output_path}...")
+    build_poem = build_poem_v4 if schema == 'v4' else build_poem_v2
+
+    all_issues = {}
+    content_hashes = {}
+    extra_csv_ids = 0
+
+    total_poems = 0
+    total_words = 0
+    total_verses = 0
+    empty_poems = 0
+
+    with gzip.open(output_path, 'wt', encoding='utf-8') as f:
+        f.write('{\n  "poems": {')
+        for poem_id, csv_row, poem_v1 in merge_join(csv_rows, index_poems):
+            if poem_v1 is None:
+                extra_csv_ids += 1
+                print(f"  Extra: poem {poem_id} in CSV but not in poems index")
+                continue
+
+            content_hashes[poem_id] = compute_poem_hash(csv_row, poem_v1)
+
+            if csv_row is None:
+                print(f"  Missing: poem {poem_id} not found in CSV")
+                all_issues[poem_id] = [f"Poem {poem_id} not found in CSV"]
+                poem_v2 = poem_v1  # Keep original
+            else:
+                poem_v2, issues = build_poem(poem_id, csv_row, poem_v1)
+                if issues:
+                    all_issues[poem_id] = issues
+                view = PoemView(poem_v2)
+                total_words += view.num_words
+                total_verses += view.verse_count
+                if poem_v2.get('is_empty', False):
+                    empty_poems += 1
+
+            f.write(',' if total_poems else '')
+            f.write(f"\n    {json.dumps(poem_id)}: ")
+            f.write(json.dumps(poem_v2, ensure_ascii=False))
+            total_poems += 1
+
+            if total_poems % 10000 == 0:
+                print(f"  Processing: {total_poems:,} poems")
+
+        metadata_v2 = build_metadata_v2(total_poems, total_words, total_verses,
+                                        empty_poems, schema)
+        metadata_v2['build_mode'] = 'streaming'
+        f.write('\n  },\n  "metadata": ')
+        f.write(json.dumps(metadata_v2, ensure_ascii=False, indent=2))
+        f.write('\n}\n')
+
+    print(f"\n  Total poems: {total_poems:,}")
+    print(f"  Total words: {total_words:,}")
+    print(f"  Total verses: {total_verses:,}")
+    print(f"  Empty poems: {empty_poems:,}")
+    print(f"  Extra CSV rows: {extra_csv_ids:,}")
+    print(f"  Issues found: {len(all_issues)}")
+
+    return metadata_v2, all_issues, content_hashes
 
 
 def run_verification(index_v2: dict, csv_data: dict, poems_v1: dict) -> tuple:
@@ -354,6 +592,9 @@ def run_verification(index_v2: dict, csv_data: dict, poems_v1: dict) -> tuple:
 
     poems = index_v2['poems']
     metadata = index_v2['metadata']
+    if metadata.get('version') == 'v4':
+        # Check the derived v2 view of normalised poems
+        poems = {poem_id: PoemView(poem) for poem_id, poem in poems.items()}
 
     # Known data characteristics (from source data analysis)
     KNOWN_EMPTY_POEMS = 844  # Poems with empty text in source data
@@ -567,7 +808,11 @@ def save_index(index_v2: dict, output_path: Path):
     with gzip.open(output_path, 'wt', encoding='utf-8') as f:
         json.dump(index_v2, f, ensure_ascii=False, indent=2)
 
-    # Verify the saved file
+    return verify_saved_file(output_path)
+
+
+def verify_saved_file(output_path: Path):
+    """Check gzip integrity and size of a saved index."""
     print("Verifying saved file...")
     import subprocess
     result = subprocess.run(['gzip', '-t', str(output_path)], capture_output=True)
@@ -588,6 +833,43 @@ def save_index(index_v2: dict, output_path: Path):
     return True
 
 
+def run_streaming(args):
+    """Run the bounded-memory merge-join build."""
+    print("=" * 60)
+    print("POEMS INDEX V2 GENERATOR (STREAMING)")
+    print("=" * 60)
+    print(f"CSV source (sorted): {args.csv}")
+    print(f"Poems index (sorted JSONL): {args.poems_jsonl}")
+    print(f"Output: {args.output}")
+    print("=" * 60)
+
+    with stage('stream_build') as s:
+        metadata_v2, issues, content_hashes = build_poems_index_v2_streaming(
+            iter_csv_data(args.csv), iter_poems_jsonl(args.poems_jsonl), args.output, args.schema
+        )
+        s.items = metadata_v2['total_poems']
+
+    if args.issues_file and issues:
+        print(f"\nSaving {len(issues)} issues to {args.issues_file}...")
+        with open(args.issues_file, 'w', encoding='utf-8') as f:
+            json.dump(issues, f, ensure_ascii=False, indent=2)
+
+    if not args.skip_verification:
+        print("\nNote: the verification suite needs the full index in memory and is")
+        print("not run in streaming mode. Run it on the saved output if required.")
+
+    with stage('verify_saved_file'):
+        saved = verify_saved_file(args.output)
+    if not saved:
+        print("\n✗ Save failed!")
+        sys.exit(1)
+    save_content_hashes(get_hashes_path(args.output), content_hashes, issues)
+
+    print("\n" + "=" * 60)
+    print("✓ COMPLETE")
+    print("=" * 60)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Generate poems_index_v2 with verse line markers'
@@ -626,23 +908,98 @@ def main():
         action='store_true',
         help='Save output even if verification fails (non-interactive)'
     )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Rebuild only poems whose content hash changed since the previous build'
+    )
+    parser.add_argument(
+        '--previous',
+        type=Path,
+        default=None,
+        help='Previous v2 index for --incremental (default: the --output file)'
+    )
+    parser.add_argument(
+        '--schema',
+        choices=['v2', 'v4'],
+        default='v2',
+        help='Output schema: v2 (default) or normalised v4 (see poem_index_v4.py)'
+    )
+    parser.add_argument(
+        '--streaming',
+        action='store_true',
+        help='Merge-join a p_id-sorted CSV with a sorted JSONL index in bounded memory'
+    )
+    parser.add_argument(
+        '--poems-jsonl',
+        type=Path,
+        default=Path('poems_index.jsonl.gz'),
+        help='Sorted JSONL poems index for --streaming'
+    )
+    parser.add_argument(
+        '--export-jsonl',
+        type=Path,
+        default=None,
+        help='Convert --poems-index to a sorted JSONL index at this path and exit'
+    )
+    pipeline_metrics.add_arguments(parser)
 
     args = parser.parse_args()
+    pipeline_metrics.from_args(args, 'generate_poem_index_v2')
+
+    if args.streaming and args.incremental:
+        parser.error('--streaming and --incremental cannot be combined')
+
+    if args.export_jsonl:
+        with stage('export_jsonl'):
+            export_poems_jsonl(args.poems_index, args.export_jsonl)
+        return
+
+    if args.streaming:
+        run_streaming(args)
+        return
 
     print("=" * 60)
     print("POEMS INDEX V2 GENERATOR")
     print("=" * 60)
     print(f"CSV source: {args.csv}")
     print(f"Poems index: {args.poems_index}")
-    print(f"Output: {args.output}")
+    print(f"Output: {args.output} (schema {args.schema})")
+    if args.incremental:
+        print("Mode: incremental")
     print("=" * 60)
 
     # Load data
-    csv_data = load_csv_data(args.csv)
-    poems_index = load_poems_index(args.poems_index)
+    with stage('load_csv') as s:
+        csv_data = load_csv_data(args.csv)
+        s.items = len(csv_data)
+    with stage('load_poems_index') as s:
+        poems_index = load_poems_index(args.poems_index)
+        s.items = len(poems_index['poems'])
+
+    # Load previous build for incremental mode
+    previous = None
+    if args.incremental:
+        previous_path = args.previous or args.output
+        hashes_path = get_hashes_path(previous_path)
+        if previous_path.exists() and hashes_path.exists():
+            with stage('load_previous'):
+                previous_index = load_poems_index(previous_path)
+            if previous_index['metadata'].get('version') == args.schema:
+                previous = load_content_hashes(hashes_path)
+                previous['poems'] = previous_index['poems']
+                print(f"  Loaded {len(previous['hashes']):,} content hashes from {hashes_path}")
+            else:
+                print(f"⚠ Previous build is not a {args.schema} index, doing a full build")
+        else:
+            print(f"⚠ No previous build with content hashes at {previous_path}, doing a full build")
 
     # Build v2
-    index_v2, issues = build_poems_index_v2(csv_data, poems_index)
+    with stage('build_index') as s:
+        index_v2, issues, content_hashes = build_poems_index_v2(
+            csv_data, poems_index, previous, args.schema
+        )
+        s.items = len(index_v2['poems'])
 
     # Save issues if requested
     if args.issues_file and issues:
@@ -652,9 +1009,10 @@ def main():
 
     # Run verification
     if not args.skip_verification:
-        all_passed, verification_results = run_verification(
-            index_v2, csv_data, poems_index['poems']
-        )
+        with stage('verification', items=len(index_v2['poems'])):
+            all_passed, verification_results = run_verification(
+                index_v2, csv_data, poems_index['poems']
+            )
 
         if not all_passed:
             print("\n⚠ WARNING: Some verification checks did not pass.")
@@ -671,9 +1029,12 @@ def main():
                 print("--force-save enabled, proceeding with save...")
 
     # Save output
-    if not save_index(index_v2, args.output):
+    with stage('save', items=len(index_v2['poems'])):
+        saved = save_index(index_v2, args.output)
+    if not saved:
         print("\n✗ Save failed!")
         sys.exit(1)
+    save_content_hashes(get_hashes_path(args.output), content_hashes, issues)
 
     print("\n" + "=" * 60)
     print("✓ COMPLETE")
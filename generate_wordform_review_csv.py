@@ -19,6 +19,9 @@ from collections import Counter
 from pathlib import Path
 import random
 
+import pipeline_metrics
+from pipeline_metrics import stage
+
 
 def load_corpus(corpus_path='corpus_validation_improved.json.gz'):
     """Load the corpus JSON file"""
@@ -278,20 +281,22 @@ def generate_csv(corpus, poems, context_map, top_n=20000, output_path='wordform_
 
     # Process all word forms
     rows = []
-    for idx, (word_form, freq) in enumerate(top_word_forms, 1):
-        if idx % 1000 == 0:
-            print(f"  Processed {idx:,} / {len(top_word_forms):,} ({idx/len(top_word_forms)*100:.1f}%)")
+    with stage('analyze_word_forms', items=len(top_word_forms)):
+        for idx, (word_form, freq) in enumerate(top_word_forms, 1):
+            if idx % 1000 == 0:
+                print(f"  Processed {idx:,} / {len(top_word_forms):,} ({idx/len(top_word_forms)*100:.1f}%)")
 
-        word_data = words_data[word_form]
-        row = analyze_word_form(word_form, word_data, poems, context_map)
-        rows.append(row)
+            word_data = words_data[word_form]
+            row = analyze_word_form(word_form, word_data, poems, context_map)
+            rows.append(row)
 
     # Write CSV
     print(f"\nWriting CSV to {output_path}...")
-    with open(output_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=columns)
-        writer.writeheader()
-        writer.writerows(rows)
+    with stage('write_csv', items=len(rows)):
+        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
 
     print(f"✓ CSV written with {len(rows):,} word forms")
 
@@ -323,20 +328,27 @@ def main():
                        help='Output CSV file path (default: wordform_review_20k.csv)')
     parser.add_argument('--top-n', type=int, default=20000,
                        help='Number of top word forms to include (default: 20000)')
+    pipeline_metrics.add_arguments(parser)
 
     args = parser.parse_args()
+    pipeline_metrics.from_args(args, 'generate_wordform_review_csv')
 
     # Load corpus
-    corpus = load_corpus(args.corpus)
+    with stage('load_corpus'):
+        corpus = load_corpus(args.corpus)
 
     # Load poems index
-    poems = load_poems_index(args.poems)
+    with stage('load_poems_index') as s:
+        poems = load_poems_index(args.poems)
+        s.items = len(poems['poems'])
 
     # Build context mapping
-    context_map = build_context_mapping(poems)
+    with stage('build_context_mapping', items=len(poems['poems'])):
+        context_map = build_context_mapping(poems)
 
     # Generate CSV
-    generate_csv(corpus, poems, context_map, top_n=args.top_n, output_path=args.output)
+    with stage('generate_csv'):
+        generate_csv(corpus, poems, context_map, top_n=args.top_n, output_path=args.output)
 
     print(f"\n✓ Done! CSV file: {args.output}")
     print(f"\nUsage for LLM validation:")
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Lemma co-occurrence and collocation statistics (PMI, log-likelihood, Dice).
+
+Builds a sparse unit x lemma presence matrix X, where a unit is a poem
+or a verse, and computes all lemma pair co-occurrence counts with one
+sparse product C = X^T X. Association scores for every non-zero pair are
+computed on whole arrays:
+
+- PMI:            log2(n_ab * N / (n_a * n_b))
+- log-likelihood: Dunning's G2 on the 2x2 contingency table
+- Dice:           2 * n_ab / (n_a + n_b)
+
+where N is the number of units, n_a / n_b the number of units containing
+each lemma and n_ab the number containing both. The product is computed
+in blocks of lemma rows, keeping only the top-k neighbours per lemma, so
+memory stays bounded for the full lemma inventory.
+
+Inputs:
+- --corpus: aggregate corpus (poem level, from lemma_index[*].source_poems)
+- --poems-index: poems index or corpus_arrays.npz (poem or verse level)
+
+Usage:
+    python lemma_cooccurrence.py --corpus corpus_full_source_poems_v2.json.gz \
+        --output lemma_collocations_poem.csv --top-k 20
+
+    python lemma_cooccurrence.py --poems-index poems_index_v3.json.gz --unit verse \
+        --output lemma_collocations_verse.csv --measure pmi --min-pair-count 5
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from corpus_arrays import load_token_arrays
+
+
+MEASURES = ('log_likelihood', 'pmi', 'dice')
+
+
+def load_corpus(corpus_path: Path) -> dict:
+    """Load the corpus JSON file"""
+    print(f"Loading corpus from {corpus_path}...")
+    with gzip.open(corpus_path, 'rt', encoding='utf-8') as f:
+        corpus = json.load(f)
+    print(f"✓ Loaded corpus with {len(corpus['lemma_index']):,} lemmas")
+    return corpus
+
+
+def matrix_from_lemma_index(corpus: dict) -> tuple:
+    """
+    Build a poem x lemma presence matrix from lemma_index source_poems.
+
+    Returns:
+        tuple: (csr_matrix, lemma_list)
+    """
+    lemma_index = corpus['lemma_index']
+    lemmas = list(lemma_index)
+    poem_table = sorted({p for d in lemma_index.values() for p in d.get('source_poems', {})}, key=int)
+    ordinal_of = {poem_id: i for i, poem_id in enumerate(poem_table)}
+
+    rows, cols = [], []
+    for col, lemma in enumerate(lemmas):
+        source_poems = lemma_index[lemma].get('source_poems', {})
+        rows.append(np.fromiter((ordinal_of[p] for p in source_poems), dtype=np.int32,
+                                count=len(source_poems)))
+        cols.append(np.full(len(source_poems), col, dtype=np.int32))
+
+    rows = np.concatenate(rows) if rows else np.zeros(0, np.int32)
+    cols = np.concatenate(cols) if cols else np.zeros(0, np.int32)
+    data = np.ones(rows.size, dtype=np.float64)
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(poem_table), len(lemmas)))
+    return matrix, lemmas
+
+
+def matrix_from_token_arrays(arrays, unit: str = 'poem') -> tuple:
+    """
+    Build a poem x lemma or verse x lemma presence matrix from token arrays.
+
+    Returns:
+        tuple: (csr_matrix, lemma_list)
+    """
+    lemma_codes = arrays.codes['lemma']
+    if unit == 'verse':
+        units, num_units = arrays.verse_units()
+        keep = units >= 0
+        units, lemma_codes = units[keep], lemma_codes[keep]
+    else:
+        units, num_units = arrays.poem_of_token(), arrays.num_poems
+
+    data = np.ones(units.size, dtype=np.float64)
+    matrix = sparse.csr_matrix((data, (units, lemma_codes)),
+                               shape=(num_units, len(arrays.vocab['lemma'])))
+    matrix.data[:] = 1.0  # Presence, not token counts
+    return matrix, list(arrays.vocab['lemma'])
+
+
+def filter_lemmas(matrix, lemmas: list, min_count: int) -> tuple:
+    """Keep lemmas that occur in at least min_count units."""
+    doc_freq = np.asarray(matrix.sum(axis=0)).ravel()
+    keep = np.flatnonzero(doc_freq >= min_count)
+    return matrix[:, keep].tocsr(), [lemmas[i] for i in keep]
+
+
+def _xlogx_ratio(observed: np.ndarray, expected: np.ndarray) -> np.ndarray:
+    """observed * ln(observed / expected), with 0 * ln(0) = 0."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = observed * np.log(observed / expected)
+    return np.where(observed > 0, terms, 0.0)
+
+
+def association_scores(n_ab: np.ndarray, n_a: np.ndarray, n_b: np.ndarray, total: int) -> dict:
+    """
+    Vectorised PMI, log-likelihood (G2) and Dice for arrays of pair counts.
+
+    Log-likelihood is signed: negative for pairs that co-occur less often
+    than expected.
+    """
+    n_ab = n_ab.astype(np.float64)
+    n_a = n_a.astype(np.float64)
+    n_b = n_b.astype(np.float64)
+    N = float(total)
+
+    expected = n_a * n_b / N
+    with np.errstate(divide='ignore'):
+        pmi = np.log2(n_ab / expected)
+
+    k11 = n_ab
+    k12 = n_a - n_ab
+    k21 = n_b - n_ab
+    k22 = N - n_a - n_b + n_ab
+    g2 = 2 * (
+        _xlogx_ratio(k11, n_a * n_b / N)
+        + _xlogx_ratio(k12, n_a * (N - n_b) / N)
+        + _xlogx_ratio(k21, (N - n_a) * n_b / N)
+        + _xlogx_ratio(k22, (N - n_a) * (N - n_b) / N)
+    )
+    log_likelihood = np.where(n_ab >= expected, g2, -g2)
+
+    dice = 2 * n_ab / (n_a + n_b)
+    return {'pmi': pmi, 'log_likelihood': log_likelihood, 'dice': dice}
+
+
+def top_neighbours(matrix, lemmas: list, top_k: int = 20, measure: str = 'log_likelihood',
+                   min_pair_count: int = 3, block_size: int = 2000) -> list:
+    """
+    Top-k associated lemmas for every lemma.
+
+    Co-occurrence counts are computed block-wise as X[:, block]^T X and
+    reduced to the top-k pairs per row before the next block.
+
+    Returns:
+        list of dicts (one per lemma pair, ordered by lemma then rank)
+    """
+    total_units = matrix.shape[0]
+    doc_freq = np.asarray(matrix.sum(axis=0)).ravel()
+    matrix_csc = matrix.tocsc()
+    matrix_t = matrix.T.tocsr()
+    num_lemmas = len(lemmas)
+
+    rows = []
+    for start in range(0, num_lemmas, block_size):
+        end = min(start + block_size, num_lemmas)
+        counts = (matrix_t[start:end] @ matrix_csc).tocoo()
+        row = counts.row + start
+        col = counts.col
+        n_ab = counts.data
+
+        keep = (row != col) & (n_ab >= min_pair_count)
+        row, col, n_ab = row[keep], col[keep], n_ab[keep]
+        scores = association_scores(n_ab, doc_freq[row], doc_freq[col], total_units)
+
+        # Rank within each row by the chosen measure and keep the top k
+        order = np.lexsort((-scores[measure], row))
+        row_sorted = row[order]
+        first_in_row = np.searchsorted(row_sorted, row_sorted, side='left')
+        rank = np.arange(order.size) - first_in_row
+        selected = order[rank < top_k]
+        ranks = rank[rank < top_k] + 1
+
+        for i, r in zip(selected, ranks):
+            rows.append({
+                'lemma': lemmas[row[i]],
+                'neighbour': lemmas[col[i]],
+                'rank': int(r),
+                'cooccurrences': int(n_ab[i]),
+                'lemma_units': int(doc_freq[row[i]]),
+                'neighbour_units': int(doc_freq[col[i]]),
+                'pmi': round(float(scores['pmi'][i]), 4),
+                'log_likelihood': round(float(scores['log_likelihood'][i]), 4),
+                'dice': round(float(scores['dice'][i]), 4)
+            })
+        print(f"  Scored lemmas {end:,} / {num_lemmas:,}")
+
+    return rows
+
+
+def pair_scores(matrix, lemmas: list, lemma_a: str, lemma_b: str) -> dict:
+    """Association scores for a single lemma pair."""
+    index = {lemma: i for i, lemma in enumerate(lemmas)}
+    col_a = matrix[:, index[lemma_a]]
+    col_b = matrix[:, index[lemma_b]]
+    n_ab = np.array([col_a.multiply(col_b).sum()])
+    n_a = np.array([col_a.sum()])
+    n_b = np.array([col_b.sum()])
+    scores = association_scores(n_ab, n_a, n_b, matrix.shape[0])
+    return {
+        'cooccurrences': int(n_ab[0]),
+        **{name: float(values[0]) for name, values in scores.items()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Lemma co-occurrence and collocation statistics (PMI, log-likelihood, Dice)'
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--corpus', type=Path, default=None,
+                        help='Aggregate corpus (poem-level units from lemma_index source_poems)')
+    source.add_argument('--poems-index', type=Path, default=None,
+                        help='Poems index or corpus_arrays.npz (poem- or verse-level units)')
+    parser.add_argument('--unit', choices=['poem', 'verse'], default='poem',
+                        help='Co-occurrence unit (verse requires --poems-index)')
+    parser.add_argument('--output', type=Path, default=Path('lemma_collocations.csv'),
+                        help='Output CSV file path (default: lemma_collocations.csv)')
+    parser.add_argument('--top-k', type=int, default=20, help='Neighbours per lemma')
+    parser.add_argument('--measure', choices=MEASURES, default='log_likelihood',
+                        help='Measure used to rank neighbours')
+    parser.add_argument('--min-count', type=int, default=5,
+                        help='Minimum number of units a lemma must occur in')
+    parser.add_argument('--min-pair-count', type=int, default=3,
+                        help='Minimum co-occurrences for a pair to be scored')
+    parser.add_argument('--block-size', type=int, default=2000,
+                        help='Lemmas per sparse product block')
+
+    args = parser.parse_args()
+
+    if args.corpus:
+        if args.unit == 'verse':
+            parser.error('--unit verse requires --poems-index')
+        matrix, lemmas = matrix_from_lemma_index(load_corpus(args.corpus))
+    else:
+        arrays = load_token_arrays(args.poems_index or Path('poems_index_v3.json.gz'))
+        matrix, lemmas = matrix_from_token_arrays(arrays, args.unit)
+
+    matrix, lemmas = filter_lemmas(matrix, lemmas, args.min_count)
+    print(f"\n{args.unit.capitalize()} x lemma matrix: {matrix.shape[0]:,} x {matrix.shape[1]:,}, "
+          f"{matrix.nnz:,} non-zeros")
+
+    print(f"\nScoring lemma pairs (top {args.top_k} by {args.measure})...")
+    rows = top_neighbours(matrix, lemmas, args.top_k, args.measure,
+                          args.min_pair_count, args.block_size)
+
+    columns = ['lemma', 'neighbour', 'rank', 'cooccurrences', 'lemma_units',
+               'neighbour_units', 'pmi', 'log_likelihood', 'dice']
+    print(f"\nWriting CSV to {args.output}...")
+    with open(args.output, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"✓ CSV written with {len(rows):,} lemma pairs")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
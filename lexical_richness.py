@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Per-poem lexical richness metrics for the whole corpus at once.
+
+Computes, for every poem and for both lemmas and word forms:
+
+- ttr:          types / tokens
+- mattr:        moving-average TTR over a sliding window (TTR if the poem
+                is shorter than the window)
+- hapax_ratio:  types occurring once / types
+- dis_ratio:    types occurring twice / types
+- yules_k:      10^4 * (sum_i i^2 V_i - N) / N^2
+
+All metrics are grouped NumPy reductions over the integer-encoded token
+stream (see corpus_arrays.py); there is no per-poem Python loop.
+
+MATTR is computed without materialising windows: a token adds one type
+to every window that contains it but not its previous occurrence in the
+same poem, so its contribution is the number of such windows.
+
+Usage:
+    python lexical_richness.py --poems-index poems_index_v3.json.gz \
+        --output poem_lexical_richness.csv --window 50
+"""
+
+import argparse
+import csv
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from corpus_arrays import load_token_arrays
+
+
+METRICS = ('types', 'ttr', 'mattr', 'hapax_ratio', 'dis_ratio', 'yules_k')
+
+
+def richness_metrics(codes: np.ndarray, poem_offsets: np.ndarray, vocab_size: int,
+                     window: int = 50) -> dict:
+    """
+    Lexical richness metrics per poem for one token field.
+
+    Args:
+        codes: Type code per token, in poem order
+        poem_offsets: Token offsets of each poem (length num_poems + 1)
+        vocab_size: Number of distinct codes
+        window: MATTR window size in tokens
+
+    Returns:
+        dict of metric name -> float array (NaN for empty poems)
+    """
+    num_poems = poem_offsets.size - 1
+    lengths = np.diff(poem_offsets)
+    poem = np.repeat(np.arange(num_poems, dtype=np.int64), lengths)
+    position = np.arange(codes.size, dtype=np.int64) - poem_offsets[poem]
+
+    # Frequency of each (poem, type) pair
+    keys = poem * vocab_size + codes.astype(np.int64)
+    pair_keys, pair_freq = np.unique(keys, return_counts=True)
+    pair_poem = pair_keys // vocab_size
+
+    types = np.bincount(pair_poem, minlength=num_poems).astype(np.float64)
+    hapax = np.bincount(pair_poem, weights=(pair_freq == 1), minlength=num_poems)
+    dis = np.bincount(pair_poem, weights=(pair_freq == 2), minlength=num_poems)
+    sum_sq = np.bincount(pair_poem, weights=pair_freq.astype(np.float64) ** 2, minlength=num_poems)
+
+    n = lengths.astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ttr = types / n
+        hapax_ratio = hapax / types
+        dis_ratio = dis / types
+        yules_k = 1e4 * (sum_sq - n) / (n ** 2)
+
+    # MATTR: previous occurrence of the same type within the poem
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    prev_position = np.full(codes.size, -1, dtype=np.int64)
+    same = np.flatnonzero(sorted_keys[1:] == sorted_keys[:-1])
+    prev_position[order[same + 1]] = position[order[same]]
+
+    poem_len = lengths[poem]
+    last_window = poem_len - window
+    first = np.maximum(prev_position + 1, position - window + 1)
+    last = np.minimum(position, last_window)
+    contribution = np.clip(last - first + 1, 0, None)
+    type_windows = np.bincount(poem, weights=contribution, minlength=num_poems)
+    num_windows = (lengths - window + 1).astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mattr = np.where(lengths >= window, type_windows / (window * num_windows), ttr)
+
+    return {
+        'types': types,
+        'ttr': ttr,
+        'mattr': mattr,
+        'hapax_ratio': hapax_ratio,
+        'dis_ratio': dis_ratio,
+        'yules_k': yules_k
+    }
+
+
+def corpus_richness(arrays, window: int = 50) -> dict:
+    """Richness metrics per poem for lemmas and word forms."""
+    return {
+        field: richness_metrics(arrays.codes[field], arrays.poem_offsets,
+                                len(arrays.vocab[field]), window)
+        for field in ('lemma', 'word')
+    }
+
+
+def write_table(arrays, results: dict, output_path: Path):
+    """Write per-poem metrics as CSV (empty poems get blank metrics)."""
+    columns = ['poem_id', 'tokens'] + [
+        f'{field}_{metric}' for field in ('lemma', 'word') for metric in METRICS
+    ]
+    lengths = arrays.poem_lengths()
+
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for i, poem_id in enumerate(arrays.poem_ids):
+            row = [poem_id, int(lengths[i])]
+            for field in ('lemma', 'word'):
+                for metric in METRICS:
+                    value = results[field][metric][i]
+                    if np.isnan(value):
+                        row.append('')
+                    elif metric == 'types':
+                        row.append(int(value))
+                    else:
+                        row.append(round(float(value), 4))
+            writer.writerow(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Per-poem lexical richness metrics (TTR, MATTR, hapax ratios, Yule\'s K)'
+    )
+    parser.add_argument('--poems-index', type=Path, default=Path('poems_index_v3.json.gz'),
+                        help='Poems index or corpus_arrays.npz')
+    parser.add_argument('--output', type=Path, default=Path('poem_lexical_richness.csv'),
+                        help='Output CSV file path (default: poem_lexical_richness.csv)')
+    parser.add_argument('--window', type=int, default=50,
+                        help='MATTR window size in tokens (default: 50)')
+
+    args = parser.parse_args()
+
+    arrays = load_token_arrays(args.poems_index)
+    print(f"\nComputing metrics for {arrays.num_poems:,} poems, {arrays.num_tokens:,} tokens...")
+    results = corpus_richness(arrays, args.window)
+
+    print(f"Writing CSV to {args.output}...")
+    write_table(arrays, results, args.output)
+
+    print(f"✓ CSV written with {arrays.num_poems:,} poems")
+    for field in ('lemma', 'word'):
+        print(f"  Median {field} TTR: {np.nanmedian(results[field]['ttr']):.3f}, "
+              f"MATTR: {np.nanmedian(results[field]['mattr']):.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
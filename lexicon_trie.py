@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Compact static tries over word forms and lemmas, with suffix tries.
+
+lookup_word / find_lemma_variants in examples/basic_usage.py keep the
+whole aggregate `words` dict in memory, and suffix questions ("all forms
+ending in -ssa") scan every key. This module stores, per namespace
+('words', 'lemmas'):
+
+- a static trie in CSR form: child_offsets per node, edge labels (code
+  points, sorted per node) and edge targets, all int32 arrays. Nodes are
+  numbered in preorder over the sorted keys, so a node's subtree is one
+  contiguous range of key ids [key_start, key_end) and prefix enumeration
+  is a walk down the prefix followed by a slice;
+- the same trie over reversed keys, with a map from reversed-key id to
+  key id, for suffix enumeration;
+- integer payloads: token counts, and the word form <-> lemma links with
+  per-pair counts as CSR arrays.
+
+Lookups walk the trie with bisect over array.array views of the edge
+arrays, so a lookup costs a few microseconds and never touches the
+aggregate JSON.
+
+Usage:
+    python lexicon_trie.py build --corpus corpus_full_source_poems_v2.json.gz \
+        --output lexicon_trie.npz
+
+    # Forms ending in -ssa or -lle, most frequent first
+    python lexicon_trie.py query --lexicon lexicon_trie.npz --suffix ssa --suffix lle --limit 20
+
+    python lexicon_trie.py query --lexicon lexicon_trie.npz --word piiri --lemma piir --prefix kuld
+
+In Python:
+    lexicon = Lexicon.load('lexicon_trie.npz')
+    lexicon.lookup_word('piiri')
+    lexicon.with_suffix('words', 'ssa')
+    lexicon.ids('words', batch_of_forms)
+"""
+
+import argparse
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+
+import numpy as np
+
+from corpus_io import load_corpus, pack_strings, unpack_strings
+
+
+NAMESPACES = ('words', 'lemmas')
+TRIE_ARRAYS = ('child_offsets', 'labels', 'targets', 'key_start', 'key_end', 'terminal')
+
+
+class StaticTrie:
+    """Read-only trie over a sorted list of unique keys; key ids are list positions."""
+
+    def __init__(self, keys: list, arrays: dict):
+        self.keys = keys
+        self.arrays = arrays
+        # array.array views: fast scalar indexing and bisect without NumPy call overhead
+        self._offsets = _as_array(arrays['child_offsets'])
+        self._labels = _as_array(arrays['labels'])
+        self._targets = _as_array(arrays['targets'])
+        self._key_start = _as_array(arrays['key_start'])
+        self._key_end = _as_array(arrays['key_end'])
+        self._terminal = arrays['terminal'].tobytes()
+
+    @classmethod
+    def build(cls, keys: list) -> 'StaticTrie':
+        """Build from sorted unique keys; nodes are created in preorder."""
+        parent, label = array('i', [-1]), array('i', [0])
+        key_start, key_end = array('i', [0]), array('i', [0])
+        terminal = bytearray(1)
+        path = [0]
+        previous = ''
+        for key_id, key in enumerate(keys):
+            common = 0
+            limit = min(len(previous), len(key))
+            while common < limit and previous[common] == key[common]:
+                common += 1
+            while len(path) - 1 > common:
+                key_end[path.pop()] = key_id
+            for ch in key[common:]:
+                node = len(parent)
+                parent.append(path[-1])
+                label.append(ord(ch))
+                key_start.append(key_id)
+                key_end.append(0)
+                terminal.append(0)
+                path.append(node)
+            terminal[path[-1]] = 1
+            previous = key
+        for node in path:
+            key_end[node] = len(keys)
+
+        parent = np.frombuffer(parent, dtype=np.int32)
+        num_nodes = parent.size
+        # Children of each node, in creation (= label) order
+        targets = (np.argsort(parent[1:], kind='stable') + 1).astype(np.int32)
+        counts = np.bincount(parent[1:], minlength=num_nodes)
+        child_offsets = np.zeros(num_nodes + 1, dtype=np.int32)
+        np.cumsum(counts, out=child_offsets[1:])
+        return cls(keys, {
+            'child_offsets': child_offsets,
+            'labels': np.frombuffer(label, dtype=np.int32)[targets],
+            'targets': targets,
+            'key_start': np.frombuffer(key_start, dtype=np.int32).copy(),
+            'key_end': np.frombuffer(key_end, dtype=np.int32).copy(),
+            'terminal': np.frombuffer(bytes(terminal), dtype=np.uint8)
+        })
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self._key_start)
+
+    def node(self, prefix: str) -> int:
+        """Node reached by walking prefix, or -1."""
+        offsets, labels, targets = self._offsets, self._labels, self._targets
+        node = 0
+        for ch in prefix:
+            code = ord(ch)
+            hi = offsets[node + 1]
+            i = bisect_left(labels, code, offsets[node], hi)
+            if i == hi or labels[i] != code:
+                return -1
+            node = targets[i]
+        return node
+
+    def find(self, key: str) -> int:
+        """Key id, or -1 if the key is not in the trie."""
+        node = self.node(key)
+        if node < 0 or not self._terminal[node]:
+            return -1
+        return self._key_start[node]
+
+    def prefix_range(self, prefix: str) -> tuple:
+        """Key ids [start, end) of all keys starting with prefix."""
+        node = self.node(prefix)
+        if node < 0:
+            return 0, 0
+        return self._key_start[node], self._key_end[node]
+
+
+class Lexicon:
+    """Forward and suffix tries plus count and link payloads for words and lemmas."""
+
+    def __init__(self, tries: dict, suffix_tries: dict, suffix_ids: dict, payload: dict):
+        self.tries = tries
+        self.suffix_tries = suffix_tries
+        self.suffix_ids = suffix_ids
+        self.payload = payload
+
+    @classmethod
+    def build(cls, corpus: dict) -> 'Lexicon':
+        """Build from a loaded aggregate corpus (words and lemma_index)."""
+        words_section = corpus.get('words', {})
+        lemma_index = corpus.get('lemma_index', {})
+
+        words = sorted(words_section)
+        lemma_set = set(lemma_index)
+        for data in words_section.values():
+            lemma_set.update(data.get('lemmas', []))
+        lemmas = sorted(lemma_set)
+
+        tries = {'words': StaticTrie.build(words), 'lemmas': StaticTrie.build(lemmas)}
+        lemma_id = {lemma: i for i, lemma in enumerate(lemmas)}
+
+        # word -> lemma links (CSR over word ids), with per-pair token counts
+        word_counts = np.zeros(len(words), dtype=np.int64)
+        link_offsets = [0]
+        link_lemmas, link_counts = array('i'), array('q')
+        for i, word in enumerate(words):
+            data = words_section[word]
+            word_counts[i] = data.get('total_count', 0)
+            lemma_counts = data.get('lemma_counts', {})
+            for lemma in data.get('lemmas', []):
+                link_lemmas.append(lemma_id[lemma])
+                link_counts.append(lemma_counts.get(lemma, 0))
+            link_offsets.append(len(link_lemmas))
+        link_offsets = np.asarray(link_offsets, dtype=np.int64)
+        link_lemmas = np.frombuffer(link_lemmas, dtype=np.int32)
+        link_counts = np.frombuffer(link_counts, dtype=np.int64)
+
+        # lemma -> word links: the same pairs grouped by lemma
+        link_words = np.repeat(np.arange(len(words), dtype=np.int32), np.diff(link_offsets))
+        order = np.argsort(link_lemmas, kind='stable')
+        lemma_offsets = np.zeros(len(lemmas) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(link_lemmas, minlength=len(lemmas)), out=lemma_offsets[1:])
+
+        lemma_counts = np.bincount(link_lemmas, weights=link_counts, minlength=len(lemmas)).astype(np.int64)
+        for lemma, data in lemma_index.items():
+            lemma_counts[lemma_id[lemma]] = data.get('total_occurrences', lemma_counts[lemma_id[lemma]])
+
+        payload = {
+            'words_count': word_counts,
+            'words_link_offsets': link_offsets,
+            'words_link_ids': link_lemmas,
+            'words_link_counts': link_counts,
+            'lemmas_count': lemma_counts,
+            'lemmas_link_offsets': lemma_offsets,
+            'lemmas_link_ids': link_words[order],
+            'lemmas_link_counts': link_counts[order]
+        }
+
+        suffix_tries, suffix_ids = {}, {}
+        for name, keys in (('words', words), ('lemmas', lemmas)):
+            reversed_keys = sorted((key[::-1], i) for i, key in enumerate(keys))
+            suffix_tries[name] = StaticTrie.build([key for key, _ in reversed_keys])
+            suffix_ids[name] = np.fromiter((i for _, i in reversed_keys), dtype=np.int32,
+                                           count=len(reversed_keys))
+        return cls(tries, suffix_tries, suffix_ids, payload)
+
+    def save(self, path: Path):
+        """Save to a NumPy .npz archive."""
+        arrays = dict(self.payload)
+        for name in NAMESPACES:
+            arrays[f'{name}_keys'] = pack_strings(self.tries[name].keys)
+            arrays[f'{name}_suffix_ids'] = self.suffix_ids[name]
+            for field in TRIE_ARRAYS:
+                arrays[f'{name}_trie_{field}'] = self.tries[name].arrays[field]
+                arrays[f'{name}_suffix_{field}'] = self.suffix_tries[name].arrays[field]
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> 'Lexicon':
+        """Load a lexicon saved with save()."""
+        tries, suffix_tries, suffix_ids, payload = {}, {}, {}, {}
+        with np.load(path) as archive:
+            for name in NAMESPACES:
+                keys = unpack_strings(archive[f'{name}_keys'])
+                tries[name] = StaticTrie(keys, {field: archive[f'{name}_trie_{field}']
+                                                for field in TRIE_ARRAYS})
+                # Suffix trie keys are only needed for building; lookups map ids back
+                suffix_tries[name] = StaticTrie([], {field: archive[f'{name}_suffix_{field}']
+                                                     for field in TRIE_ARRAYS})
+                suffix_ids[name] = archive[f'{name}_suffix_ids']
+                for field in ('count', 'link_offsets', 'link_ids', 'link_counts'):
+                    payload[f'{name}_{field}'] = archive[f'{name}_{field}']
+        return cls(tries, suffix_tries, suffix_ids, payload)
+
+    def ids(self, namespace: str, keys) -> np.ndarray:
+        """Batch lookup: key ids (-1 for unknown keys)."""
+        find = self.tries[namespace].find
+        return np.fromiter((find(key) for key in keys), dtype=np.int32)
+
+    def key(self, namespace: str, key_id: int) -> str:
+        return self.tries[namespace].keys[key_id]
+
+    def count(self, namespace: str, key_id: int) -> int:
+        return int(self.payload[f'{namespace}_count'][key_id])
+
+    def links(self, namespace: str, key_id: int) -> list:
+        """(linked key, pair count) pairs: a word's lemmas or a lemma's word forms."""
+        other = 'lemmas' if namespace == 'words' else 'words'
+        offsets = self.payload[f'{namespace}_link_offsets']
+        start, end = offsets[key_id], offsets[key_id + 1]
+        keys = self.tries[other].keys
+        return [(keys[i], int(c)) for i, c in zip(self.payload[f'{namespace}_link_ids'][start:end],
+                                                  self.payload[f'{namespace}_link_counts'][start:end])]
+
+    def prefix_ids(self, namespace: str, prefix: str) -> np.ndarray:
+        start, end = self.tries[namespace].prefix_range(prefix)
+        return np.arange(start, end, dtype=np.int32)
+
+    def suffix_ids_for(self, namespace: str, suffix: str) -> np.ndarray:
+        start, end = self.suffix_tries[namespace].prefix_range(suffix[::-1])
+        return self.suffix_ids[namespace][start:end]
+
+    def with_prefix(self, namespace: str, prefix: str, limit: int = None) -> list:
+        """Keys starting with prefix, in sorted order."""
+        start, end = self.tries[namespace].prefix_range(prefix)
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.tries[namespace].keys[start:end]
+
+    def with_suffix(self, namespace: str, suffix: str, limit: int = None) -> list:
+        """Keys ending with suffix, grouped by ending (sorted by reversed key)."""
+        ids = self.suffix_ids_for(namespace, suffix)[:limit]
+        keys = self.tries[namespace].keys
+        return [keys[i] for i in ids]
+
+    def lookup_word(self, word: str):
+        """Counts and lemmas of a word form (None if unknown)."""
+        word_id = self.tries['words'].find(word)
+        if word_id < 0:
+            return None
+        links = self.links('words', word_id)
+        return {
+            'total_count': self.count('words', word_id),
+            'lemmas': [lemma for lemma, _ in links],
+            'lemma_counts': dict(links)
+        }
+
+    def lemma_variants(self, lemma: str) -> list:
+        """(word form, count) pairs of a lemma, most frequent first."""
+        lemma_id = self.tries['lemmas'].find(lemma)
+        if lemma_id < 0:
+            return []
+        return sorted(self.links('lemmas', lemma_id), key=lambda x: -x[1])
+
+
+def _as_array(values: np.ndarray) -> array:
+    result = array('i')
+    result.frombytes(np.ascontiguousarray(values, dtype=np.int32).tobytes())
+    return result
+
+
+def run_build(args):
+    corpus = load_corpus(args.corpus)
+
+    print("\nBuilding tries...")
+    start = time.perf_counter()
+    lexicon = Lexicon.build(corpus)
+    for name in NAMESPACES:
+        print(f"  {name}: {len(lexicon.tries[name].keys):,} keys, "
+              f"{lexicon.tries[name].num_nodes:,} nodes, "
+              f"{lexicon.suffix_tries[name].num_nodes:,} suffix nodes")
+    print(f"  Built in {time.perf_counter() - start:.1f}s")
+
+    lexicon.save(args.output)
+    print(f"✓ Saved {args.output} ({args.output.stat().st_size / (1024 * 1024):.2f} MB)")
+    return 0
+
+
+def _print_matches(lexicon, namespace: str, ids: np.ndarray, args):
+    if args.sort == 'freq':
+        counts = lexicon.payload[f'{namespace}_count'][ids]
+        ids = ids[np.argsort(-counts, kind='stable')]
+    else:
+        ids = np.sort(ids)
+    for key_id in ids[:args.limit]:
+        print(f"    {lexicon.key(namespace, key_id):30s} {lexicon.count(namespace, key_id):>10,}")
+
+
+def run_query(args):
+    start = time.perf_counter()
+    lexicon = Lexicon.load(args.lexicon)
+    print(f"Loaded {args.lexicon} in {(time.perf_counter() - start) * 1000:.0f} ms")
+    namespace = args.namespace
+
+    if args.word:
+        start = time.perf_counter()
+        ids = lexicon.ids('words', args.word)
+        elapsed = (time.perf_counter() - start) * 1e6
+        print(f"\n📝 {len(args.word):,} word lookups ({elapsed / len(args.word):.1f} µs each)")
+        for word, word_id in zip(args.word, ids):
+            if word_id < 0:
+                print(f"  {word}: not found")
+                continue
+            links = ', '.join(f"{lemma}({c:,})" for lemma, c in lexicon.links('words', word_id))
+            print(f"  {word}: {lexicon.count('words', word_id):,} occurrences; lemmas {links}")
+
+    for lemma in args.lemma:
+        variants = lexicon.lemma_variants(lemma)
+        print(f"\n🔍 Variants of lemma '{lemma}': {len(variants):,} word forms")
+        for word, count in variants[:args.limit]:
+            print(f"    {word:30s} {count:>10,}")
+
+    for label, values, lookup in (('prefix', args.prefix, lexicon.prefix_ids),
+                                  ('suffix', args.suffix, lexicon.suffix_ids_for)):
+        for value in values:
+            start = time.perf_counter()
+            ids = lookup(namespace, value)
+            elapsed = (time.perf_counter() - start) * 1e6
+            print(f"\n{namespace} with {label} '{value}': {len(ids):,} ({elapsed:.1f} µs)")
+            _print_matches(lexicon, namespace, ids, args)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compact static tries over word forms and lemmas'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build tries from an aggregate corpus')
+    build.add_argument('--corpus', type=Path, required=True, help='Aggregate corpus JSON (.json or .json.gz)')
+    build.add_argument('--output', type=Path, default=Path('lexicon_trie.npz'),
+                       help='Output .npz (default: lexicon_trie.npz)')
+
+    query = subparsers.add_parser('query', help='Look up words, lemmas, prefixes and suffixes')
+    query.add_argument('--lexicon', type=Path, default=Path('lexicon_trie.npz'), help='Lexicon .npz')
+    query.add_argument('--word', action='append', default=[], help='Word form to look up (repeatable)')
+    query.add_argument('--lemma', action='append', default=[], help='Lemma whose forms to list (repeatable)')
+    query.add_argument('--prefix', action='append', default=[], help='Enumerate keys with this prefix')
+    query.add_argument('--suffix', action='append', default=[], help='Enumerate keys with this suffix')
+    query.add_argument('--namespace', choices=NAMESPACES, default='words',
+                       help='Keys for --prefix/--suffix (default: words)')
+    query.add_argument('--sort', choices=('freq', 'alpha'), default='freq',
+                       help='Order of enumerated keys (default: freq)')
+    query.add_argument('--limit', type=int, default=20, help='Keys to print per query')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        return run_build(args)
+    return run_query(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
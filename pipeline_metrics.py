@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Stage-level timing, memory and profiling instrumentation for pipeline scripts.
+
+Scripts mark their phases with named stage context managers:
+
+    from pipeline_metrics import stage
+
+    with stage('load_corpus') as s:
+        corpus = load_corpus(path)
+        s.items = len(corpus['words'])
+
+Each stage records wall time, CPU time of this process and of child
+processes reaped during the stage (worker pools), items per second (when
+items is set), RSS at stage entry and exit, and the process-lifetime peak
+RSS at exit (a high-water mark, not the stage's own peak). With
+tracemalloc enabled it also records the peak of Python allocations, which
+is per stage. Stages may be nested; nested stages are reported as
+'parent/child'.
+
+When no metrics collector is active, stage() only yields a record and
+measures nothing, so library functions can be instrumented freely.
+
+Command-line scripts enable the collector with:
+
+    parser = argparse.ArgumentParser(...)
+    pipeline_metrics.add_arguments(parser)
+    args = parser.parse_args()
+    pipeline_metrics.from_args(args, 'script_name')
+
+which adds:
+
+    --metrics PATH       write a metrics JSON at exit
+    --profile DIR        cProfile each top-level stage to DIR/<script>.<stage>.prof
+                         (open with snakeviz, or convert with flameprof/gprof2dot
+                         for flame graphs)
+    --trace-memory       record tracemalloc peaks per stage (slower)
+
+A stage summary is printed at exit.
+"""
+
+import atexit
+import cProfile
+import json
+import os
+import re
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+
+_active = None
+
+
+def current_rss_mb():
+    """Current resident set size in MB (None if /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def children_cpu_s() -> float:
+    """User + system CPU time of terminated, waited-for child processes."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageRecord:
+    """Measurements of one stage run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = None
+        self.wall_s = None
+        self.cpu_s = None
+        self.child_cpu_s = None
+        self.rss_start_mb = None
+        self.rss_end_mb = None
+        self.process_peak_rss_mb = None
+        self.tracemalloc_peak_mb = None
+        self.profile = None
+
+    def add(self, count: int = 1):
+        """Add processed items (for stages that count as they go)."""
+        self.items = (self.items or 0) + count
+
+    def to_dict(self) -> dict:
+        result = {
+            'name': self.name,
+            'wall_s': round(self.wall_s, 4),
+            'cpu_s': round(self.cpu_s, 4),
+            'items': self.items,
+            'child_cpu_s': round(self.child_cpu_s, 4),
+            'items_per_s': round(self.items / self.wall_s, 1) if self.items and self.wall_s else None,
+            'rss_start_mb': _round(self.rss_start_mb),
+            'rss_end_mb': _round(self.rss_end_mb),
+            'rss_delta_mb': _round(self.rss_end_mb - self.rss_start_mb
+                                   if self.rss_start_mb is not None and self.rss_end_mb is not None
+                                   else None),
+            'process_peak_rss_mb': round(self.process_peak_rss_mb, 1)
+        }
+        if self.tracemalloc_peak_mb is not None:
+            result['tracemalloc_peak_mb'] = round(self.tracemalloc_peak_mb, 1)
+        if self.profile:
+            result['profile'] = self.profile
+        return result
+
+
+class PipelineMetrics:
+    """Collects stage records for one script run."""
+
+    def __init__(self, script: str, metrics_path: Path = None, profile_dir: Path = None,
+                 trace_memory: bool = False):
+        self.script = script
+        self.metrics_path = metrics_path
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.records = []
+        self._stack = []  # [(name, tracemalloc peak of finished children)]
+        self._started = datetime.now()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._child_cpu_start = children_cpu_s()
+        self._finished = False
+
+        if profile_dir:
+            profile_dir.mkdir(parents=True, exist_ok=True)
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, items: int = None):
+        record = StageRecord('/'.join([n for n, _ in self._stack] + [name]))
+        record.items = items
+
+        profiler = None
+        if self.profile_dir and not self._stack:
+            # cProfile cannot nest; nested stages are covered by their parent's profile
+            profiler = cProfile.Profile()
+
+        if self.trace_memory:
+            if self._stack:
+                # Keep the parent's peak so far before resetting for this stage
+                parent_name, parent_peak = self._stack[-1]
+                self._stack[-1] = (parent_name, max(parent_peak, tracemalloc.get_traced_memory()[1]))
+            tracemalloc.reset_peak()
+        self._stack.append((name, 0))
+        self.records.append(record)  # Listed in start order
+
+        record.rss_start_mb = current_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        child_cpu_start = children_cpu_s()
+        if profiler:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler:
+                profiler.disable()
+            record.wall_s = time.perf_counter() - wall_start
+            record.cpu_s = time.process_time() - cpu_start
+            record.child_cpu_s = children_cpu_s() - child_cpu_start
+            record.rss_end_mb = current_rss_mb()
+            record.process_peak_rss_mb = peak_rss_mb()
+
+            _, children_peak = self._stack.pop()
+            if self.trace_memory:
+                peak = max(children_peak, tracemalloc.get_traced_memory()[1])
+                record.tracemalloc_peak_mb = peak / (1024 * 1024)
+                if self._stack:
+                    parent_name, parent_peak = self._stack[-1]
+                    self._stack[-1] = (parent_name, max(parent_peak, peak))
+
+            if profiler:
+                safe_name = re.sub(r'[^\w.-]+', '_', name)
+                profile_path = self.profile_dir / f"{self.script}.{safe_name}.prof"
+                profiler.dump_stats(profile_path)
+                record.profile = str(profile_path)
+
+    def summary(self) -> dict:
+        return {
+            'script': self.script,
+            'argv': sys.argv,
+            'started': self._started.strftime('%Y-%m-%d %H:%M:%S'),
+            'finished': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'total_wall_s': round(time.perf_counter() - self._wall_start, 4),
+            'total_cpu_s': round(time.process_time() - self._cpu_start, 4),
+            'total_child_cpu_s': round(children_cpu_s() - self._child_cpu_start, 4),
+            'process_peak_rss_mb': round(peak_rss_mb(), 1),
+            'stages': [r.to_dict() for r in self.records]
+        }
+
+    def print_summary(self, summary: dict):
+        if not summary['stages']:
+            return
+        width = 108
+        print("\n" + "-" * width)
+        print(f"{'Stage':<36} {'Wall (s)':>9} {'CPU (s)':>9} {'Child CPU':>10} {'Items/s':>11} "
+              f"{'RSS in -> out (MB)':>18} {'Process peak':>12}")
+        for s in summary['stages']:
+            rate = f"{s['items_per_s']:,.0f}" if s['items_per_s'] else '-'
+            child = f"{s['child_cpu_s']:.2f}" if s['child_cpu_s'] else '-'
+            rss = (f"{s['rss_start_mb']:.0f} -> {s['rss_end_mb']:.0f}"
+                   if s['rss_start_mb'] is not None and s['rss_end_mb'] is not None else '-')
+            print(f"{s['name']:<36} {s['wall_s']:>9.2f} {s['cpu_s']:>9.2f} {child:>10} {rate:>11} "
+                  f"{rss:>18} {s['process_peak_rss_mb']:>9.0f} MB")
+        child = f"{summary['total_child_cpu_s']:.2f}" if summary['total_child_cpu_s'] else '-'
+        print(f"{'total':<36} {summary['total_wall_s']:>9.2f} {summary['total_cpu_s']:>9.2f} "
+              f"{child:>10} {'':>11} {'':>18} {summary['process_peak_rss_mb']:>9.0f} MB")
+        print("-" * width)
+
+    def finish(self):
+        """Print the stage summary and write the metrics JSON (once)."""
+        if self._finished:
+            return
+        self._finished = True
+        summary = self.summary()
+        self.print_summary(summary)
+
+        metrics_path = self.metrics_path
+        if metrics_path is None and self.profile_dir:
+            metrics_path = self.profile_dir / f"{self.script}.metrics.json"
+        if metrics_path:
+            with open(metrics_path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2)
+            print(f"Metrics written to {metrics_path}")
+        if self.profile_dir:
+            print(f"Stage profiles written to {self.profile_dir}/")
+
+
+def _round(value, digits: int = 1):
+    return round(value, digits) if value is not None else None
+
+
+@contextmanager
+def stage(name: str, items: int = None):
+    """
+    Measure a named stage with the active collector.
+
+    Yields a StageRecord; set record.items (or call record.add()) to get
+    a throughput figure. Without an active collector nothing is measured.
+    """
+    if _active is None:
+        yield StageRecord(name)
+        return
+    with _active.stage(name, items) as record:
+        yield record
+
+
+def enable(script: str, metrics_path: Path = None, profile_dir: Path = None,
+           trace_memory: bool = False) -> PipelineMetrics:
+    """Activate a collector for this process; its summary is written at exit."""
+    global _active
+    _active = PipelineMetrics(script, metrics_path, profile_dir, trace_memory)
+    atexit.register(_active.finish)
+    return _active
+
+
+def add_arguments(parser):
+    """Add --metrics, --profile and --trace-memory to an argparse parser."""
+    group = parser.add_argument_group('instrumentation')
+    group.add_argument('--metrics', type=Path, default=None,
+                       help='Write stage timing and memory metrics JSON to this path at exit')
+    group.add_argument('--profile', type=Path, default=None, metavar='DIR',
+                       help='Write a cProfile .prof file per top-level stage to DIR')
+    group.add_argument('--trace-memory', action='store_true',
+                       help='Record tracemalloc peak allocations per stage (slower)')
+
+
+def from_args(args, script: str) -> PipelineMetrics:
+    """Activate a collector from parsed add_arguments() options."""
+    return enable(script, args.metrics, args.profile, args.trace_memory)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Poem index I/O shared by the build, merge, delta and array scripts.
+
+- load_poems_index(): a whole .json/.json.gz or JSONL index in memory;
+- PoemIndexReader / PoemIndexWriter: one poem at a time, for indexes
+  that do not need to be held whole;
+- poem_sort_key(), check_sorted() and merge_join() for pairing two
+  poem-ID-sorted streams (CSV rows, two index versions, ...).
+
+JSONL indexes have an optional {"metadata": {...}} header line followed
+by one {"poem_id": ..., "poem": {...}} line per poem, sorted by poem ID.
+
+In Python:
+    reader = PoemIndexReader('poems_index_v3.json.gz')
+    writer = PoemIndexWriter('poems_index_v3_fixed.json.gz')
+    writer.begin({key: reader.sections[key] for key in reader.leading_sections})
+    for poem_id, poem in reader.poems():
+        writer.write_poem(poem_id, poem)
+    writer.end()
+"""
+
+import gzip
+import json
+from pathlib import Path
+
+
+def poem_sort_key(poem_id: str) -> int:
+    """Sort key for poem IDs (numeric order, e.g. 99999 < 100000)."""
+    return int(poem_id)
+
+
+def check_sorted(items, label: str):
+    """
+    Pass (poem_id, value) pairs through, failing on out-of-order poem IDs.
+
+    A merge join silently drops matches on unsorted input, so ordering is
+    enforced rather than assumed.
+    """
+    last_key = None
+    for poem_id, value in items:
+        key = poem_sort_key(poem_id)
+        if last_key is not None and key <= last_key:
+            raise ValueError(
+                f"{label} is not sorted by poem ID: {poem_id} follows {last_key}"
+            )
+        last_key = key
+        yield poem_id, value
+
+
+def open_text(path: Path, mode: str = 'rt'):
+    """Open a plain or gzip-compressed text file."""
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8')
+    return open(path, mode.replace('t', ''), encoding='utf-8')
+
+
+def iter_poems_jsonl(jsonl_path: Path):
+    """
+    Stream poems from a JSONL index sorted by poem ID.
+
+    Each line is {"poem_id": ..., "poem": {...}}; an optional first line
+    {"metadata": {...}} is skipped. Yields (poem_id, poem).
+    """
+    def records():
+        with open_text(jsonl_path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'poem_id' not in record:
+                    continue  # Metadata header
+                yield str(record['poem_id']), record['poem']
+
+    yield from check_sorted(records(), str(jsonl_path))
+
+
+def is_jsonl(path: Path) -> bool:
+    return str(path).endswith(('.jsonl', '.jsonl.gz'))
+
+
+class PoemIndexReader:
+    """
+    Stream poems from a .json/.json.gz or JSONL poems index.
+
+    JSON indexes are parsed incrementally, so one poem is in memory at a
+    time. Top-level sections other than 'poems' (metadata, ...) are kept
+    in `sections`: those before 'poems' are read on construction, the
+    rest once poems() is exhausted. Poems are yielded in file order.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.sections = {}
+        self.leading_sections = []
+        self.count = 0
+        self._file = open_text(self.path)
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._state = 'jsonl' if is_jsonl(self.path) else 'start'
+        if self._state == 'jsonl':
+            self._read_jsonl_header()
+        else:
+            self._read_until_poems()
+        self.leading_sections = list(self.sections)
+
+    def poems(self):
+        """Yield (poem_id, poem) pairs."""
+        try:
+            if self._state == 'jsonl':
+                yield from self._jsonl_poems()
+            elif self._state == 'poems':
+                yield from self._json_poems()
+                self._read_until_poems()
+        finally:
+            self._file.close()
+
+    def _read_jsonl_header(self):
+        self._pending_line = None
+        for line in self._file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'poem_id' in record:
+                self._pending_line = record
+            else:
+                self.sections.update(record)
+            break
+
+    def _jsonl_poems(self):
+        if self._pending_line is not None:
+            self.count += 1
+            yield str(self._pending_line['poem_id']), self._pending_line['poem']
+        for line in self._file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'poem_id' in record:
+                self.count += 1
+                yield str(record['poem_id']), record['poem']
+
+    # Incremental JSON parsing of {"key": value, ..., "poems": {"id": {...}, ...}, ...}
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(self.CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        if self._pos > len(self._buffer) // 2:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += chunk
+        return True
+
+    def _next_char(self) -> str:
+        """Skip whitespace and return the next character without consuming it ('' at EOF)."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars: str) -> str:
+        char = self._next_char()
+        if not char or char not in chars:
+            raise ValueError(f"{self.path}: expected one of {chars!r} at offset {self._pos}, got {char!r}")
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._next_char()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+                # A number may continue past the buffer end; accept a value
+                # only when a delimiter follows it
+                if (end < len(self._buffer) and self._buffer[end] in _DELIMITERS) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            if not self._fill():
+                value, self._pos = _DECODER.raw_decode(self._buffer, self._pos)
+                return value
+
+    def _read_until_poems(self):
+        """Read top-level sections up to the start of the poems object (or the end)."""
+        if self._state == 'start':
+            self._expect('{')
+            if self._next_char() == '}':
+                self._state = 'done'
+                return
+            self._state = 'key'
+        elif self._state == 'after_poems':
+            if self._expect(',}') == '}':
+                self._state = 'done'
+                return
+            self._state = 'key'
+        while self._state == 'key':
+            key = self._value()
+            self._expect(':')
+            if key == 'poems':
+                self._expect('{')
+                self._state = 'poems'
+                return
+            self.sections[key] = self._value()
+            if self._expect(',}') == '}':
+                self._state = 'done'
+
+    def _json_poems(self):
+        if self._next_char() == '}':
+            self._pos += 1
+        else:
+            while True:
+                poem_id = self._value()
+                self._expect(':')
+                poem = self._value()
+                self.count += 1
+                yield poem_id, poem
+                if self._expect(',}') == '}':
+                    break
+        self._state = 'after_poems'
+
+
+_DECODER = json.JSONDecoder()
+_DELIMITERS = ' \t\r\n,:]}'
+
+
+class PoemIndexWriter:
+    """
+    Write a poems index poem by poem (.json/.json.gz, or JSONL with a
+    metadata header line).
+
+    begin(sections) writes the sections that precede 'poems', write_poem()
+    appends one poem, and end(sections) writes any trailing sections.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.jsonl = is_jsonl(self.path)
+        self.count = 0
+        self._file = None
+
+    def begin(self, sections: dict = None):
+        self._file = open_text(self.path, 'wt')
+        sections = sections or {}
+        if self.jsonl:
+            if sections:
+                self._file.write(json.dumps(sections, ensure_ascii=False) + '\n')
+            return
+        self._file.write('{')
+        for key, value in sections.items():
+            self._file.write(f"{json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}, ")
+        self._file.write('"poems": {')
+
+    def write_poem(self, poem_id: str, poem: dict):
+        if self.jsonl:
+            self._file.write(json.dumps({'poem_id': poem_id, 'poem': poem}, ensure_ascii=False) + '\n')
+        else:
+            separator = ', ' if self.count else ''
+            self._file.write(f"{separator}{json.dumps(poem_id)}: {json.dumps(poem, ensure_ascii=False)}")
+        self.count += 1
+
+    def end(self, sections: dict = None):
+        if self.jsonl:
+            if sections:
+                raise ValueError(f"{self.path}: JSONL indexes keep top-level sections in the header")
+        else:
+            self._file.write('}')
+            for key, value in (sections or {}).items():
+                self._file.write(f", {json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}")
+            self._file.write('}')
+        self.close()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def merge_join(left, right):
+    """
+    Merge-join two (poem_id, value) streams that are both sorted by poem ID.
+
+    Yields (poem_id, left_value, right_value); one of the values is None
+    when the poem exists on only one side.
+    """
+    sentinel = (None, None)
+    left_iter = iter(left)
+    right_iter = iter(right)
+    left_id, left_value = next(left_iter, sentinel)
+    right_id, right_value = next(right_iter, sentinel)
+
+    while left_id is not None or right_id is not None:
+        if right_id is None or (left_id is not None and
+                                poem_sort_key(left_id) < poem_sort_key(right_id)):
+            yield left_id, left_value, None
+            left_id, left_value = next(left_iter, sentinel)
+        elif left_id is None or poem_sort_key(right_id) < poem_sort_key(left_id):
+            yield right_id, None, right_value
+            right_id, right_value = next(right_iter, sentinel)
+        else:
+            yield right_id, left_value, right_value
+            left_id, left_value = next(left_iter, sentinel)
+            right_id, right_value = next(right_iter, sentinel)
+
+
+def load_poems_index(index_path: Path) -> dict:
+    """Load a whole .json/.json.gz or JSONL poems index into memory."""
+    print(f"Loading poems index from {index_path}...")
+    if is_jsonl(index_path):
+        reader = PoemIndexReader(index_path)
+        index = dict(reader.sections)
+        index['poems'] = dict(reader.poems())
+    else:
+        with open_text(index_path) as f:
+            index = json.load(f)
+    print(f"  Loaded {len(index['poems']):,} poems")
+    return index
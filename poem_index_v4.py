@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Normalised poems_index_v4 schema with a v2-compatible accessor.
+
+poems_index_v2/v3 store every word four times (text, text_flat,
+verse_lines and each annotation's 'original') and repeat verse_index /
+word_in_verse on every annotation. v4 stores each token once plus a
+per-poem array of verse start offsets; everything else is derived.
+
+v4 poem structure:
+    {
+        "89248": {
+            "words": [
+                {"original": "piiri", "lemma": "piir", "pos": "S",
+                 "form": "sg_g", "method": "estnltk+dict", "confidence": 1.0},
+                ...
+            ],
+            "verse_starts": [0, 3, 7, ...],   # word index where each verse begins
+            "is_empty": false,
+            "metadata": {...},                # same as v2
+            "batch": "batch_00001",
+            "row_index": 0
+        }
+    }
+
+Poems whose CSV text could not be aligned with the annotations (or whose
+verses are not exactly reproducible from tokens) keep the CSV text in
+"text_override" and have "verse_starts": null; their words get
+verse_index = word_in_verse = -1, as in v2.
+
+PoemView wraps a poem of any version and exposes the v2 fields (text,
+text_flat, verse_lines, verse_count, num_words, words with verse
+coordinates), so existing callers keep working:
+
+    poem = PoemView(index['poems']['89248'])
+    poem['verse_lines'], poem['words'][0]['verse_index']
+
+Usage:
+    python poem_index_v4.py --input poems_index_v3.json.gz --output poems_index_v4.json.gz
+"""
+
+import argparse
+import gzip
+import json
+import sys
+from collections.abc import Mapping
+from datetime import datetime
+from pathlib import Path
+
+
+VERSE_SEPARATOR = ' / '
+
+# Fields derived from tokens in v4 (stored explicitly in v2/v3)
+DERIVED_FIELDS = ('text', 'text_flat', 'verse_lines', 'verse_count', 'words', 'num_words')
+
+# Storage-only v4 fields hidden from the v2 view
+V4_FIELDS = ('verse_starts', 'text_override')
+
+V4_FEATURES = [
+    'verse_markers',
+    'verse_start_offsets',
+    'enhanced_metadata',
+    'morphological_annotations',
+    'empty_poem_tracking',
+    'single_token_storage'
+]
+
+
+def is_v4_poem(poem: dict) -> bool:
+    """Check whether a poem uses the v4 storage layout."""
+    return 'verse_starts' in poem
+
+
+def verse_starts_from_lengths(verse_lengths: list) -> list:
+    """Convert per-verse word counts into verse start offsets."""
+    starts = []
+    offset = 0
+    for length in verse_lengths:
+        starts.append(offset)
+        offset += length
+    return starts
+
+
+class PoemView(Mapping):
+    """
+    Read-only v2-style view over a poem of any index version.
+
+    For v4 poems, text views and per-word verse coordinates are derived
+    on access; v1-v3 poems are passed through unchanged.
+    """
+
+    __slots__ = ('_poem',)
+
+    def __init__(self, poem: dict):
+        self._poem = poem
+
+    @property
+    def raw(self) -> dict:
+        """The underlying stored poem dict."""
+        return self._poem
+
+    @property
+    def tokens(self) -> list:
+        """Stored annotation dicts (no verse coordinates for v4)."""
+        return self._poem.get('words', [])
+
+    @property
+    def num_words(self) -> int:
+        if is_v4_poem(self._poem):
+            return len(self.tokens)
+        return self._poem.get('num_words', len(self.tokens))
+
+    @property
+    def verse_lines(self) -> list:
+        poem = self._poem
+        if not is_v4_poem(poem):
+            return poem.get('verse_lines', [])
+        if poem['verse_starts'] is None:
+            text = poem.get('text_override', '')
+            return [v.strip() for v in text.split(VERSE_SEPARATOR) if v.strip()]
+        originals = [w.get('original', '') for w in self.tokens]
+        bounds = poem['verse_starts'] + [len(originals)]
+        return [' '.join(originals[bounds[i]:bounds[i + 1]]) for i in range(len(bounds) - 1)]
+
+    @property
+    def verse_count(self) -> int:
+        poem = self._poem
+        if not is_v4_poem(poem):
+            return poem.get('verse_count', 0)
+        if poem['verse_starts'] is None:
+            return len(self.verse_lines)
+        return len(poem['verse_starts'])
+
+    @property
+    def text(self) -> str:
+        poem = self._poem
+        if not is_v4_poem(poem):
+            return poem.get('text', '')
+        if poem['verse_starts'] is None:
+            return poem.get('text_override', '')
+        return VERSE_SEPARATOR.join(self.verse_lines)
+
+    @property
+    def text_flat(self) -> str:
+        poem = self._poem
+        if not is_v4_poem(poem):
+            return poem.get('text_flat', poem.get('text', ''))
+        return ' '.join(word for verse in self.verse_lines for word in verse.split())
+
+    def iter_words(self):
+        """
+        Yield (annotation, verse_index, word_in_verse) without copying.
+
+        Unaligned words get (-1, -1).
+        """
+        poem = self._poem
+        tokens = self.tokens
+        if not is_v4_poem(poem):
+            for word in tokens:
+                yield word, word.get('verse_index', -1), word.get('word_in_verse', -1)
+            return
+        starts = poem['verse_starts']
+        if starts is None:
+            for word in tokens:
+                yield word, -1, -1
+            return
+        bounds = starts + [len(tokens)]
+        for verse_idx in range(len(starts)):
+            for word_pos, word_idx in enumerate(range(bounds[verse_idx], bounds[verse_idx + 1])):
+                yield tokens[word_idx], verse_idx, word_pos
+
+    @property
+    def words(self) -> list:
+        """Annotations with v2 verse_index / word_in_verse fields."""
+        if not is_v4_poem(self._poem):
+            return self.tokens
+        words = []
+        for word, verse_idx, word_pos in self.iter_words():
+            words.append({**word, 'verse_index': verse_idx, 'word_in_verse': word_pos})
+        return words
+
+    def __getitem__(self, key):
+        if key in DERIVED_FIELDS:
+            return getattr(self, key)
+        if key in V4_FIELDS:
+            raise KeyError(key)
+        return self._poem[key]
+
+    def __iter__(self):
+        yield from DERIVED_FIELDS
+        for key in self._poem:
+            if key not in DERIVED_FIELDS and key not in V4_FIELDS:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_v2(self) -> dict:
+        """Materialise the poem as a v2-layout dict."""
+        return {key: self[key] for key in self}
+
+
+def iter_poems(index: dict):
+    """Yield (poem_id, PoemView) for every poem in a loaded index."""
+    for poem_id, poem in index['poems'].items():
+        yield poem_id, PoemView(poem)
+
+
+def convert_poem_to_v4(poem: dict) -> dict:
+    """
+    Convert a v2/v3 poem to v4 in place and return it.
+
+    Verse coordinates are dropped from the annotations; verse starts are
+    kept only when the tokens reproduce the stored verse lines exactly,
+    otherwise the stored text is kept as text_override.
+    """
+    if is_v4_poem(poem):
+        return poem
+
+    words = poem.get('words', [])
+    verse_lines = poem.get('verse_lines', [])
+    verse_lengths = [len(v.split()) for v in verse_lines]
+    aligned = (
+        sum(verse_lengths) == len(words)
+        and all(w.get('verse_index', -1) != -1 for w in words)
+    )
+
+    for word in words:
+        word.pop('verse_index', None)
+        word.pop('word_in_verse', None)
+
+    text = poem.get('text', '')
+    for field in DERIVED_FIELDS:
+        if field != 'words':
+            poem.pop(field, None)
+
+    poem['verse_starts'] = verse_starts_from_lengths(verse_lengths) if aligned else None
+    if aligned and PoemView(poem).text != text:
+        poem['verse_starts'] = None
+    if poem['verse_starts'] is None and text:
+        poem['text_override'] = text
+
+    return poem
+
+
+def convert_index_to_v4(index: dict) -> dict:
+    """Convert a loaded v2/v3 index to v4 in place and return it."""
+    poems = index['poems']
+    total = len(poems)
+    checkpoint = max(1, total // 10)
+    overrides = 0
+
+    for i, poem in enumerate(poems.values()):
+        if (i + 1) % checkpoint == 0:
+            print(f"  Processing: {i + 1:,}/{total:,} ({100*(i+1)//total}%)")
+        convert_poem_to_v4(poem)
+        if poem['verse_starts'] is None and poem.get('text_override'):
+            overrides += 1
+
+    metadata = index['metadata']
+    metadata['converted_from'] = metadata.get('version', 'unknown')
+    metadata['version'] = 'v4'
+    metadata['created'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    metadata['features'] = V4_FEATURES
+    metadata['text_overrides'] = overrides
+
+    print(f"  Converted {total:,} poems ({overrides:,} with text_override)")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert a poems_index v2/v3 file to the normalised v4 schema'
+    )
+    parser.add_argument('--input', type=Path, default=Path('poems_index_v3.json.gz'),
+                        help='Input v2/v3 poems index')
+    parser.add_argument('--output', type=Path, default=Path('poems_index_v4.json.gz'),
+                        help='Output v4 poems index')
+
+    args = parser.parse_args()
+
+    print(f"Loading {args.input}...")
+    with gzip.open(args.input, 'rt', encoding='utf-8') as f:
+        index = json.load(f)
+    print(f"  Loaded {len(index['poems']):,} poems (version {index['metadata'].get('version', 'unknown')})")
+
+    print("\nConverting to v4...")
+    convert_index_to_v4(index)
+
+    print(f"\nSaving to {args.output}...")
+    with gzip.open(args.output, 'wt', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+    input_mb = args.input.stat().st_size / (1024 * 1024)
+    output_mb = args.output.stat().st_size / (1024 * 1024)
+    print(f"  Size: {input_mb:.2f} MB → {output_mb:.2f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Compressed source_poems posting lists with fast set operations.
+
+In the v8+ aggregate corpus every word form and lemma stores
+source_poems as a {poem_id: count} dict. This module re-encodes them as
+posting lists:
+
+- poem IDs are mapped to ordinals (position in numerically sorted ID list)
+- ordinals are stored sorted, delta- and varint (LEB128) encoded
+- counts are stored in a parallel varint array
+
+Encoding and decoding are vectorised with NumPy, and intersection, union
+and difference run on decoded ordinal arrays, so questions like "poems
+containing both X and Y" no longer intersect Python dicts.
+
+Usage:
+    # Build postings (optionally writing the aggregate without source_poems)
+    python posting_lists.py build --corpus corpus_full_source_poems_v2.json.gz \
+        --output source_poems_postings.npz \
+        --stripped-corpus corpus_full_source_poems_v2_nopostings.json.gz
+
+    # Poems containing both word forms
+    python posting_lists.py query --postings source_poems_postings.npz \
+        --word kulla --word kuldne --op and
+
+    # Poems with lemma 'piir' but not lemma 'raja'
+    python posting_lists.py query --postings source_poems_postings.npz \
+        --lemma piir --lemma raja --op andnot
+
+In Python:
+    index = PostingIndex.load('source_poems_postings.npz')
+    both = intersect(index.word('kulla'), index.lemma('hõbe'))
+    index.poem_ids(both)
+"""
+
+import argparse
+import gzip
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from corpus_io import load_corpus, pack_strings, unpack_strings
+
+
+NAMESPACES = ('words', 'lemmas')
+
+# Varint byte budget per value (uint32 needs at most 5 x 7 bits)
+MAX_VARINT_BYTES = 5
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """Encode non-negative integers as LEB128 varints (uint8 array)."""
+    values = np.asarray(values, dtype=np.uint64)
+    if values.size == 0:
+        return np.zeros(0, dtype=np.uint8)
+
+    nbytes = np.ones(values.size, dtype=np.int64)
+    for k in range(1, MAX_VARINT_BYTES):
+        nbytes += values >= (1 << (7 * k))
+    starts = np.cumsum(nbytes) - nbytes
+
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(MAX_VARINT_BYTES):
+        mask = nbytes > k
+        if not mask.any():
+            break
+        byte = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + k] = (byte | more).astype(np.uint8)
+    return out
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """Decode a uint8 array of LEB128 varints into uint64 values."""
+    data = np.asarray(data, dtype=np.uint8)
+    if data.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    ends = np.flatnonzero((data & 0x80) == 0)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    position = np.arange(data.size) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    return np.bitwise_or.reduceat(parts, starts)
+
+
+def encode_postings(ordinals: np.ndarray) -> np.ndarray:
+    """Delta + varint encode a sorted array of poem ordinals."""
+    ordinals = np.asarray(ordinals, dtype=np.uint64)
+    deltas = np.diff(ordinals, prepend=np.uint64(0))
+    return encode_varints(deltas)
+
+
+def decode_postings(data: np.ndarray) -> np.ndarray:
+    """Decode delta + varint encoded poem ordinals."""
+    return np.cumsum(decode_varints(data)).astype(np.uint32)
+
+
+class PostingList:
+    """Sorted poem ordinals with parallel per-poem occurrence counts."""
+
+    __slots__ = ('ordinals', 'counts')
+
+    def __init__(self, ordinals: np.ndarray, counts: np.ndarray):
+        self.ordinals = np.asarray(ordinals, dtype=np.uint32)
+        self.counts = np.asarray(counts, dtype=np.uint32)
+
+    @classmethod
+    def empty(cls) -> 'PostingList':
+        return cls(np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32))
+
+    def __len__(self) -> int:
+        return int(self.ordinals.size)
+
+    def total(self) -> int:
+        """Total occurrences across all poems."""
+        return int(self.counts.sum())
+
+    def __repr__(self):
+        return f"PostingList(poems={len(self)}, occurrences={self.total()})"
+
+
+def intersect(*lists: PostingList) -> PostingList:
+    """Poems present in every list; counts are summed."""
+    if not lists:
+        return PostingList.empty()
+    lists = sorted(lists, key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        common, idx_a, idx_b = np.intersect1d(
+            result.ordinals, other.ordinals, assume_unique=True, return_indices=True
+        )
+        result = PostingList(common, result.counts[idx_a] + other.counts[idx_b])
+    return result
+
+
+def union(*lists: PostingList) -> PostingList:
+    """Poems present in any list; counts are summed."""
+    lists = [lst for lst in lists if len(lst)]
+    if not lists:
+        return PostingList.empty()
+    ordinals = np.concatenate([lst.ordinals for lst in lists])
+    counts = np.concatenate([lst.counts for lst in lists])
+    merged, inverse = np.unique(ordinals, return_inverse=True)
+    summed = np.bincount(inverse, weights=counts, minlength=merged.size)
+    return PostingList(merged, summed.astype(np.uint32))
+
+
+def difference(first: PostingList, *others: PostingList) -> PostingList:
+    """Poems in the first list but in none of the others; first list's counts."""
+    if not others:
+        return first
+    excluded = union(*others).ordinals
+    keep = ~np.isin(first.ordinals, excluded, assume_unique=True)
+    return PostingList(first.ordinals[keep], first.counts[keep])
+
+
+class PostingIndex:
+    """
+    Posting lists for all word forms and lemmas of an aggregate corpus.
+
+    Each namespace ('words', 'lemmas') stores its keys, one concatenated
+    byte array of encoded ordinals and one of encoded counts, plus offsets
+    into both. Lists are decoded on access.
+    """
+
+    def __init__(self, poem_table: list, namespaces: dict):
+        self.poem_table = poem_table
+        self._namespaces = namespaces
+        self._key_lookup = {
+            name: {key: i for i, key in enumerate(ns['keys'])}
+            for name, ns in namespaces.items()
+        }
+
+    @classmethod
+    def build(cls, corpus: dict) -> 'PostingIndex':
+        """Build posting lists from a loaded v8+ aggregate corpus."""
+        sections = {
+            'words': corpus.get('words', {}),
+            'lemmas': corpus.get('lemma_index', {})
+        }
+
+        poem_ids = set()
+        for section in sections.values():
+            for entry in section.values():
+                poem_ids.update(entry.get('source_poems', {}))
+        poem_table = sorted(poem_ids, key=int)
+        ordinal_of = {poem_id: i for i, poem_id in enumerate(poem_table)}
+
+        namespaces = {}
+        for name, section in sections.items():
+            keys = []
+            posting_chunks, count_chunks = [], []
+            posting_offsets, count_offsets = [0], [0]
+            for key, entry in section.items():
+                source_poems = entry.get('source_poems', {})
+                ordinals = np.fromiter((ordinal_of[p] for p in source_poems),
+                                       dtype=np.uint32, count=len(source_poems))
+                counts = np.fromiter(source_poems.values(), dtype=np.uint32,
+                                     count=len(source_poems))
+                order = np.argsort(ordinals, kind='stable')
+                postings = encode_postings(ordinals[order])
+                encoded_counts = encode_varints(counts[order])
+
+                keys.append(key)
+                posting_chunks.append(postings)
+                count_chunks.append(encoded_counts)
+                posting_offsets.append(posting_offsets[-1] + postings.size)
+                count_offsets.append(count_offsets[-1] + encoded_counts.size)
+
+            namespaces[name] = {
+                'keys': keys,
+                'postings': np.concatenate(posting_chunks) if posting_chunks else np.zeros(0, np.uint8),
+                'posting_offsets': np.asarray(posting_offsets, dtype=np.int64),
+                'counts': np.concatenate(count_chunks) if count_chunks else np.zeros(0, np.uint8),
+                'count_offsets': np.asarray(count_offsets, dtype=np.int64)
+            }
+            print(f"  {name}: {len(keys):,} lists, "
+                  f"{namespaces[name]['postings'].nbytes + namespaces[name]['counts'].nbytes:,} bytes")
+
+        return cls(poem_table, namespaces)
+
+    def save(self, path: Path):
+        """Save to a NumPy .npz archive."""
+        arrays = {'poem_table': pack_strings(self.poem_table)}
+        for name, ns in self._namespaces.items():
+            arrays[f'{name}_keys'] = pack_strings(ns['keys'])
+            for field in ('postings', 'posting_offsets', 'counts', 'count_offsets'):
+                arrays[f'{name}_{field}'] = ns[field]
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> 'PostingIndex':
+        """Load an index saved with save()."""
+        with np.load(path) as archive:
+            poem_table = unpack_strings(archive['poem_table'])
+            namespaces = {}
+            for name in NAMESPACES:
+                namespaces[name] = {
+                    'keys': unpack_strings(archive[f'{name}_keys']),
+                    'postings': archive[f'{name}_postings'],
+                    'posting_offsets': archive[f'{name}_posting_offsets'],
+                    'counts': archive[f'{name}_counts'],
+                    'count_offsets': archive[f'{name}_count_offsets']
+                }
+        return cls(poem_table, namespaces)
+
+    def _get(self, namespace: str, key: str) -> PostingList:
+        i = self._key_lookup[namespace].get(key)
+        if i is None:
+            return PostingList.empty()
+        ns = self._namespaces[namespace]
+        p_start, p_end = ns['posting_offsets'][i], ns['posting_offsets'][i + 1]
+        c_start, c_end = ns['count_offsets'][i], ns['count_offsets'][i + 1]
+        return PostingList(
+            decode_postings(ns['postings'][p_start:p_end]),
+            decode_varints(ns['counts'][c_start:c_end])
+        )
+
+    def word(self, word_form: str) -> PostingList:
+        """Posting list of a word form (empty if unknown)."""
+        return self._get('words', word_form)
+
+    def lemma(self, lemma: str) -> PostingList:
+        """Posting list of a lemma (empty if unknown)."""
+        return self._get('lemmas', lemma)
+
+    def keys(self, namespace: str) -> list:
+        return self._namespaces[namespace]['keys']
+
+    def poem_ids(self, postings: PostingList) -> list:
+        """Translate a posting list back to poem IDs."""
+        return [self.poem_table[i] for i in postings.ordinals]
+
+    def source_poems(self, postings: PostingList) -> dict:
+        """Translate a posting list back to a {poem_id: count} dict."""
+        return {self.poem_table[i]: int(c) for i, c in zip(postings.ordinals, postings.counts)}
+
+
+# Packed string tables: magic, uint64 count, int64 offsets (count + 1), UTF-8 data
+def strip_source_poems(corpus: dict, postings_path: Path) -> dict:
+    """Drop source_poems dicts from a corpus in place, pointing at the postings file."""
+    for section in ('words', 'lemma_index'):
+        for entry in corpus.get(section, {}).values():
+            entry.pop('source_poems', None)
+    corpus['metadata']['source_poems_postings'] = postings_path.name
+    return corpus
+
+
+def run_build(args):
+    corpus = load_corpus(args.corpus)
+
+    print("\nEncoding posting lists...")
+    index = PostingIndex.build(corpus)
+    index.save(args.output)
+    print(f"✓ Saved {args.output} ({args.output.stat().st_size / (1024 * 1024):.2f} MB, "
+          f"{len(index.poem_table):,} poems)")
+
+    if args.stripped_corpus:
+        print(f"\nWriting corpus without source_poems to {args.stripped_corpus}...")
+        strip_source_poems(corpus, args.output)
+        with gzip.open(args.stripped_corpus, 'wt', encoding='utf-8') as f:
+            json.dump(corpus, f, ensure_ascii=False)
+        print(f"✓ Saved {args.stripped_corpus}")
+    return 0
+
+
+def run_query(args):
+    index = PostingIndex.load(args.postings)
+    lists = [index.word(w) for w in args.word] + [index.lemma(l) for l in args.lemma]
+    if not lists:
+        print("Error: give at least one --word or --lemma")
+        return 1
+
+    if args.op == 'and':
+        result = intersect(*lists)
+    elif args.op == 'or':
+        result = union(*lists)
+    else:
+        result = difference(lists[0], *lists[1:])
+
+    print(f"{len(result):,} poems, {result.total():,} occurrences")
+    top = np.argsort(-result.counts.astype(np.int64), kind='stable')[:args.limit]
+    for i in top:
+        print(f"  {index.poem_table[result.ordinals[i]]}: {int(result.counts[i])}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compressed source_poems posting lists with set operations'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Encode posting lists from an aggregate corpus')
+    build.add_argument('--corpus', type=Path, default=Path('corpus_full_source_poems_v2.json.gz'),
+                       help='Aggregate corpus with source_poems (v8+)')
+    build.add_argument('--output', type=Path, default=Path('source_poems_postings.npz'),
+                       help='Output postings file')
+    build.add_argument('--stripped-corpus', type=Path, default=None,
+                       help='Also write the corpus without source_poems dicts to this path')
+
+    query = subparsers.add_parser('query', help='Combine posting lists of word forms / lemmas')
+    query.add_argument('--postings', type=Path, default=Path('source_poems_postings.npz'),
+                       help='Postings file from the build command')
+    query.add_argument('--word', action='append', default=[], help='Word form (repeatable)')
+    query.add_argument('--lemma', action='append', default=[], help='Lemma (repeatable)')
+    query.add_argument('--op', choices=['and', 'or', 'andnot'], default='and',
+                       help='and: all terms, or: any term, andnot: first term minus the rest')
+    query.add_argument('--limit', type=int, default=20, help='Number of top poems to list')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        return run_build(args)
+    return run_query(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
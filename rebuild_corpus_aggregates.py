@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Rebuild the aggregate corpus from the poem index (map-reduce).
+
+apply_substitutions.py patches pos_tags counts in the aggregate corpus in
+place, which leaves total_count, lemma_counts, lemma_index,
+method_analytics and quality_tiers to drift from the token-level truth.
+This script regenerates every token-derived section from poems_index_v3
+instead:
+
+- map: worker processes aggregate shards of poems into partial counts
+- reduce: partials are merged into one set of counts
+- finalise: counts are turned into the corpus JSON layout (words,
+  lemma_index, method_analytics, morphological_patterns, quality_tiers)
+
+Sections that cannot be derived from tokens (ambiguous_words rejection
+counts, corpus_timeline) are copied from --base-corpus when given;
+otherwise ambiguous_words is derived from chosen-lemma counts only.
+
+Usage:
+    python rebuild_corpus_aggregates.py \
+        --poems-index poems_index_v3.json.gz \
+        --base-corpus corpus_full_source_poems_v2.json.gz \
+        --output corpus_full_source_poems_v3.json.gz --workers 8
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+from collections import Counter, defaultdict
+from datetime import datetime
+from multiprocessing import Pool
+from pathlib import Path
+
+import pipeline_metrics
+from pipeline_metrics import stage
+
+
+# Confidence thresholds for per-word quality tiers (as in examples/advanced_analysis.py)
+QUALITY_TIERS = [
+    ('high_confidence', 0.9),
+    ('medium_confidence', 0.7),
+    ('low_confidence', 0.5),
+    ('needs_review', float('-inf'))
+]
+
+
+def load_json(path: Path) -> dict:
+    """Load a .json or .json.gz file."""
+    if str(path).endswith('.gz'):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_json(data: dict, path: Path):
+    """Save a .json or .json.gz file."""
+    if str(path).endswith('.gz'):
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def make_shards(poems: dict, num_shards: int) -> list:
+    """
+    Split poems into shards of compact token tuples for the workers.
+
+    Each shard is a list of (poem_id, batch, [(original, lemma, pos, form,
+    method, confidence), ...]).
+    """
+    items = []
+    for poem_id, poem in poems.items():
+        tokens = [
+            (w.get('original', ''), w.get('lemma', ''), w.get('pos', ''),
+             w.get('form', ''), w.get('method', ''), w.get('confidence', 0.0))
+            for w in poem.get('words', [])
+        ]
+        if tokens:
+            items.append((poem_id, poem.get('batch', ''), tokens))
+
+    shard_size = max(1, -(-len(items) // num_shards))
+    return [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+
+
+def new_partial() -> dict:
+    """Create an empty partial aggregate."""
+    return {
+        'words': {},
+        'lemma_poems': defaultdict(Counter),
+        'methods': {},
+        'patterns': {}
+    }
+
+
+def new_word_entry() -> dict:
+    return {
+        'lemma_counts': Counter(),
+        'methods': defaultdict(Counter),
+        'confidences': {},
+        'pos_tags': defaultdict(Counter),
+        'forms': defaultdict(Counter),
+        'first_seen': None,
+        'last_seen': None,
+        'source_poems': Counter()
+    }
+
+
+def merge_confidence(stats: list, other: list) -> list:
+    """Merge [sum, min, max, count] confidence accumulators."""
+    if stats is None:
+        return list(other)
+    stats[0] += other[0]
+    stats[1] = min(stats[1], other[1])
+    stats[2] = max(stats[2], other[2])
+    stats[3] += other[3]
+    return stats
+
+
+def map_shard(shard: list) -> dict:
+    """Map step: aggregate one shard of poems into partial counts."""
+    partial = new_partial()
+    words = partial['words']
+    lemma_poems = partial['lemma_poems']
+    methods = partial['methods']
+    patterns = partial['patterns']
+
+    for poem_id, batch, tokens in shard:
+        for original, lemma, pos, form, method, confidence in tokens:
+            entry = words.get(original)
+            if entry is None:
+                entry = words[original] = new_word_entry()
+
+            entry['lemma_counts'][lemma] += 1
+            entry['methods'][lemma][method] += 1
+            entry['confidences'][lemma] = merge_confidence(
+                entry['confidences'].get(lemma), [confidence, confidence, confidence, 1]
+            )
+            if pos:
+                entry['pos_tags'][lemma][pos] += 1
+            if form:
+                entry['forms'][lemma][form] += 1
+            if batch:
+                if entry['first_seen'] is None or batch < entry['first_seen']:
+                    entry['first_seen'] = batch
+                if entry['last_seen'] is None or batch > entry['last_seen']:
+                    entry['last_seen'] = batch
+            entry['source_poems'][poem_id] += 1
+            lemma_poems[lemma][poem_id] += 1
+
+            method_stats = methods.get(method)
+            if method_stats is None:
+                method_stats = methods[method] = {
+                    'count': 0, 'conf_sum': 0.0, 'bands': Counter(), 'by_pos': {}
+                }
+            method_stats['count'] += 1
+            method_stats['conf_sum'] += confidence
+            method_stats['bands'][confidence_band(confidence)] += 1
+            pos_stats = method_stats['by_pos'].setdefault(pos, [0, 0.0])
+            pos_stats[0] += 1
+            pos_stats[1] += confidence
+
+            if pos:
+                pattern = f"{pos}_{form}" if form else pos
+                pattern_stats = patterns.get(pattern)
+                if pattern_stats is None:
+                    pattern_stats = patterns[pattern] = {
+                        'count': 0, 'conf_sum': 0.0, 'methods': Counter()
+                    }
+                pattern_stats['count'] += 1
+                pattern_stats['conf_sum'] += confidence
+                pattern_stats['methods'][method] += 1
+
+    return partial
+
+
+def confidence_band(confidence: float) -> str:
+    """Band used for method_analytics confidence_distribution."""
+    if confidence >= 0.9:
+        return 'high'
+    if confidence >= 0.5:
+        return 'medium'
+    return 'low'
+
+
+def reduce_partials(total: dict, partial: dict) -> dict:
+    """Reduce step: merge a partial aggregate into the running total."""
+    words = total['words']
+    for original, other in partial['words'].items():
+        entry = words.get(original)
+        if entry is None:
+            words[original] = other
+            continue
+        entry['lemma_counts'].update(other['lemma_counts'])
+        for lemma, counts in other['methods'].items():
+            entry['methods'][lemma].update(counts)
+        for lemma, stats in other['confidences'].items():
+            entry['confidences'][lemma] = merge_confidence(entry['confidences'].get(lemma), stats)
+        for lemma, counts in other['pos_tags'].items():
+            entry['pos_tags'][lemma].update(counts)
+        for lemma, counts in other['forms'].items():
+            entry['forms'][lemma].update(counts)
+        for key, pick in (('first_seen', min), ('last_seen', max)):
+            values = [v for v in (entry[key], other[key]) if v is not None]
+            entry[key] = pick(values) if values else None
+        entry['source_poems'].update(other['source_poems'])
+
+    for lemma, counts in partial['lemma_poems'].items():
+        total['lemma_poems'][lemma].update(counts)
+
+    for method, other in partial['methods'].items():
+        stats = total['methods'].get(method)
+        if stats is None:
+            total['methods'][method] = other
+            continue
+        stats['count'] += other['count']
+        stats['conf_sum'] += other['conf_sum']
+        stats['bands'].update(other['bands'])
+        for pos, (count, conf_sum) in other['by_pos'].items():
+            pos_stats = stats['by_pos'].setdefault(pos, [0, 0.0])
+            pos_stats[0] += count
+            pos_stats[1] += conf_sum
+
+    for pattern, other in partial['patterns'].items():
+        stats = total['patterns'].get(pattern)
+        if stats is None:
+            total['patterns'][pattern] = other
+            continue
+        stats['count'] += other['count']
+        stats['conf_sum'] += other['conf_sum']
+        stats['methods'].update(other['methods'])
+
+    return total
+
+
+def sort_poem_counts(counts: Counter) -> dict:
+    """Source poems as {poem_id: count} in numeric poem ID order."""
+    return {poem_id: counts[poem_id] for poem_id in sorted(counts, key=int)}
+
+
+def finalise_words(total: dict) -> dict:
+    """Turn reduced word entries into the corpus 'words' section."""
+    words = {}
+    for original, entry in total['words'].items():
+        lemma_counts = entry['lemma_counts']
+        lemmas = [lemma for lemma, _ in lemma_counts.most_common()]
+        words[original] = {
+            'lemmas': lemmas,
+            'lemma_counts': {lemma: lemma_counts[lemma] for lemma in lemmas},
+            'methods': {lemma: dict(entry['methods'][lemma]) for lemma in lemmas},
+            'confidences': {
+                lemma: {
+                    'avg': stats[0] / stats[3],
+                    'min': stats[1],
+                    'max': stats[2],
+                    'count': stats[3]
+                }
+                for lemma, stats in entry['confidences'].items()
+            },
+            'pos_tags': {lemma: dict(entry['pos_tags'][lemma]) for lemma in lemmas
+                         if entry['pos_tags'][lemma]},
+            'forms': {lemma: dict(entry['forms'][lemma]) for lemma in lemmas
+                      if entry['forms'][lemma]},
+            'total_count': sum(lemma_counts.values()),
+            'first_seen': entry['first_seen'],
+            'last_seen': entry['last_seen'],
+            'source_poems': sort_poem_counts(entry['source_poems'])
+        }
+    return words
+
+
+def finalise_lemma_index(words: dict, lemma_poems: dict) -> dict:
+    """Build the alphabetically sorted lemma_index from the words section."""
+    form_counts = defaultdict(dict)
+    for original, word_data in words.items():
+        for lemma in word_data['lemmas']:
+            form_counts[lemma][original] = {
+                'count': word_data['lemma_counts'][lemma],
+                'forms': sorted(word_data['forms'].get(lemma, {})),
+                'confidence_avg': word_data['confidences'][lemma]['avg']
+            }
+
+    lemma_index = {}
+    for lemma in sorted(form_counts):
+        distribution = form_counts[lemma]
+        ordered = sorted(distribution, key=lambda w: -distribution[w]['count'])
+        lemma_index[lemma] = {
+            'word_forms': ordered,
+            'total_occurrences': sum(d['count'] for d in distribution.values()),
+            'source_poems': sort_poem_counts(lemma_poems[lemma]),
+            'form_distribution': {w: distribution[w] for w in ordered}
+        }
+    return lemma_index
+
+
+def finalise_method_analytics(total: dict) -> dict:
+    """Build method_analytics from reduced per-method counts."""
+    analytics = {}
+    for method, stats in sorted(total['methods'].items(), key=lambda x: -x[1]['count']):
+        count = stats['count']
+        analytics[method] = {
+            'total_uses': count,
+            'avg_confidence': stats['conf_sum'] / count,
+            'confidence_distribution': {
+                band: 100 * stats['bands'][band] / count for band in ('high', 'medium', 'low')
+            },
+            'by_pos': {
+                pos: {'count': pos_count, 'avg_confidence': conf_sum / pos_count}
+                for pos, (pos_count, conf_sum) in sorted(stats['by_pos'].items(),
+                                                         key=lambda x: -x[1][0])
+            }
+        }
+    return analytics
+
+
+def finalise_morphological_patterns(total: dict) -> dict:
+    """Build morphological_patterns (POS_form) from reduced counts."""
+    patterns = {}
+    for pattern, stats in sorted(total['patterns'].items(), key=lambda x: -x[1]['count']):
+        count = stats['count']
+        patterns[pattern] = {
+            # README documents 'count'; examples/advanced_analysis.py reads 'total_count'
+            'count': count,
+            'total_count': count,
+            'avg_confidence': stats['conf_sum'] / count,
+            'methods_used': {
+                method: 100 * method_count / count
+                for method, method_count in stats['methods'].most_common()
+            }
+        }
+    return patterns
+
+
+def finalise_quality_tiers(words: dict) -> dict:
+    """Assign each word form to a quality tier by its average confidence."""
+    tiers = {name: [] for name, _ in QUALITY_TIERS}
+    for original, word_data in words.items():
+        conf_sum = sum(c['avg'] * c['count'] for c in word_data['confidences'].values())
+        avg_conf = conf_sum / word_data['total_count']
+        for name, threshold in QUALITY_TIERS:
+            if avg_conf >= threshold:
+                tiers[name].append((original, word_data['total_count'], avg_conf))
+                break
+
+    total_forms = len(words) or 1
+    quality_tiers = {}
+    for name, members in tiers.items():
+        members.sort(key=lambda x: -x[1])
+        quality_tiers[name] = {
+            # README documents 'unique_words'; the examples read 'count'
+            'unique_words': len(members),
+            'count': len(members),
+            'percentage': 100 * len(members) / total_forms,
+            'examples': [
+                {'word': w, 'occurrences': occ, 'avg_confidence': conf}
+                for w, occ, conf in members[:10]
+            ]
+        }
+    return quality_tiers
+
+
+def derive_ambiguous_words(words: dict) -> dict:
+    """Derive ambiguous_words from chosen-lemma counts (no rejection data)."""
+    ambiguous = {}
+    for original, word_data in words.items():
+        if len(word_data['lemmas']) < 2:
+            continue
+        ambiguous[original] = {
+            'total_occurrences': word_data['total_count'],
+            'lemma_competition': {
+                lemma: {
+                    'chosen': word_data['lemma_counts'][lemma],
+                    'rejected': 0,
+                    'confidence_avg': word_data['confidences'][lemma]['avg']
+                }
+                for lemma in word_data['lemmas']
+            },
+            'alternatives_seen': list(word_data['lemmas']),
+            'needs_review': True
+        }
+    return ambiguous
+
+
+def rebuild_aggregates(poems_index: dict, workers: int, num_shards: int,
+                       base_corpus: dict = None) -> dict:
+    """
+    Rebuild the aggregate corpus from a loaded poem index.
+
+    Args:
+        poems_index: Loaded poems_index (v2, v3 or v4)
+        workers: Number of worker processes for the map step
+        num_shards: Number of poem shards
+        base_corpus: Optional previous aggregate for non-token sections
+
+    Returns:
+        Aggregate corpus dict
+    """
+    num_poems = len(poems_index['poems'])
+    print(f"\nSharding {num_poems:,} poems into {num_shards} shards...")
+    with stage('shard', items=num_poems):
+        shards = make_shards(poems_index['poems'], num_shards)
+
+    print(f"Mapping shards on {workers} workers...")
+    total = new_partial()
+    with stage('map_reduce', items=num_poems):
+        with Pool(workers) as pool:
+            for done, partial in enumerate(pool.imap_unordered(map_shard, shards), 1):
+                reduce_partials(total, partial)
+                print(f"  Reduced: {done}/{len(shards)} shards")
+
+    print("Finalising sections...")
+    with stage('finalise'):
+        words = finalise_words(total)
+        lemma_index = finalise_lemma_index(words, total['lemma_poems'])
+        method_analytics = finalise_method_analytics(total)
+        morphological_patterns = finalise_morphological_patterns(total)
+        quality_tiers = finalise_quality_tiers(words)
+
+    base_corpus = base_corpus or {}
+    if 'ambiguous_words' in base_corpus:
+        ambiguous_words = {w: d for w, d in base_corpus['ambiguous_words'].items() if w in words}
+    else:
+        ambiguous_words = derive_ambiguous_words(words)
+
+    total_words = sum(w['total_count'] for w in words.values())
+    index_version = poems_index['metadata'].get('version', 'unknown')
+    metadata = dict(base_corpus.get('metadata', {}))
+    metadata.update({
+        'total_words': total_words,
+        'unique_forms': len(words),
+        'unique_lemmas': len(lemma_index),
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'version': f"{metadata.get('version', 'corpus')}_rebuilt",
+        'created_from': f"poems_index_{index_version} (map-reduce rebuild)",
+        'word_poem_pairs': sum(len(w['source_poems']) for w in words.values())
+    })
+
+    corpus = {
+        'metadata': metadata,
+        'words': words,
+        'lemma_index': lemma_index,
+        'ambiguous_words': ambiguous_words,
+        'method_analytics': method_analytics,
+        'morphological_patterns': morphological_patterns,
+        'quality_tiers': quality_tiers
+    }
+    if 'corpus_timeline' in base_corpus:
+        corpus['corpus_timeline'] = base_corpus['corpus_timeline']
+
+    print(f"\n  Total words: {total_words:,}")
+    print(f"  Unique forms: {len(words):,}")
+    print(f"  Unique lemmas: {len(lemma_index):,}")
+    print(f"  Methods: {len(method_analytics)}")
+    print(f"  Morphological patterns: {len(morphological_patterns)}")
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Rebuild aggregate corpus sections from the poem index (map-reduce)'
+    )
+    parser.add_argument('--poems-index', type=Path, default=Path('poems_index_v3.json.gz'),
+                        help='Input poems index (v2/v3/v4)')
+    parser.add_argument('--base-corpus', type=Path, default=None,
+                        help='Previous aggregate corpus for metadata, ambiguous_words and corpus_timeline')
+    parser.add_argument('--output', type=Path, default=Path('corpus_full_source_poems_v3.json.gz'),
+                        help='Output aggregate corpus file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Worker processes (default: all cores)')
+    parser.add_argument('--shards', type=int, default=None,
+                        help='Number of poem shards (default: 4 per worker)')
+    pipeline_metrics.add_arguments(parser)
+
+    args = parser.parse_args()
+    pipeline_metrics.from_args(args, 'rebuild_corpus_aggregates')
+    num_shards = args.shards or args.workers * 4
+
+    print(f"Loading poems index from {args.poems_index}...")
+    with stage('load_poems_index') as s:
+        poems_index = load_json(args.poems_index)
+        s.items = len(poems_index['poems'])
+    print(f"  Loaded {len(poems_index['poems']):,} poems")
+
+    base_corpus = None
+    if args.base_corpus:
+        print(f"Loading base corpus from {args.base_corpus}...")
+        with stage('load_base_corpus'):
+            base_corpus = load_json(args.base_corpus)
+
+    with stage('rebuild', items=len(poems_index['poems'])):
+        corpus = rebuild_aggregates(poems_index, args.workers, num_shards, base_corpus)
+
+    print(f"\nWriting {args.output}...")
+    with stage('save'):
+        save_json(corpus, args.output)
+    print(f"Saved: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
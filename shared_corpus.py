@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Shared-memory corpus arrays for multi-process workers.
+
+Parallel jobs have each worker reload and re-parse the gzip JSON, so memory
+grows with the number of workers. This module decodes the poems index (as
+TokenArrays, see corpus_arrays.py) and the aggregate corpus once into
+integer arrays and UTF-8 string tables, and places them in a single block:
+
+- a `multiprocessing.shared_memory` segment (default), or
+- a file, typically on /dev/shm, that is mapped read-only.
+
+Workers attach by name or path and get NumPy views into the block with no
+copies and no parsing. Block layout: an 8-byte header length, a JSON
+header (dtype, shape and offset of every array), then the arrays, each
+aligned to 64 bytes. String tables are stored as `<name>.data` (bytes)
+plus `<name>.offsets` (int64) and decoded per item on access.
+
+Usage:
+    # Publish and keep the segment alive until Ctrl-C
+    python shared_corpus.py publish --poems-index poems_index_v3.json.gz \
+        --corpus corpus_full_source_poems_v2.json.gz --name runoregi_corpus
+
+    # Or write a mapped file that outlives the publisher
+    python shared_corpus.py publish --poems-index corpus_arrays.npz --path /dev/shm/runoregi_corpus
+
+    python shared_corpus.py info --name runoregi_corpus
+    python shared_corpus.py lemma-counts --name runoregi_corpus --workers 16
+
+In Python:
+    shared = SharedCorpus.attach(name='runoregi_corpus')
+    arrays = shared.token_arrays()          # TokenArrays backed by shared memory
+    results = map_poem_shards(shared, count_lemmas, workers=16)
+"""
+
+import argparse
+import json
+import mmap
+import os
+import signal
+import sys
+import time
+from multiprocessing import Pool, resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+
+from corpus_arrays import TOKEN_FIELDS, TokenArrays, load_token_arrays
+from corpus_io import load_corpus, pack_json, string_table, unpack_json
+
+
+SHARED_FORMAT = 'shared_corpus'
+SHARED_VERSION = 1
+ALIGNMENT = 64
+HEADER_SIZE_BYTES = 8
+
+# Segments created by this process (inherited by forked workers)
+_created = set()
+
+
+class SharedCorpusError(Exception):
+    """The named block is missing or not a shared corpus."""
+
+
+class StringTable:
+    """Read-only string list over UTF-8 bytes and offsets, decoded per item."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+        self._lookup = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        data = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode('utf-8')
+
+    def __contains__(self, value) -> bool:
+        return value in self._index()
+
+    def index(self, value) -> int:
+        """Position of a value (builds a per-process lookup on first use)."""
+        try:
+            return self._index()[value]
+        except KeyError:
+            raise ValueError(f"{value!r} is not in table") from None
+
+    def tolist(self) -> list:
+        return list(self)
+
+    def _index(self) -> dict:
+        if self._lookup is None:
+            self._lookup = {value: i for i, value in enumerate(self)}
+        return self._lookup
+
+
+def encode_token_arrays(arrays: TokenArrays) -> tuple:
+    """Arrays, string tables and JSON blobs of a TokenArrays."""
+    columns = {
+        'poem_offsets': arrays.poem_offsets,
+        'confidence': arrays.confidence,
+        'verse': arrays.verse
+    }
+    strings = {'poem_ids': arrays.poem_ids}
+    for field in TOKEN_FIELDS:
+        columns[f'code_{field}'] = arrays.codes[field]
+        strings[f'vocab_{field}'] = arrays.vocab[field]
+    return columns, strings, {'poem_metadata': arrays.poem_metadata}
+
+
+def encode_aggregate(corpus: dict) -> tuple:
+    """
+    Arrays and string tables of an aggregate corpus.
+
+    Readings (word, lemma pairs) are stored per word in CSR form:
+    readings of word i are [agg_reading_offsets[i], agg_reading_offsets[i+1]).
+    """
+    words = corpus.get('words', {})
+    lemma_index = corpus.get('lemma_index', {})
+    lemma_id = {lemma: i for i, lemma in enumerate(lemma_index)}
+
+    offsets, reading_lemma, reading_count, reading_confidence = [0], [], [], []
+    word_total = []
+    for data in words.values():
+        for lemma in data.get('lemmas', []):
+            if lemma not in lemma_id:
+                lemma_id[lemma] = len(lemma_id)
+            reading_lemma.append(lemma_id[lemma])
+            reading_count.append(data.get('lemma_counts', {}).get(lemma, 0))
+            reading_confidence.append(data.get('confidences', {}).get(lemma, {}).get('avg', 0.0))
+        offsets.append(len(reading_lemma))
+        word_total.append(data.get('total_count', 0))
+
+    lemmas = list(lemma_id)
+    lemma_total = [lemma_index.get(lemma, {}).get('total_occurrences', 0) for lemma in lemmas]
+    columns = {
+        'agg_reading_offsets': np.asarray(offsets, dtype=np.int64),
+        'agg_reading_lemma': np.asarray(reading_lemma, dtype=np.int32),
+        'agg_reading_count': np.asarray(reading_count, dtype=np.int64),
+        'agg_reading_confidence': np.asarray(reading_confidence, dtype=np.float32),
+        'agg_word_total': np.asarray(word_total, dtype=np.int64),
+        'agg_lemma_total': np.asarray(lemma_total, dtype=np.int64)
+    }
+    return columns, {'agg_words': list(words), 'agg_lemmas': lemmas}
+
+
+class SharedCorpus:
+    """Named arrays in one shared-memory segment or mapped file."""
+
+    def __init__(self, buffer, header: dict, shm=None, mapped=None, path: Path = None, owner: bool = False):
+        self.header = header
+        self._shm = shm
+        self._mapped = mapped
+        self.path = path
+        self.owner = owner
+        self.arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'])) if spec['shape'] else 1
+            view = np.frombuffer(buffer, dtype=dtype, count=count, offset=spec['offset'])
+            view = view.reshape(spec['shape'])
+            view.flags.writeable = False
+            self.arrays[name] = view
+
+    @property
+    def name(self) -> str:
+        return self._shm.name if self._shm is not None else None
+
+    @property
+    def nbytes(self) -> int:
+        return self.header['size']
+
+    @classmethod
+    def create(cls, arrays: dict, strings: dict = None, blobs: dict = None,
+               name: str = None, path: Path = None) -> 'SharedCorpus':
+        """
+        Copy arrays into a new block.
+
+        Args:
+            arrays: name -> ndarray
+            strings: name -> list of str (stored as string tables)
+            blobs: name -> JSON-serialisable value
+            name: shared memory segment name (random when None)
+            path: write a mapped file here instead of a shared memory segment
+        """
+        arrays = {name_: np.ascontiguousarray(a) for name_, a in arrays.items()}
+        for table, values in (strings or {}).items():
+            arrays[f'{table}.data'], arrays[f'{table}.offsets'] = string_table(str(v) for v in values)
+        for blob, value in (blobs or {}).items():
+            arrays[f'{blob}.json'] = pack_json(value)
+
+        specs = {name_: {'dtype': a.dtype.str, 'shape': list(a.shape)} for name_, a in arrays.items()}
+        header = {
+            'format': SHARED_FORMAT,
+            'version': SHARED_VERSION,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'strings': sorted(strings or {}),
+            'blobs': sorted(blobs or {}),
+            'arrays': specs
+        }
+        # Offsets depend on the header length, which depends on the offsets;
+        # reserve room for the widest offsets first and fix them in one pass.
+        for spec in specs.values():
+            spec['offset'] = 0
+        header['size'] = 0
+        reserve = len(json.dumps(header)) + 24 * (len(specs) + 1)
+        position = _align(HEADER_SIZE_BYTES + reserve)
+        for name_, a in arrays.items():
+            specs[name_]['offset'] = position
+            position = _align(position + a.nbytes)
+        header['size'] = position
+        header_bytes = json.dumps(header).encode('utf-8').ljust(reserve)
+
+        if path is not None:
+            with open(path, 'wb') as f:
+                f.write(len(header_bytes).to_bytes(HEADER_SIZE_BYTES, 'little'))
+                f.write(header_bytes)
+                for name_, a in arrays.items():
+                    f.seek(specs[name_]['offset'])
+                    f.write(a.tobytes())
+                f.truncate(position)
+            return cls.attach(path=path)
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=position)
+        _created.add(shm._name)
+        buf = shm.buf
+        buf[:HEADER_SIZE_BYTES] = len(header_bytes).to_bytes(HEADER_SIZE_BYTES, 'little')
+        buf[HEADER_SIZE_BYTES:HEADER_SIZE_BYTES + len(header_bytes)] = header_bytes
+        for name_, a in arrays.items():
+            start = specs[name_]['offset']
+            buf[start:start + a.nbytes] = a.reshape(-1).view(np.uint8).data
+        return cls(shm.buf, header, shm=shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str = None, path: Path = None, track: bool = False) -> 'SharedCorpus':
+        """
+        Attach to an existing block by segment name or file path.
+
+        track=False keeps this process's resource tracker from removing the
+        segment at exit (a process that created the segment, and its forked
+        workers, share one tracker registration and are left as they are).
+        """
+        if path is not None:
+            try:
+                with open(path, 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                raise SharedCorpusError(f"Cannot map {path}: {e}") from e
+            return cls(mapped, _read_header(mapped, path), mapped=mapped, path=Path(path))
+
+        try:
+            shm = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            raise SharedCorpusError(f"No shared memory segment named {name!r}") from None
+        if not track and shm._name not in _created:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm.buf, _read_header(shm.buf, name), shm=shm)
+
+    def strings(self, table: str) -> StringTable:
+        return StringTable(self.arrays[f'{table}.data'], self.arrays[f'{table}.offsets'])
+
+    def blob(self, name: str):
+        return unpack_json(self.arrays[f'{name}.json'])
+
+    def has_token_arrays(self) -> bool:
+        return 'poem_offsets' in self.arrays
+
+    def has_aggregate(self) -> bool:
+        return 'agg_reading_offsets' in self.arrays
+
+    def token_arrays(self) -> TokenArrays:
+        """TokenArrays whose columns and vocabularies are views into the block."""
+        return TokenArrays(
+            poem_ids=self.strings('poem_ids').tolist(),
+            poem_offsets=self.arrays['poem_offsets'],
+            codes={field: self.arrays[f'code_{field}'] for field in TOKEN_FIELDS},
+            confidence=self.arrays['confidence'],
+            verse=self.arrays['verse'],
+            vocab={field: self.strings(f'vocab_{field}') for field in TOKEN_FIELDS},
+            poem_metadata=self.blob('poem_metadata')
+        )
+
+    def close(self):
+        """Detach from the block (views obtained earlier must no longer be used)."""
+        self.arrays = {}
+        try:
+            if self._shm is not None:
+                self._shm.close()
+            if self._mapped is not None:
+                self._mapped.close()
+        except BufferError:
+            # Views are still held elsewhere: drop the handle so SharedMemory
+            # does not retry at exit; the mapping goes with the last view
+            if self._shm is not None:
+                self._shm._buf = self._shm._mmap = None
+
+    def unlink(self):
+        """Remove the segment or file (attached processes keep their mapping)."""
+        if self._shm is not None:
+            self._shm.unlink()
+        elif self.path is not None and self.path.exists():
+            self.path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self.owner:
+            self.unlink()
+
+
+def _align(position: int) -> int:
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _read_header(buffer, source) -> dict:
+    size = int.from_bytes(bytes(buffer[:HEADER_SIZE_BYTES]), 'little')
+    try:
+        header = json.loads(bytes(buffer[HEADER_SIZE_BYTES:HEADER_SIZE_BYTES + size]).decode('utf-8'))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        header = None
+    if not isinstance(header, dict) or header.get('format') != SHARED_FORMAT:
+        raise SharedCorpusError(f"{source} is not a shared corpus block")
+    if header.get('version') != SHARED_VERSION:
+        raise SharedCorpusError(f"{source}: unsupported version {header.get('version')}")
+    return header
+
+
+def publish(poems_index: Path = None, corpus: Path = None, name: str = None, path: Path = None) -> SharedCorpus:
+    """Decode a poems index (.json/.json.gz/.npz) and/or aggregate corpus into a new block."""
+    arrays, strings, blobs = {}, {}, {}
+    if poems_index is not None:
+        token_arrays = load_token_arrays(poems_index)
+        arrays, strings, blobs = encode_token_arrays(token_arrays)
+        del token_arrays
+    if corpus is not None:
+        agg_arrays, agg_strings = encode_aggregate(load_corpus(corpus))
+        arrays.update(agg_arrays)
+        strings.update(agg_strings)
+    return SharedCorpus.create(arrays, strings, blobs, name=name, path=path)
+
+
+def poem_shards(shared: SharedCorpus, num_shards: int) -> list:
+    """Split poems into contiguous (start, end) ranges of about equal token count."""
+    offsets = shared.arrays['poem_offsets']
+    num_poems = len(offsets) - 1
+    targets = np.linspace(0, offsets[-1], num_shards + 1)
+    bounds = np.unique(np.concatenate([[0], np.searchsorted(offsets, targets[1:-1]), [num_poems]]))
+    return [(int(s), int(e)) for s, e in zip(bounds[:-1], bounds[1:])]
+
+
+_worker_corpus = None
+
+
+def _init_worker(name, path):
+    global _worker_corpus
+    _worker_corpus = SharedCorpus.attach(name=name, path=path)
+
+
+def _run_shard(args):
+    func, start, end, extra = args
+    return func(_worker_corpus, start, end, *extra)
+
+
+def map_poem_shards(shared: SharedCorpus, func, workers: int = 1, shards: int = None, args: tuple = ()) -> list:
+    """
+    Call func(shared, start_poem, end_poem, *args) over poem shards.
+
+    func must be a module-level function; workers attach to the block by
+    name, so nothing but the shard bounds is pickled. Results are returned
+    in shard order.
+    """
+    bounds = poem_shards(shared, shards or max(1, workers) * 4)
+    if workers <= 1:
+        return [func(shared, start, end, *args) for start, end in bounds]
+    tasks = [(func, start, end, args) for start, end in bounds]
+    with Pool(workers, initializer=_init_worker, initargs=(shared.name, shared.path)) as pool:
+        return pool.map(_run_shard, tasks)
+
+
+def count_lemmas(shared: SharedCorpus, start: int, end: int) -> np.ndarray:
+    """Token count per lemma code for poems [start, end)."""
+    offsets = shared.arrays['poem_offsets']
+    codes = shared.arrays['code_lemma'][offsets[start]:offsets[end]]
+    return np.bincount(codes, minlength=len(shared.strings('vocab_lemma')))
+
+
+def _describe(shared: SharedCorpus):
+    source = shared.path or shared.name
+    print(f"\n📦 {source}: {shared.nbytes / (1024 * 1024):.1f} MB, created {shared.header['created']}")
+    if shared.has_token_arrays():
+        offsets = shared.arrays['poem_offsets']
+        print(f"   Poems: {len(offsets) - 1:,}  Tokens: {int(offsets[-1]):,}")
+    if shared.has_aggregate():
+        print(f"   Aggregate words: {len(shared.strings('agg_words')):,}  "
+              f"lemmas: {len(shared.strings('agg_lemmas')):,}  "
+              f"readings: {len(shared.arrays['agg_reading_lemma']):,}")
+    print(f"\n   {'Array':<28} {'dtype':>8} {'Length':>14} {'MB':>9}")
+    for name, array in shared.arrays.items():
+        print(f"   {name:<28} {array.dtype.str:>8} {array.size:>14,} {array.nbytes / (1024 * 1024):>9.2f}")
+
+
+def run_publish(args):
+    if args.poems_index is None and args.corpus is None:
+        print("⚠ Nothing to publish: give --poems-index and/or --corpus")
+        return 1
+    shared = publish(args.poems_index, args.corpus, name=args.name, path=args.path)
+    _describe(shared)
+    if args.path is not None:
+        print(f"\n✓ Wrote {args.path}; attach with SharedCorpus.attach(path='{args.path}')")
+        shared.close()
+        return 0
+
+    print(f"\n✓ Published segment '{shared.name}'; attach with SharedCorpus.attach(name='{shared.name}')")
+    print("  Keeping it alive; press Ctrl-C to remove it")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shared.close()
+        shared.unlink()
+        print(f"\n✓ Removed segment '{shared.name}'")
+    return 0
+
+
+def run_info(args):
+    shared = SharedCorpus.attach(name=args.name, path=args.path)
+    _describe(shared)
+    shared.close()
+    return 0
+
+
+def run_lemma_counts(args):
+    shared = SharedCorpus.attach(name=args.name, path=args.path)
+    if not shared.has_token_arrays():
+        print("⚠ Block has no token arrays")
+        return 1
+    start = time.perf_counter()
+    counts = sum(map_poem_shards(shared, count_lemmas, workers=args.workers))
+    elapsed = time.perf_counter() - start
+    vocab = shared.strings('vocab_lemma')
+    print(f"\nLemma counts over {len(shared.arrays['poem_offsets']) - 1:,} poems "
+          f"with {args.workers} workers ({elapsed:.2f} s):")
+    for code in np.argsort(-counts, kind='stable')[:args.top]:
+        print(f"  {vocab[code]:25s} {int(counts[code]):>10,}")
+    del vocab, counts
+    shared.close()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Publish corpus arrays in shared memory for multi-process workers'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_target(p):
+        group = p.add_mutually_exclusive_group(required=p is not publish_parser)
+        group.add_argument('--name', default=None, help='Shared memory segment name')
+        group.add_argument('--path', type=Path, default=None,
+                           help='Mapped file instead of a segment (e.g. /dev/shm/runoregi_corpus)')
+
+    publish_parser = subparsers.add_parser('publish', help='Decode the corpus once into shared memory')
+    publish_parser.add_argument('--poems-index', type=Path, default=None,
+                                help='Poems index (.json/.json.gz) or corpus_arrays .npz')
+    publish_parser.add_argument('--corpus', type=Path, default=None,
+                                help='Aggregate corpus JSON (.json or .json.gz)')
+    add_target(publish_parser)
+
+    info_parser = subparsers.add_parser('info', help='List the arrays of a published block')
+    add_target(info_parser)
+
+    counts_parser = subparsers.add_parser('lemma-counts', help='Example sharded job: token count per lemma')
+    add_target(counts_parser)
+    counts_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                               help='Worker processes (default: CPU count)')
+    counts_parser.add_argument('--top', type=int, default=20, help='Lemmas to print (default: 20)')
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'publish':
+            return run_publish(args)
+        if args.command == 'info':
+            return run_info(args)
+        return run_lemma_counts(args)
+    except SharedCorpusError as e:
+        print(f"⚠ {e}")
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Instant substitution impact estimates from a token count cube.
+
+apply_substitutions.py --dry-run loads and rewrites both full JSON files
+just to count changes. This module precomputes a cube of token counts by
+(lemma, pos, method, form) from the poem index, with the number of poems
+per cell and a compressed posting list of those poems (delta + varint, as
+in posting_lists.py). A rule set is then estimated by selecting cells:
+token totals come from the cell counts, poem totals from the union of the
+selected cells' posting lists, and the most affected poems from the
+summed per-poem counts.
+
+Usage:
+    # Build once per poem index (one pass over all tokens)
+    python substitution_impact.py build --poems-index poems_index_v2.json.gz \
+        --output substitution_cube.npz
+
+    # How many tokens and poems would these rules change?
+    python substitution_impact.py estimate --cube substitution_cube.npz \
+        --substitutions final_substitutions.csv --top-poems 10
+
+    # Context rules: token-level method/form conditions are applied;
+    # neighbour and position conditions make the estimate an upper bound
+    python substitution_impact.py estimate --cube substitution_cube.npz \
+        --rules context_rules.csv --per-rule
+
+In Python:
+    cube = SubstitutionCube.load('substitution_cube.npz')
+    result = cube.estimate(load_substitution_selectors('final_substitutions.csv'))
+    result['tokens'], result['poems']
+"""
+
+import argparse
+import csv
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from corpus_io import pack_strings, unpack_strings
+from posting_lists import (PostingList, decode_postings, decode_varints, encode_postings,
+                           encode_varints, union)
+
+
+DIMENSIONS = ('lemma', 'pos', 'method', 'form')
+
+
+class Selector:
+    """
+    Cells changed by one rule: lemma and POS, optionally restricted by
+    method and form (sets of allowed or excluded values).
+    """
+
+    __slots__ = ('name', 'lemma', 'pos', 'methods', 'exclude_methods', 'forms',
+                 'exclude_forms', 'upper_bound')
+
+    def __init__(self, name, lemma, pos='', methods=None, exclude_methods=(),
+                 forms=None, exclude_forms=(), upper_bound=False):
+        self.name = name
+        self.lemma = lemma.lower()
+        self.pos = pos
+        self.methods = set(methods) if methods is not None else None
+        self.exclude_methods = set(exclude_methods)
+        self.forms = set(forms) if forms is not None else None
+        self.exclude_forms = set(exclude_forms)
+        self.upper_bound = upper_bound
+
+
+class SubstitutionCube:
+    """Token counts by (lemma, pos, method, form) with per-cell poem postings."""
+
+    def __init__(self, vocab: dict, cells: dict, postings: dict, poem_table: list):
+        self.vocab = vocab              # dimension -> list of values
+        self.cells = cells              # lemma/pos/method/form ids, tokens, poems
+        self.postings = postings        # postings, posting_offsets, counts, count_offsets
+        self.poem_table = poem_table
+        self._ids = {dim: {v: i for i, v in enumerate(values)} for dim, values in vocab.items()}
+
+        # Cells are sorted by lemma id: lemma_starts[i]:lemma_starts[i + 1] are lemma i's cells
+        self.lemma_starts = np.searchsorted(cells['lemma'], np.arange(len(vocab['lemma']) + 1))
+
+    @classmethod
+    def build(cls, index: dict) -> 'SubstitutionCube':
+        """Build the cube from a loaded poems index (v2/v3/v4) in one token pass."""
+        poem_table = sorted(index['poems'], key=int)
+        ids = {dim: {} for dim in DIMENSIONS}
+        # cell key -> ([poem ordinals], [token counts]); poems are visited in ordinal order
+        cell_poems = defaultdict(lambda: ([], []))
+
+        for ordinal, poem_id in enumerate(poem_table):
+            poem_cells = Counter()
+            for word in index['poems'][poem_id].get('words', []):
+                key = tuple(
+                    ids[dim].setdefault(value, len(ids[dim]))
+                    for dim, value in zip(DIMENSIONS, (
+                        (word.get('lemma') or '').lower(), word.get('pos', ''),
+                        word.get('method', ''), word.get('form', '')
+                    ))
+                )
+                poem_cells[key] += 1
+            for key, count in poem_cells.items():
+                ordinals, counts = cell_poems[key]
+                ordinals.append(ordinal)
+                counts.append(count)
+
+        vocab = {dim: list(ids[dim]) for dim in DIMENSIONS}
+        # Renumber lemmas alphabetically so cells can be sorted and sliced by lemma
+        lemma_order = sorted(range(len(vocab['lemma'])), key=lambda i: vocab['lemma'][i])
+        lemma_rank = np.empty(len(lemma_order), dtype=np.int64)
+        lemma_rank[lemma_order] = np.arange(len(lemma_order))
+        vocab['lemma'] = [vocab['lemma'][i] for i in lemma_order]
+
+        keys = list(cell_poems)
+        key_array = np.array(keys, dtype=np.int64).reshape(-1, 4)
+        key_array[:, 0] = lemma_rank[key_array[:, 0]]
+        order = np.lexsort(key_array.T[::-1])
+
+        cells = {dim: key_array[order, i].astype(np.int32) for i, dim in enumerate(DIMENSIONS)}
+        tokens, poems = [], []
+        posting_chunks, count_chunks = [], []
+        posting_offsets, count_offsets = [0], [0]
+        for i in order:
+            ordinals, counts = cell_poems[keys[i]]
+            encoded = encode_postings(np.asarray(ordinals, dtype=np.uint64))
+            encoded_counts = encode_varints(np.asarray(counts, dtype=np.uint64))
+            tokens.append(sum(counts))
+            poems.append(len(ordinals))
+            posting_chunks.append(encoded)
+            count_chunks.append(encoded_counts)
+            posting_offsets.append(posting_offsets[-1] + encoded.size)
+            count_offsets.append(count_offsets[-1] + encoded_counts.size)
+
+        cells['tokens'] = np.asarray(tokens, dtype=np.int64)
+        cells['poems'] = np.asarray(poems, dtype=np.int32)
+        postings = {
+            'postings': np.concatenate(posting_chunks) if posting_chunks else np.zeros(0, np.uint8),
+            'posting_offsets': np.asarray(posting_offsets, dtype=np.int64),
+            'counts': np.concatenate(count_chunks) if count_chunks else np.zeros(0, np.uint8),
+            'count_offsets': np.asarray(count_offsets, dtype=np.int64)
+        }
+        return cls(vocab, cells, postings, poem_table)
+
+    def save(self, path: Path):
+        """Save to a compressed NumPy .npz archive."""
+        arrays = {'poem_table': pack_strings(self.poem_table)}
+        for dim in DIMENSIONS:
+            arrays[f'vocab_{dim}'] = pack_strings(self.vocab[dim])
+            arrays[f'cell_{dim}'] = self.cells[dim]
+        arrays['cell_tokens'] = self.cells['tokens']
+        arrays['cell_poems'] = self.cells['poems']
+        arrays.update(self.postings)
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> 'SubstitutionCube':
+        with np.load(path) as archive:
+            vocab = {dim: unpack_strings(archive[f'vocab_{dim}']) for dim in DIMENSIONS}
+            cells = {dim: archive[f'cell_{dim}'] for dim in DIMENSIONS}
+            cells['tokens'] = archive['cell_tokens']
+            cells['poems'] = archive['cell_poems']
+            postings = {name: archive[name] for name in
+                        ('postings', 'posting_offsets', 'counts', 'count_offsets')}
+            poem_table = unpack_strings(archive['poem_table'])
+        return cls(vocab, cells, postings, poem_table)
+
+    @property
+    def total_tokens(self) -> int:
+        return int(self.cells['tokens'].sum())
+
+    def select(self, selector: Selector) -> np.ndarray:
+        """Indices of the cells a selector covers."""
+        lemma_id = self._ids['lemma'].get(selector.lemma)
+        if lemma_id is None:
+            return np.zeros(0, dtype=np.int64)
+        start, end = self.lemma_starts[lemma_id], self.lemma_starts[lemma_id + 1]
+        mask = np.ones(end - start, dtype=bool)
+
+        def restrict(dim, allowed, excluded):
+            nonlocal mask
+            column = self.cells[dim][start:end]
+            if allowed is not None:
+                allowed_ids = [self._ids[dim][v] for v in allowed if v in self._ids[dim]]
+                mask &= np.isin(column, allowed_ids)
+            if excluded:
+                excluded_ids = [self._ids[dim][v] for v in excluded if v in self._ids[dim]]
+                mask &= ~np.isin(column, excluded_ids)
+
+        restrict('pos', {selector.pos} if selector.pos else None, ())
+        restrict('method', selector.methods, selector.exclude_methods)
+        restrict('form', selector.forms, selector.exclude_forms)
+        return start + np.flatnonzero(mask)
+
+    def cell_postings(self, cell: int) -> PostingList:
+        p = self.postings
+        return PostingList(
+            decode_postings(p['postings'][p['posting_offsets'][cell]:p['posting_offsets'][cell + 1]]),
+            decode_varints(p['counts'][p['count_offsets'][cell]:p['count_offsets'][cell + 1]])
+        )
+
+    def poems_for(self, cells: np.ndarray) -> PostingList:
+        """Union of the cells' posting lists (per-poem token counts summed)."""
+        return union(*(self.cell_postings(int(c)) for c in cells))
+
+    def estimate(self, selectors: list, per_rule: bool = False, top_poems: int = 0) -> dict:
+        """
+        Tokens and poems a rule set would change.
+
+        Each token is in exactly one cell, so overlapping selectors are not
+        double counted. Per-rule figures count each rule on its own.
+        """
+        selected = [self.select(s) for s in selectors]
+        cells = np.unique(np.concatenate(selected)) if selected else np.zeros(0, dtype=np.int64)
+        postings = self.poems_for(cells)
+        result = {
+            'rules': len(selectors),
+            'cells': int(cells.size),
+            'tokens': int(self.cells['tokens'][cells].sum()),
+            'poems': len(postings),
+            'upper_bound': any(s.upper_bound for s in selectors)
+        }
+        if per_rule:
+            result['by_rule'] = [
+                {
+                    'rule': s.name,
+                    'tokens': int(self.cells['tokens'][c].sum()),
+                    'poems': len(self.poems_for(c)),
+                    'upper_bound': s.upper_bound
+                }
+                for s, c in zip(selectors, selected)
+            ]
+        if top_poems:
+            order = np.argsort(-postings.counts.astype(np.int64), kind='stable')[:top_poems]
+            result['top_poems'] = [(self.poem_table[postings.ordinals[i]], int(postings.counts[i]))
+                                   for i in order]
+        return result
+
+
+def load_substitution_selectors(path: Path) -> list:
+    """Selectors for final_substitutions.csv 'apply' rows (manual_override tokens only)."""
+    selectors = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row.get('category') != 'apply' or row['current_pos'] == row['correct_pos']:
+                continue
+            selectors.append(Selector(f"{row['lemma']}|{row['current_pos']}→{row['correct_pos']}",
+                                      row['lemma'], row['current_pos'], methods={'manual_override'}))
+    return selectors
+
+
+def rule_selectors(rules: list) -> list:
+    """
+    Selectors for substitution_rules.Rule objects.
+
+    Token-level method and form conditions are applied; other conditions
+    (neighbours, position, confidence, word form) cannot be evaluated on the
+    cube and mark the selector as an upper bound.
+    """
+    selectors = []
+    for rule in rules:
+        restrictions = {'method': [None, set()], 'form': [None, set()]}
+        upper_bound = False
+        for offset, field, op, values in rule.conditions:
+            if offset or field not in restrictions:
+                upper_bound = True
+            elif op == '=':
+                allowed = restrictions[field][0]
+                restrictions[field][0] = set(values) if allowed is None else allowed & set(values)
+            else:
+                restrictions[field][1] |= set(values)
+        selectors.append(Selector(rule.rule_id, rule.lemma, rule.current_pos,
+                                  restrictions['method'][0], restrictions['method'][1],
+                                  restrictions['form'][0], restrictions['form'][1], upper_bound))
+    return selectors
+
+
+def print_estimate(result: dict, total_tokens: int, elapsed_ms: float):
+    bound = 'at most ' if result['upper_bound'] else ''
+    print(f"\nEstimate for {result['rules']:,} rules ({result['cells']:,} cube cells, {elapsed_ms:.1f} ms):")
+    print(f"   Tokens changed: {bound}{result['tokens']:,} "
+          f"({result['tokens'] / total_tokens * 100 if total_tokens else 0:.2f}% of {total_tokens:,})")
+    print(f"   Poems changed: {bound}{result['poems']:,}")
+    if 'by_rule' in result:
+        print("\n   Per rule (top 20 by tokens):")
+        for r in sorted(result['by_rule'], key=lambda r: -r['tokens'])[:20]:
+            flag = ' (upper bound)' if r['upper_bound'] else ''
+            print(f"     {r['rule']}: {r['tokens']:,} tokens in {r['poems']:,} poems{flag}")
+    if 'top_poems' in result:
+        print("\n   Most affected poems:")
+        for poem_id, count in result['top_poems']:
+            print(f"     {poem_id}: {count:,} tokens")
+
+
+def run_build(args):
+    from rebuild_corpus_aggregates import load_json
+
+    print(f"Loading poems index from {args.poems_index}...")
+    index = load_json(args.poems_index)
+    print(f"Building cube from {len(index['poems']):,} poems...")
+    cube = SubstitutionCube.build(index)
+    cube.save(args.output)
+    print(f"✓ {len(cube.cells['tokens']):,} cells over {cube.total_tokens:,} tokens "
+          f"({len(cube.vocab['lemma']):,} lemmas, {len(cube.vocab['pos'])} POS, "
+          f"{len(cube.vocab['method'])} methods, {len(cube.vocab['form'])} forms)")
+    print(f"Saved: {args.output} ({args.output.stat().st_size / 1024:,.0f} KB)")
+    return 0
+
+
+def run_estimate(args):
+    from substitution_rules import RuleError, load_rules
+
+    if not args.substitutions and not args.rules:
+        print("Error: give --substitutions and/or --rules", file=sys.stderr)
+        return 1
+    selectors = []
+    if args.substitutions:
+        selectors.extend(load_substitution_selectors(args.substitutions))
+    try:
+        for path in args.rules:
+            selectors.extend(rule_selectors(load_rules(path)))
+    except RuleError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    cube = SubstitutionCube.load(args.cube)
+    started = time.perf_counter()
+    result = cube.estimate(selectors, per_rule=args.per_rule, top_poems=args.top_poems)
+    print_estimate(result, cube.total_tokens, (time.perf_counter() - started) * 1000)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Substitution impact estimates from a token count cube')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build the cube from a poems index')
+    build.add_argument('--poems-index', type=Path, default=Path('poems_index_v2.json.gz'),
+                       help='Input poems index (v2/v3/v4)')
+    build.add_argument('--output', type=Path, default=Path('substitution_cube.npz'),
+                       help='Output cube file (default: substitution_cube.npz)')
+
+    estimate = subparsers.add_parser('estimate', help='Estimate the impact of a rule set')
+    estimate.add_argument('--cube', type=Path, default=Path('substitution_cube.npz'),
+                          help='Cube built with the build command')
+    estimate.add_argument('--substitutions', type=Path, default=None,
+                          help='final_substitutions.csv-style rules')
+    estimate.add_argument('--rules', type=Path, action='append', default=[],
+                          help='Context rules CSV (repeatable)')
+    estimate.add_argument('--per-rule', action='store_true',
+                          help='Also report tokens and poems per rule')
+    estimate.add_argument('--top-poems', type=int, default=0,
+                          help='List the N most affected poems')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        return run_build(args)
+    return run_estimate(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+Context-sensitive POS substitution rules compiled into dispatch tables.
+
+final_substitutions.csv maps (lemma, current_pos) -> correct_pos for
+manual_override tokens only. Context rules add conditions on the token
+itself, its neighbours within the verse and its verse position:
+
+    rule_id,lemma,current_pos,correct_pos,conditions,priority,notes
+    taga_adv,taga,K,D,prev.form!=sg_g|pl_g,0,"no genitive before: adverb"
+
+conditions is a ';'-separated list of field<op>value tests:
+
+    form=sg_g|pl_g           token field equals one of the values
+    method!=manual_override  token field equals none of the values
+    confidence<0.8           numeric comparison (<, <=, >, >=, =, !=)
+    prev.pos=S               field of the previous token in the verse
+    next2.form=sg_p          two tokens ahead (prev, prev2, next, next2)
+    prev=none                no previous token in the verse
+    position=first|only      verse position: first, middle, last, only
+
+Fields are original, lemma, pos, form, method and confidence; original and
+lemma compare lowercased. An empty current_pos matches any POS.
+
+compile_rules() groups rules by lemma (and POS) into dispatch tables and
+detects conflicts: two rules for the same lemma and POS with different
+targets whose conditions can both hold. Conflicts with different
+priorities are resolved by priority (higher first); equal priorities are
+reported as conflicts. RuleSet.apply_poem() evaluates every token against
+the original annotations of its neighbours, applies the first matching
+rule and counts hits per rule.
+"""
+
+import csv
+import re
+from collections import Counter, defaultdict
+
+from poem_index_v4 import PoemView
+
+
+TOKEN_FIELDS = ('original', 'lemma', 'pos', 'form', 'method', 'confidence')
+LOWERCASE_FIELDS = ('original', 'lemma')
+NUMERIC_FIELDS = ('confidence',)
+NEIGHBOURS = {'prev2': -2, 'prev': -1, 'next': 1, 'next2': 2}
+POSITIONS = ('first', 'middle', 'last', 'only')
+
+CONDITION_PATTERN = re.compile(r'^\s*([\w.]+)\s*(<=|>=|!=|=|<|>)\s*(.*?)\s*$')
+
+
+class RuleError(ValueError):
+    """Invalid rule definition."""
+
+
+class Rule:
+    """One substitution rule with parsed conditions."""
+
+    __slots__ = ('rule_id', 'lemma', 'current_pos', 'correct_pos', 'conditions',
+                 'condition_text', 'priority', 'order', 'checks', 'constraints')
+
+    def __init__(self, rule_id, lemma, current_pos, correct_pos, condition_text='',
+                 priority=0, order=0):
+        self.rule_id = rule_id
+        self.lemma = lemma.lower()
+        self.current_pos = current_pos
+        self.correct_pos = correct_pos
+        self.condition_text = condition_text
+        self.priority = priority
+        self.order = order
+        if not self.lemma or not correct_pos:
+            raise RuleError(f"rule {rule_id}: lemma and correct_pos are required")
+        if current_pos == correct_pos:
+            raise RuleError(f"rule {rule_id}: current_pos and correct_pos are both '{correct_pos}'")
+        self.conditions = [parse_condition(c, rule_id) for c in condition_text.split(';') if c.strip()]
+        self.checks = [compile_check(c) for c in self.conditions]
+        self.constraints = condition_constraints(self.conditions)
+
+    def describe(self) -> str:
+        return (f"{self.rule_id}: {self.lemma} {self.current_pos or '*'}→{self.correct_pos}"
+                + (f" [{self.condition_text}]" if self.condition_text else ''))
+
+
+def parse_condition(text: str, rule_id: str = '') -> tuple:
+    """Parse 'prev.pos=S|A' into (offset, field, op, values)."""
+    match = CONDITION_PATTERN.match(text)
+    if not match:
+        raise RuleError(f"rule {rule_id}: cannot parse condition '{text}'")
+    target, op, value = match.groups()
+
+    if target in NEIGHBOURS:
+        if value.lower() != 'none' or op not in ('=', '!='):
+            raise RuleError(f"rule {rule_id}: '{text}' - use {target}=none or {target}!=none")
+        return (NEIGHBOURS[target], 'exists', op, (op == '!=',))
+
+    offset = 0
+    field = target
+    if '.' in target:
+        neighbour, field = target.split('.', 1)
+        if neighbour not in NEIGHBOURS:
+            raise RuleError(f"rule {rule_id}: unknown neighbour '{neighbour}' "
+                            f"(use {', '.join(NEIGHBOURS)})")
+        offset = NEIGHBOURS[neighbour]
+
+    if field == 'position':
+        if offset:
+            raise RuleError(f"rule {rule_id}: position applies to the token itself")
+        values = tuple(v.strip() for v in value.split('|'))
+        unknown = [v for v in values if v not in POSITIONS]
+        if unknown or op not in ('=', '!='):
+            raise RuleError(f"rule {rule_id}: position takes = or != with {', '.join(POSITIONS)}")
+        return (0, field, op, values)
+
+    if field not in TOKEN_FIELDS:
+        raise RuleError(f"rule {rule_id}: unknown field '{field}' (use {', '.join(TOKEN_FIELDS)})")
+    if field in NUMERIC_FIELDS:
+        try:
+            return (offset, field, op, (float(value),))
+        except ValueError:
+            raise RuleError(f"rule {rule_id}: '{field}' needs a number, got '{value}'")
+    if op not in ('=', '!='):
+        raise RuleError(f"rule {rule_id}: '{field}' only supports = and !=")
+    values = tuple(v.strip() for v in value.split('|'))
+    if field in LOWERCASE_FIELDS:
+        values = tuple(v.lower() for v in values)
+    return (offset, field, op, values)
+
+
+def compile_check(condition: tuple) -> tuple:
+    """Turn a parsed condition into an (offset, field, kind, argument) check."""
+    offset, field, op, values = condition
+    if field == 'exists':
+        return (offset, field, 'present' if values[0] else 'absent', None)
+    if field in NUMERIC_FIELDS:
+        return (offset, field, op, values[0])
+    return (offset, field, 'in' if op == '=' else 'not_in', frozenset(values))
+
+
+def condition_constraints(conditions: list) -> dict:
+    """
+    Summarise conditions per (offset, field) for conflict detection.
+
+    String fields become {'in': set or None, 'out': set}; numeric fields an
+    interval [low, low_inclusive, high, high_inclusive]; 'exists' a bool.
+    """
+    constraints = {}
+    for offset, field, op, values in conditions:
+        key = (offset, field)
+        if field == 'exists':
+            constraints[key] = values[0]
+        elif field in NUMERIC_FIELDS:
+            low, low_inc, high, high_inc = constraints.get(key, [float('-inf'), True, float('inf'), True])
+            value = values[0]
+            if op in ('>', '>=', '=') and (value > low or (value == low and op == '>')):
+                low, low_inc = value, op != '>'
+            if op in ('<', '<=', '=') and (value < high or (value == high and op == '<')):
+                high, high_inc = value, op != '<'
+            constraints[key] = [low, low_inc, high, high_inc]
+        else:
+            constraint = constraints.setdefault(key, {'in': None, 'out': set()})
+            if op == '=':
+                constraint['in'] = set(values) if constraint['in'] is None else constraint['in'] & set(values)
+            else:
+                constraint['out'] |= set(values)
+        if offset and field != 'exists' and op != '!=':
+            # A test on a neighbour's field implies the neighbour exists
+            constraints.setdefault((offset, 'exists'), True)
+    return constraints
+
+
+def constraints_disjoint(a: dict, b: dict) -> bool:
+    """True if no token can satisfy both constraint sets."""
+    for key in a.keys() & b.keys():
+        ca, cb = a[key], b[key]
+        if key[1] == 'exists':
+            if ca != cb:
+                return True
+        elif key[1] in NUMERIC_FIELDS:
+            low, low_inc = max((ca[0], ca[1]), (cb[0], cb[1]), key=lambda x: (x[0], not x[1]))
+            high, high_inc = min((ca[2], ca[3]), (cb[2], cb[3]), key=lambda x: (x[0], x[1]))
+            if low > high or (low == high and not (low_inc and high_inc)):
+                return True
+        else:
+            if ca['in'] is not None and cb['in'] is not None and not (ca['in'] & cb['in']):
+                return True
+            if ca['in'] is not None and ca['in'] <= cb['out']:
+                return True
+            if cb['in'] is not None and cb['in'] <= ca['out']:
+                return True
+    return False
+
+
+def load_rules(path) -> list:
+    """Load context rules from a CSV (rule_id, lemma, current_pos, correct_pos, conditions, priority)."""
+    rules = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, row in enumerate(csv.DictReader(f), 2):
+            rule_id = (row.get('rule_id') or '').strip() or f"{path}:{line_no}"
+            try:
+                priority = int(row.get('priority') or 0)
+            except ValueError:
+                raise RuleError(f"rule {rule_id}: priority must be an integer")
+            rules.append(Rule(rule_id, row['lemma'].strip(), (row.get('current_pos') or '').strip(),
+                              row['correct_pos'].strip(), row.get('conditions') or '', priority,
+                              len(rules)))
+    return rules
+
+
+def rules_from_substitutions(path, start: int = 0) -> list:
+    """Express final_substitutions.csv 'apply' rows as method=manual_override rules."""
+    rules = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row.get('category') != 'apply' or row['current_pos'] == row['correct_pos']:
+                continue
+            rules.append(Rule(f"sub:{row['lemma']}|{row['current_pos']}", row['lemma'],
+                              row['current_pos'], row['correct_pos'], 'method=manual_override',
+                              -1, start + len(rules)))
+    return rules
+
+
+def find_conflicts(rules: list) -> tuple:
+    """
+    Find overlapping rules for the same lemma with different targets.
+
+    Returns (conflicts, overlaps): conflicts have equal priority and cannot
+    be ordered; overlaps are resolved by priority. Both are lists of
+    (rule_a, rule_b) pairs. Exact duplicates are reported as conflicts too.
+    """
+    conflicts, overlaps = [], []
+    by_lemma = defaultdict(list)
+    for rule in rules:
+        by_lemma[rule.lemma].append(rule)
+
+    for lemma_rules in by_lemma.values():
+        for i, a in enumerate(lemma_rules):
+            for b in lemma_rules[i + 1:]:
+                if a.current_pos and b.current_pos and a.current_pos != b.current_pos:
+                    continue
+                if constraints_disjoint(a.constraints, b.constraints):
+                    continue
+                same = a.correct_pos == b.correct_pos
+                if same and a.condition_text.strip() != b.condition_text.strip():
+                    continue  # Overlapping rules that agree
+                if a.priority == b.priority:
+                    conflicts.append((a, b))
+                else:
+                    overlaps.append((a, b))
+    return conflicts, overlaps
+
+
+class RuleSet:
+    """Rules compiled into per-lemma, per-POS dispatch tables."""
+
+    def __init__(self, rules: list):
+        self.rules = rules
+        self.hits = Counter()
+        self.tested = Counter()
+
+        ordered = sorted(rules, key=lambda r: (-r.priority, r.order))
+        by_lemma = defaultdict(lambda: defaultdict(list))
+        for rule in ordered:
+            by_lemma[rule.lemma][rule.current_pos].append(rule)
+
+        # lemma -> {pos: rules for that POS and wildcard rules, in priority order}
+        self.dispatch = {}
+        for lemma, by_pos in by_lemma.items():
+            wildcard = by_pos.get('', [])
+            table = {'': list(wildcard)}
+            for pos, pos_rules in by_pos.items():
+                if pos:
+                    table[pos] = sorted(pos_rules + wildcard, key=lambda r: (-r.priority, r.order))
+            self.dispatch[lemma] = table
+
+    def rules_for(self, word: dict) -> list:
+        table = self.dispatch.get((word.get('lemma') or '').lower())
+        if table is None:
+            return None
+        return table.get(word.get('pos', ''), table[''])
+
+    @staticmethod
+    def _value(word: dict, field: str):
+        value = word.get(field)
+        if field in LOWERCASE_FIELDS:
+            return (value or '').lower()
+        if field in NUMERIC_FIELDS:
+            return value if value is not None else 0.0
+        return value or ''
+
+    def _matches(self, rule: Rule, verse: list, i: int) -> bool:
+        n = len(verse)
+        for offset, field, kind, arg in rule.checks:
+            if field == 'position':
+                position = ('only' if n == 1 else 'first' if i == 0
+                            else 'last' if i == n - 1 else 'middle')
+                if (position in arg) != (kind == 'in'):
+                    return False
+                continue
+
+            j = i + offset
+            word = verse[j] if 0 <= j < n else None
+            if field == 'exists':
+                if (word is not None) != (kind == 'present'):
+                    return False
+                continue
+            if word is None:
+                if kind == 'not_in' or kind == '!=':
+                    continue
+                return False
+
+            value = self._value(word, field)
+            if kind == 'in':
+                ok = value in arg
+            elif kind == 'not_in':
+                ok = value not in arg
+            elif kind == '<':
+                ok = value < arg
+            elif kind == '<=':
+                ok = value <= arg
+            elif kind == '>':
+                ok = value > arg
+            elif kind == '>=':
+                ok = value >= arg
+            elif kind == '=':
+                ok = value == arg
+            else:
+                ok = value != arg
+            if not ok:
+                return False
+        return True
+
+    def apply_poem(self, poem: dict) -> list:
+        """
+        Apply rules to one poem in place.
+
+        Conditions see the annotations as they were before this poem was
+        changed. Returns a list of (word, old_pos, rule) for changed tokens.
+        """
+        view = PoemView(poem)
+        if not any(self.rules_for(w) for w in view.tokens):
+            return []
+
+        # Tokens grouped by verse; unaligned words (verse -1) form one sequence
+        verses = defaultdict(list)
+        for word, verse_idx, _ in view.iter_words():
+            verses[verse_idx].append(word)
+
+        pending = []
+        for verse in verses.values():
+            for i, word in enumerate(verse):
+                candidates = self.rules_for(word)
+                if not candidates:
+                    continue
+                for rule in candidates:
+                    if rule.correct_pos == word.get('pos'):
+                        continue  # Wildcard rule, token already has the target POS
+                    self.tested[rule.rule_id] += 1
+                    if self._matches(rule, verse, i):
+                        self.hits[rule.rule_id] += 1
+                        pending.append((word, rule))
+                        break
+
+        changes = []
+        for word, rule in pending:
+            changes.append((word, word.get('pos', ''), rule))
+            word['pos'] = rule.correct_pos
+        return changes
+
+
+def compile_rules(rules: list) -> tuple:
+    """Compile rules; returns (RuleSet, conflicts, overlaps)."""
+    conflicts, overlaps = find_conflicts(rules)
+    return RuleSet(rules), conflicts, overlaps
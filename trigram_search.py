@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+Trigram index for regex and wildcard search over word forms and verses.
+
+Running `re` over all 451k word forms or all 2M verse strings takes
+seconds to minutes per pattern. This module indexes every lower-cased
+document (a distinct word form, or one verse line of the poem index),
+padded with start/end markers, by its character trigrams:
+
+- each trigram is packed into an integer key over a compact alphabet of
+  the corpus characters (rare characters share one code);
+- each key's posting list of document ids is delta + varint encoded
+  (posting_lists.py).
+
+A query regex is parsed with Python's own regex parser and decomposed
+into an AND/OR query of trigrams that every match must contain (literal
+runs, small character classes and alternations are expanded; `^` and `$`
+become the start/end markers). The query prunes the candidate documents,
+and only the candidates are matched with the real regex, so the answer is
+exactly that of `re.search` over all documents. Patterns with no usable
+trigram (e.g. `.*`) fall back to a full scan.
+
+Usage:
+    python trigram_search.py build --poems-index poems_index_v3.json.gz \
+        --output trigram_index.npz
+
+    # Word forms: regex (re.search) or shell-style wildcard (whole form)
+    python trigram_search.py search --index trigram_index.npz --pattern '^k?ull.*'
+    python trigram_search.py search --index trigram_index.npz --glob 'k*ldse?'
+
+    # Verses
+    python trigram_search.py search --index trigram_index.npz --verses \
+        --pattern 'kuldne (kuu|päike)' --limit 20
+
+In Python:
+    index = TrigramIndex.load('trigram_index.npz')
+    index.search('words', r'^kull(a|e)')      # matching document ids
+"""
+
+import argparse
+import fnmatch
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from corpus_io import pack_strings, unpack_strings
+from poem_index_io import load_poems_index
+from poem_index_v4 import iter_poems
+from posting_lists import MAX_VARINT_BYTES, decode_postings, encode_varints
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+
+NAMESPACES = ('words', 'verses')
+
+# Document start/end markers, so ^ and $ become trigram characters
+BOS = '\x02'
+EOS = '\x03'
+
+# Characters get 10-bit codes; the last code is shared by all rarer characters
+ALPHABET_BITS = 10
+OTHER_CODE = (1 << ALPHABET_BITS) - 1
+
+# Limits that keep the regex analysis small
+MAX_EXACT = 16        # exact-string sets larger than this are summarised by prefix/suffix
+MAX_CLASS = 8         # character classes larger than this match "any character"
+MAX_AFFIXES = 32      # prefix/suffix sets larger than this are dropped
+
+# Stop intersecting once the candidates are this many times smaller than the next list
+INTERSECT_RATIO = 64
+
+BUILD_CHUNK = 200_000
+
+# Query nodes: ALL (no constraint), ('tri', key), ('and', [...]), ('or', [...])
+ALL = ('all',)
+
+
+def _and(a, b):
+    if a == ALL:
+        return b
+    if b == ALL:
+        return a
+    return ('and', (a[1] if a[0] == 'and' else [a]) + (b[1] if b[0] == 'and' else [b]))
+
+
+def _or(a, b):
+    if a == ALL or b == ALL:
+        return ALL
+    return ('or', (a[1] if a[0] == 'or' else [a]) + (b[1] if b[0] == 'or' else [b]))
+
+
+class _Info:
+    """What the analysis knows about the strings a sub-regex can match."""
+
+    __slots__ = ('exact', 'prefix', 'suffix', 'match')
+
+    def __init__(self, exact=None, prefix=frozenset({''}), suffix=frozenset({''}), match=ALL):
+        self.exact = exact          # set of all possible matched strings, or None
+        self.prefix = prefix        # possible first <= 2 characters (when exact is None)
+        self.suffix = suffix        # possible last <= 2 characters (when exact is None)
+        self.match = match          # trigram query every match satisfies
+
+
+class PatternAnalyzer:
+    """Decompose a regex into a trigram query (Russ Cox's trigram analysis, simplified)."""
+
+    def __init__(self, key_of):
+        self.key_of = key_of
+
+    def query(self, pattern: str, flags: int = 0):
+        info = self._sequence(sre_parse.parse(pattern, flags))
+        return self._finish(info)
+
+    def _finish(self, info: _Info):
+        if info.exact is None:
+            return info.match
+        return _and(info.match, self._trigrams(info.exact))
+
+    def _trigrams(self, strings) -> tuple:
+        """OR over strings of the AND of each string's trigrams."""
+        query = None
+        for s in strings:
+            if len(s) < 3:
+                return ALL
+            keys = sorted({self.key_of(s[i:i + 3]) for i in range(len(s) - 2)})
+            node = ('and', [('tri', k) for k in keys]) if len(keys) > 1 else ('tri', keys[0])
+            query = node if query is None else _or(query, node)
+        return query if query is not None else ALL
+
+    def _inexact(self, info: _Info) -> _Info:
+        if info.exact is None:
+            return info
+        return _Info(prefix=_cap({s[:2] for s in info.exact}),
+                     suffix=_cap({s[-2:] for s in info.exact}),
+                     match=self._finish(info))
+
+    def _concat(self, x: _Info, y: _Info) -> _Info:
+        match = _and(x.match, y.match)
+        if x.exact is not None and y.exact is not None and len(x.exact) * len(y.exact) <= MAX_EXACT:
+            return _Info(exact={a + b for a in x.exact for b in y.exact}, match=match)
+
+        left = x.exact if x.exact is not None else x.suffix
+        right = y.exact if y.exact is not None else y.prefix
+        if len(left) * len(right) <= MAX_EXACT:
+            # Trigrams spanning the boundary, from the last two and first two characters
+            match = _and(match, self._trigrams({a[-2:] + b[:2] for a in left for b in right}))
+        if x.exact is not None:
+            prefix = _cap({(a + b)[:2] for a in x.exact for b in y.prefix})
+        else:
+            prefix = x.prefix
+        if y.exact is not None:
+            suffix = _cap({(a + b)[-2:] for a in x.suffix for b in y.exact})
+        else:
+            suffix = y.suffix
+        x, y = self._inexact(x), self._inexact(y)
+        return _Info(prefix=prefix, suffix=suffix, match=_and(match, _and(x.match, y.match)))
+
+    def _alternate(self, x: _Info, y: _Info) -> _Info:
+        if x.exact is not None and y.exact is not None and len(x.exact | y.exact) <= MAX_EXACT:
+            return _Info(exact=x.exact | y.exact, match=_or(x.match, y.match))
+        x, y = self._inexact(x), self._inexact(y)
+        return _Info(prefix=_cap(x.prefix | y.prefix), suffix=_cap(x.suffix | y.suffix),
+                     match=_or(x.match, y.match))
+
+    def _sequence(self, items) -> _Info:
+        info = _Info(exact={''})
+        for op, av in items:
+            info = self._concat(info, self._item(op, av))
+        return info
+
+    def _item(self, op, av) -> _Info:
+        if op is sre_constants.LITERAL:
+            return _Info(exact={chr(av).lower()})
+        if op is sre_constants.IN:
+            chars = _class_chars(av)
+            return _Info(exact=chars) if chars is not None else _Info()
+        if op is sre_constants.SUBPATTERN:
+            return self._sequence(av[-1])
+        if op is getattr(sre_constants, 'ATOMIC_GROUP', None):
+            return self._sequence(av)
+        if op is sre_constants.BRANCH:
+            infos = [self._sequence(branch) for branch in av[1]]
+            info = infos[0]
+            for other in infos[1:]:
+                info = self._alternate(info, other)
+            return info
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT,
+                  getattr(sre_constants, 'POSSESSIVE_REPEAT', None)):
+            low, high, sub = av
+            if high == 0:
+                return _Info(exact={''})
+            x = self._sequence(sub)
+            if low == 0:
+                if high == 1:
+                    return self._alternate(x, _Info(exact={''}))
+                return _Info()
+            if high == 1:
+                return x
+            # One or more: matches start and end with a match of x
+            x = self._inexact(x)
+            return _Info(prefix=x.prefix, suffix=x.suffix, match=x.match)
+        if op is sre_constants.AT:
+            if av in (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING):
+                return _Info(exact={BOS})
+            if av in (sre_constants.AT_END, sre_constants.AT_END_STRING):
+                return _Info(exact={EOS})
+            return _Info(exact={''})
+        # Any single character (., \\w, negated literal) or something unanalysed
+        # (lookarounds, back references): no constraint
+        return _Info()
+
+
+def _cap(strings: set) -> frozenset:
+    return frozenset(strings) if len(strings) <= MAX_AFFIXES else frozenset({''})
+
+
+def _class_chars(items):
+    """Characters of a small positive character class, else None."""
+    chars = set()
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            chars.add(chr(av).lower())
+        elif op is sre_constants.RANGE and av[1] - av[0] < MAX_CLASS:
+            chars.update(chr(c).lower() for c in range(av[0], av[1] + 1))
+        else:
+            return None
+        if len(chars) > MAX_CLASS:
+            return None
+    return chars or None
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Shell-style wildcard (matched against the whole document) as a regex."""
+    return '^' + fnmatch.translate(pattern)
+
+
+class TrigramIndex:
+    """Trigram posting lists and documents for the 'words' and 'verses' namespaces."""
+
+    def __init__(self, alphabet: str, namespaces: dict, poem_ids: list):
+        self.alphabet = alphabet
+        self.namespaces = namespaces
+        self.poem_ids = poem_ids
+        self._codes = {ch: i for i, ch in enumerate(alphabet)}
+
+    def key_of(self, trigram: str) -> int:
+        codes = self._codes
+        a, b, c = (codes.get(ch, OTHER_CODE) for ch in trigram)
+        return (a << (2 * ALPHABET_BITS)) | (b << ALPHABET_BITS) | c
+
+    @classmethod
+    def build(cls, index: dict) -> 'TrigramIndex':
+        """Build from a loaded poems index (v1-v4)."""
+        word_counts = Counter()
+        verses, verse_poem, verse_number = [], [], []
+        poem_ids = []
+        for ordinal, (poem_id, view) in enumerate(iter_poems(index)):
+            poem_ids.append(poem_id)
+            for word, _, _ in view.iter_words():
+                word_counts[word.get('original', '')] += 1
+            for number, verse in enumerate(view.verse_lines):
+                verses.append(verse.replace('\n', ' '))
+                verse_poem.append(ordinal)
+                verse_number.append(number)
+        words = sorted(word_counts)
+
+        char_counts = Counter()
+        for doc in words:
+            char_counts.update(doc.lower())
+        for doc in verses:
+            char_counts.update(doc.lower())
+        alphabet = BOS + EOS + ''.join(ch for ch, _ in char_counts.most_common(OTHER_CODE - 2))
+        trigram_index = cls(alphabet, {}, poem_ids)
+
+        trigram_index.namespaces['words'] = {
+            'docs': words,
+            'counts': np.array([word_counts[w] for w in words], dtype=np.int64),
+            **trigram_index._encode_postings(words)
+        }
+        trigram_index.namespaces['verses'] = {
+            'docs': verses,
+            'poem': np.asarray(verse_poem, dtype=np.int32),
+            'verse_index': np.asarray(verse_number, dtype=np.int32),
+            **trigram_index._encode_postings(verses)
+        }
+        return trigram_index
+
+    def _encode_postings(self, docs: list) -> dict:
+        """Sorted trigram keys with delta + varint posting lists of document ids."""
+        lookup = np.full(max(map(ord, self.alphabet)) + 1, OTHER_CODE, dtype=np.uint64)
+        for code, ch in enumerate(self.alphabet):
+            lookup[ord(ch)] = code
+
+        chunks = []
+        for start in range(0, len(docs), BUILD_CHUNK):
+            padded = [BOS + doc.lower() + EOS for doc in docs[start:start + BUILD_CHUNK]]
+            points = np.frombuffer(''.join(padded).encode('utf-32-le'), dtype=np.uint32)
+            codes = np.where(points < lookup.size, lookup[np.minimum(points, lookup.size - 1)],
+                             np.uint64(OTHER_CODE))
+            doc_of = np.repeat(np.arange(start, start + len(padded), dtype=np.uint64),
+                               [len(p) for p in padded])
+            same_doc = doc_of[:-2] == doc_of[2:]
+            keys = ((codes[:-2] << np.uint64(2 * ALPHABET_BITS))
+                    | (codes[1:-1] << np.uint64(ALPHABET_BITS)) | codes[2:])
+            # (key, doc) pairs as one integer: unique() sorts by key, then doc, and deduplicates
+            chunks.append(np.unique((keys[same_doc] << np.uint64(32)) | doc_of[:-2][same_doc]))
+
+        pairs = np.unique(np.concatenate(chunks)) if chunks else np.zeros(0, dtype=np.uint64)
+        keys = (pairs >> np.uint64(32)).astype(np.uint32)
+        doc_ids = (pairs & np.uint64(0xFFFFFFFF)).astype(np.int64)
+        unique_keys, starts = np.unique(keys, return_index=True)
+
+        deltas = np.diff(doc_ids, prepend=0)
+        deltas[starts] = doc_ids[starts]
+        nbytes = np.ones(deltas.size, dtype=np.int64)
+        for k in range(1, MAX_VARINT_BYTES):
+            nbytes += deltas >= (1 << (7 * k))
+        byte_offsets = np.concatenate([[0], np.cumsum(nbytes)])
+        return {
+            'keys': unique_keys,
+            'offsets': byte_offsets[np.append(starts, deltas.size)],
+            'postings': encode_varints(deltas)
+        }
+
+    def save(self, path: Path):
+        """Save to a NumPy .npz archive."""
+        arrays = {
+            'alphabet': pack_strings(list(self.alphabet)),
+            'poem_ids': pack_strings(self.poem_ids)
+        }
+        for name, ns in self.namespaces.items():
+            for field, value in ns.items():
+                arrays[f'{name}_{field}'] = pack_strings(value) if field == 'docs' else value
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> 'TrigramIndex':
+        """Load an index saved with save()."""
+        with np.load(path) as archive:
+            alphabet = ''.join(unpack_strings(archive['alphabet']))
+            namespaces = {name: {} for name in NAMESPACES}
+            for key in archive.files:
+                name, _, field = key.partition('_')
+                if name in namespaces:
+                    value = archive[key]
+                    namespaces[name][field] = unpack_strings(value) if field == 'docs' else value
+            poem_ids = unpack_strings(archive['poem_ids'])
+        return cls(alphabet, namespaces, poem_ids)
+
+    def _postings(self, namespace: str, key: int) -> np.ndarray:
+        ns = self.namespaces[namespace]
+        i = np.searchsorted(ns['keys'], key)
+        if i == ns['keys'].size or ns['keys'][i] != key:
+            return np.zeros(0, dtype=np.uint32)
+        return decode_postings(ns['postings'][ns['offsets'][i]:ns['offsets'][i + 1]])
+
+    def _list_size(self, namespace: str, key: int) -> int:
+        ns = self.namespaces[namespace]
+        i = np.searchsorted(ns['keys'], key)
+        if i == ns['keys'].size or ns['keys'][i] != key:
+            return 0
+        return int(ns['offsets'][i + 1] - ns['offsets'][i])
+
+    def evaluate(self, namespace: str, query):
+        """Candidate document ids for a trigram query (None = all documents)."""
+        kind = query[0]
+        if kind == 'all':
+            return None
+        if kind == 'tri':
+            return self._postings(namespace, query[1])
+        if kind == 'or':
+            parts = [self.evaluate(namespace, q) for q in query[1]]
+            if any(p is None for p in parts):
+                return None
+            return np.unique(np.concatenate(parts))
+
+        # AND: subqueries first, then trigram lists from the shortest up
+        result = None
+        for sub in query[1]:
+            if sub[0] != 'tri':
+                part = self.evaluate(namespace, sub)
+                if part is not None:
+                    result = part if result is None else np.intersect1d(result, part, assume_unique=True)
+        trigrams = sorted((self._list_size(namespace, q[1]), q[1]) for q in query[1] if q[0] == 'tri')
+        for size, key in trigrams:
+            if result is not None and result.size * INTERSECT_RATIO < size:
+                break  # verifying the few candidates is cheaper than decoding this list
+            part = self._postings(namespace, key)
+            result = part if result is None else np.intersect1d(result, part, assume_unique=True)
+        return result
+
+    def query(self, pattern: str, flags: int = 0):
+        return PatternAnalyzer(self.key_of).query(pattern, flags)
+
+    def search(self, namespace: str, pattern: str, flags: int = 0, stats: dict = None) -> np.ndarray:
+        """Ids of the documents where re.search(pattern) matches."""
+        regex = re.compile(pattern, flags)
+        candidates = self.evaluate(namespace, self.query(pattern, flags))
+        docs = self.namespaces[namespace]['docs']
+        if candidates is None:
+            candidates = range(len(docs))
+        matches = np.fromiter((i for i in candidates if regex.search(docs[i])), dtype=np.int64)
+        if stats is not None:
+            stats['candidates'] = len(candidates)
+            stats['documents'] = len(docs)
+        return matches
+
+
+def run_build(args):
+    index = load_poems_index(args.poems_index)
+
+    print("\nBuilding trigram index...")
+    start = time.perf_counter()
+    trigram_index = TrigramIndex.build(index)
+    for name, ns in trigram_index.namespaces.items():
+        print(f"  {name}: {len(ns['docs']):,} documents, {ns['keys'].size:,} trigrams, "
+              f"{ns['postings'].nbytes / (1024 * 1024):.1f} MB postings")
+    print(f"  Built in {time.perf_counter() - start:.1f}s")
+
+    trigram_index.save(args.output)
+    print(f"✓ Saved {args.output} ({args.output.stat().st_size / (1024 * 1024):.2f} MB)")
+    return 0
+
+
+def run_search(args):
+    start = time.perf_counter()
+    trigram_index = TrigramIndex.load(args.index)
+    print(f"Loaded {args.index} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    namespace = 'verses' if args.verses else 'words'
+    ns = trigram_index.namespaces[namespace]
+    flags = re.IGNORECASE if args.ignore_case else 0
+    patterns = [(p, p) for p in args.pattern] + [(g, glob_to_regex(g)) for g in args.glob]
+    if not patterns:
+        print("Error: give --pattern or --glob")
+        return 1
+
+    for label, pattern in patterns:
+        stats = {}
+        start = time.perf_counter()
+        try:
+            matches = trigram_index.search(namespace, pattern, flags, stats)
+        except re.error as e:
+            print(f"\n⚠ Invalid pattern {label!r}: {e}")
+            continue
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"\n🔎 {label!r}: {matches.size:,} {namespace} "
+              f"({stats['candidates']:,} of {stats['documents']:,} candidates, {elapsed:.1f} ms)")
+
+        if namespace == 'words':
+            matches = matches[np.argsort(-ns['counts'][matches], kind='stable')]
+            for i in matches[:args.limit]:
+                print(f"    {ns['docs'][i]:30s} {int(ns['counts'][i]):>10,}")
+        else:
+            for i in matches[:args.limit]:
+                poem_id = trigram_index.poem_ids[ns['poem'][i]]
+                print(f"    {poem_id:>8s}:{int(ns['verse_index'][i]):<3d} {ns['docs'][i]}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Trigram index for regex and wildcard search over word forms and verses'
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Index word forms and verses of a poems index')
+    build.add_argument('--poems-index', type=Path, default=Path('poems_index_v3.json.gz'),
+                       help='Poems index (v1-v4)')
+    build.add_argument('--output', type=Path, default=Path('trigram_index.npz'),
+                       help='Output .npz (default: trigram_index.npz)')
+
+    search = subparsers.add_parser('search', help='Search word forms or verses')
+    search.add_argument('--index', type=Path, default=Path('trigram_index.npz'), help='Trigram index .npz')
+    search.add_argument('--pattern', action='append', default=[],
+                        help='Regular expression (re.search semantics, repeatable)')
+    search.add_argument('--glob', action='append', default=[],
+                        help='Shell-style wildcard matched against the whole form/verse (repeatable)')
+    search.add_argument('--verses', action='store_true', help='Search verse lines instead of word forms')
+    search.add_argument('--ignore-case', action='store_true', help='Case-insensitive matching')
+    search.add_argument('--limit', type=int, default=20, help='Matches to print per pattern')
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        return run_build(args)
+    return run_search(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())